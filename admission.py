@@ -0,0 +1,138 @@
+"""Admission control for outbound webhook traffic: concurrency cap, token bucket and FIFO queue"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import jobs
+
+
+class Rejected(Exception):
+    """Raised when a request is turned away instead of queueing behind an overloaded endpoint"""
+
+
+class Ticket:
+    """A request's place in an endpoint's queue"""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+
+    def position(self):
+        """1-based position in the queue, or 0 once admitted"""
+        return self.limiter.position(self)
+
+
+class EndpointLimiter:
+    """FIFO admission for one webhook endpoint.
+
+    A request is admitted when it reaches the head of the queue, fewer than
+    ``max_concurrent`` requests are in flight and the token bucket (``rate``
+    requests per second, bursts of up to ``burst``) has a token. Requests are
+    rejected up front when ``max_queue`` requests are already waiting, and
+    rejected after ``max_wait`` seconds in the queue, so callers fail fast
+    instead of piling up behind a saturated n8n workflow.
+    """
+
+    def __init__(self, name, max_concurrent=4, rate=None, burst=1, max_queue=50, max_wait=60):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._in_flight = 0
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._stats = {"admitted": 0, "rejected": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+    @contextmanager
+    def slot(self):
+        """Hold one admission slot for the duration of the block"""
+        ticket = self.enqueue()
+        self.acquire(ticket)
+        try:
+            yield ticket
+        finally:
+            self.release()
+
+    def enqueue(self):
+        """Join the back of the queue, or raise Rejected when it is full"""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise Rejected(
+                    f"The {self.name} webhook is at capacity ({len(self._queue)} requests waiting). "
+                    "Please try again in a minute."
+                )
+            ticket = Ticket(self)
+            self._queue.append(ticket)
+        # Let the page show this job's queue position while it waits
+        job = jobs.current_job()
+        if job is not None:
+            job.ticket = ticket
+        return ticket
+
+    def acquire(self, ticket, timeout=None):
+        """Block until the ticket is admitted, or raise Rejected after ``max_wait`` seconds"""
+        deadline = time.monotonic() + (self.max_wait if timeout is None else timeout)
+        with self._cond:
+            while True:
+                wait_for = None
+                if self._queue[0] is ticket and self._in_flight < self.max_concurrent:
+                    self._refill()
+                    if self.rate is None or self._tokens >= 1:
+                        if self.rate is not None:
+                            self._tokens -= 1
+                        self._queue.popleft()
+                        self._in_flight += 1
+                        ticket.admitted_at = time.monotonic()
+                        waited = ticket.admitted_at - ticket.enqueued_at
+                        self._stats["admitted"] += 1
+                        self._stats["wait_seconds_total"] += waited
+                        self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+                        # The next ticket may be admissible too
+                        self._cond.notify_all()
+                        return
+                    wait_for = (1 - self._tokens) / self.rate
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(ticket)
+                    self._stats["rejected"] += 1
+                    self._cond.notify_all()
+                    raise Rejected(
+                        f"Gave up waiting for the {self.name} webhook after {self.max_wait:.0f}s in the queue. "
+                        "Please try again later."
+                    )
+                self._cond.wait(min(remaining, wait_for) if wait_for else remaining)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def position(self, ticket):
+        with self._cond:
+            try:
+                return self._queue.index(ticket) + 1
+            except ValueError:
+                return 0
+
+    def stats(self):
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot["queued"] = len(self._queue)
+            snapshot["in_flight"] = self._in_flight
+        return snapshot
+
+    def _refill(self):
+        if self.rate is None:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
@@ -0,0 +1,362 @@
+"""Headless batch runner: the six-step pipeline for many form configurations in parallel
+
+    python batch.py --output runs/nightly --workers 4
+    python batch.py --config configs.json --format parquet
+    python batch.py --use-case Segmentation --data-sources iqvia_xpo_rx,zip_territory
+
+Without --config, every use case is run against every --data-sources set
+(by default all data sources together). A config file is a JSON list of
+{"data_sources": [...], "use_case": "...", "business_rules": [...]} objects.
+"""
+import argparse
+import logging
+import os
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+import cache
+import codec
+import db
+import jobs
+import metrics
+import normalize
+import notifier
+import pipeline
+import poller
+import results
+import singleflight
+import state
+import transport
+import webhooks
+
+logger = logging.getLogger(__name__)
+
+STEPS = ["step2"] + [spec.name for spec in pipeline.PIPELINE]
+
+# Frames written per view when the output format is parquet
+PARQUET_VIEWS = {
+    "step3": ["table_tags", "column_tags"],
+    "step4": ["missing_attributes"],
+    "step5": ["data_quality_rules"],
+    "step6": ["integration_mappings"],
+}
+
+
+class StepOutcome:
+    """Result of one step of one configuration"""
+
+    def __init__(self, step, ok, latency, response=None, error=None):
+        self.step = step
+        self.ok = ok
+        self.latency = latency
+        self.response = response
+        self.error = error
+
+    def to_dict(self):
+        return {"step": self.step, "ok": self.ok, "latency": self.latency, "error": self.error,
+                "response": self.response}
+
+
+class ConfigRun:
+    """Every step outcome for one form configuration"""
+
+    def __init__(self, config_id, form):
+        self.id = config_id
+        self.form = form
+        self.steps = {}
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def ok(self):
+        return len(self.steps) == len(STEPS) and all(outcome.ok for outcome in self.steps.values())
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "form": self.form,
+            "ok": self.ok,
+            "seconds": (self.finished_at or time.time()) - self.started_at,
+            "steps": {step: outcome.to_dict() for step, outcome in self.steps.items()},
+        }
+
+
+def config_id(form):
+    """Readable, unique file-name-safe id for a configuration"""
+    slug = re.sub(r"[^a-z0-9]+", "-", form["use_case"].lower()).strip("-")
+    return f"{slug}-{len(form['data_sources'])}src-{cache.payload_hash(form)[:8]}"
+
+
+def load_configs(args):
+    if args.config:
+        with open(args.config, "rb") as f:
+            entries = codec.loads(f.read())
+        return [pipeline.build_form_payload(entry["data_sources"], entry["use_case"],
+                                            entry.get("business_rules", ()))
+                for entry in entries]
+    source_sets = [sources.split(",") for sources in args.data_sources] or [pipeline.DATA_SOURCES]
+    use_cases = args.use_case or pipeline.USE_CASES
+    return [pipeline.build_form_payload(sources, use_case, args.business_rule)
+            for use_case in use_cases for sources in source_sets]
+
+
+class BatchRunner:
+    """Runs configurations on ``workers`` threads against shared pipeline services.
+
+    Steps 3-6 of each configuration go through the same PipelineScheduler and
+    JobRunner the app uses, so they run concurrently and respect each
+    webhook's admission control; step 3 / step 6 results are collected by one
+    shared ResultPoller. When the completed row only marks the end of the job,
+    the output is built from the PARTIAL rows written along the way.
+    """
+
+    def __init__(self, services, workers=4, step_timeout=1800):
+        self.services = services
+        self.workers = workers
+        self.step_timeout = step_timeout
+        self.runner = jobs.JobRunner(
+            max_workers=workers * len(pipeline.PIPELINE),
+            max_pending=workers * len(pipeline.PIPELINE) * 2,
+            result_ttl=step_timeout * 2,
+        )
+        self.scheduler = pipeline.PipelineScheduler(self.runner, services, run_ttl=step_timeout * 4)
+        # (str(unique_id), step) -> when the poller saw the job finish
+        self._finished_at = {}
+        self._lock = threading.Lock()
+        services.poller.add_listener(self._on_result)
+
+    def run(self, forms, on_done=None):
+        """Run every configuration and return their ConfigRuns in input order"""
+        runs = [None] * len(forms)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as executor:
+            futures = {executor.submit(self.run_one, form): index for index, form in enumerate(forms)}
+            for future in as_completed(futures):
+                run = runs[futures[future]] = future.result()
+                if on_done is not None:
+                    on_done(run)
+        return runs
+
+    def run_one(self, form):
+        run = ConfigRun(config_id(form), form)
+        run.started_at = started = time.time()
+        try:
+            response = self.services.webhooks.post("step2", form)
+            if response.status_code == 200:
+                run.steps["step2"] = StepOutcome("step2", True, time.time() - started, codec.loads(response.content))
+            else:
+                run.steps["step2"] = StepOutcome("step2", False, time.time() - started,
+                                                 error=f"{response.status_code} - {response.text}")
+        except Exception as e:
+            run.steps["step2"] = StepOutcome("step2", False, time.time() - started, error=str(e))
+
+        if run.steps["step2"].ok:
+            run_id = self.scheduler.start(form)
+            for spec in pipeline.PIPELINE:
+                run.steps[spec.name] = self._collect(run_id, spec)
+        run.finished_at = time.time()
+        return run
+
+    def _collect(self, run_id, spec):
+        scheduled = self.scheduler.get(run_id)
+        payload = scheduled.context[f"{spec.name}_payload"]
+        job = self.runner.get(scheduled.jobs.get(spec.name))
+        started = job.submitted_at if job is not None else time.time()
+        deadline = started + self.step_timeout
+        try:
+            if job is None:
+                # The job queue was full when the run was scheduled; run the step here instead
+                result = spec.run(self.services, payload)
+            else:
+                if not job.wait(timeout=max(0, deadline - time.time())):
+                    return StepOutcome(spec.name, False, time.time() - started, error="Timed out")
+                if job.state == jobs.FAILED:
+                    return StepOutcome(spec.name, False, job.elapsed(), error=str(job.error))
+                result = job.result
+
+            if spec.name in pipeline.RESULT_STEPS:
+                return self._collect_async(spec.name, payload, result, started, deadline)
+            response, error = result
+            return StepOutcome(spec.name, error is None, time.time() - started if job is None else job.elapsed(),
+                               response, error)
+        except Exception as e:
+            return StepOutcome(spec.name, False, time.time() - started, error=str(e))
+
+    def _collect_async(self, step, payload, unique_id, started, deadline):
+        if unique_id is None:
+            # Served from the response cache
+            return StepOutcome(step, True, 0.0, pipeline.cached_response(self.services, step, payload))
+        result_step = pipeline.RESULT_STEPS[step]
+        result = self.services.poller.wait(unique_id, result_step, timeout=max(0, deadline - time.time()))
+        with self._lock:
+            finished_at = self._finished_at.pop((str(unique_id), result_step), time.time())
+        partials = self.services.poller.partials(unique_id, result_step)
+        self.services.poller.release(unique_id, result_step)
+        if result is None:
+            return StepOutcome(step, False, time.time() - started, error="Timed out waiting for the result")
+        if result.status != "COMPLETED":
+            return StepOutcome(step, False, finished_at - started, error="Processing failed")
+        response = codec.loads(result.response_data) if result.response_data is not None else {}
+        if isinstance(response, dict) and "data" not in response and partials:
+            # The final row only marks completion; the tables arrived as PARTIAL rows
+            response = {**response, "data": results.partial_items(partials)}
+        if self.services.cache is not None:
+            self.services.cache.set(step, payload, response)
+        return StepOutcome(step, True, finished_at - started, response)
+
+    def _on_result(self, unique_id, step, result):
+        with self._lock:
+            self._finished_at[(str(unique_id), step)] = time.time()
+
+
+def write_json(run, output):
+    with open(os.path.join(output, f"{run.id}.json"), "wb") as f:
+        f.write(codec.dumps(run.to_dict()))
+
+
+def write_parquet(runs, output):
+    """One Parquet file per result view across all configurations, plus runs.parquet"""
+    frames = {}
+    for run in runs:
+        for step, views in PARQUET_VIEWS.items():
+            outcome = run.steps.get(step)
+            if outcome is None or not outcome.ok:
+                continue
+            digest = cache.payload_hash(outcome.response)
+            for view_name in views:
+                try:
+                    frame = normalize.frame(outcome.response, view_name, digest)
+                except normalize.SchemaError:
+                    continue
+                frames.setdefault(view_name, []).append(frame.assign(config_id=run.id))
+    for view_name, parts in frames.items():
+        combined = pd.concat(parts, ignore_index=True)
+        # Categories differ between configurations; re-derive them on the combined frame
+        for column in combined.columns:
+            if isinstance(combined[column].dtype, pd.CategoricalDtype) or column == "config_id":
+                combined[column] = combined[column].astype(str).astype("category")
+        combined.to_parquet(os.path.join(output, f"{view_name}.parquet"), index=False)
+
+    pd.DataFrame([
+        {"config_id": run.id, "use_case": run.form["use_case"], "data_sources": ",".join(run.form["data_sources"]),
+         "ok": run.ok, "step": step, "step_ok": outcome.ok, "latency": outcome.latency, "error": outcome.error}
+        for run in runs for step, outcome in run.steps.items()
+    ]).to_parquet(os.path.join(output, "runs.parquet"), index=False)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(runs, wall_seconds):
+    """Throughput, per-step latency and failures as a dict"""
+    steps = {}
+    for step in STEPS:
+        outcomes = [run.steps[step] for run in runs if step in run.steps]
+        latencies = [outcome.latency for outcome in outcomes if outcome.ok]
+        steps[step] = {
+            "ok": len(latencies),
+            "failed": len(outcomes) - len(latencies),
+            "p50": statistics.median(latencies) if latencies else None,
+            "p95": _percentile(latencies, 0.95) if latencies else None,
+            "max": max(latencies) if latencies else None,
+        }
+    return {
+        "configurations": len(runs),
+        "succeeded": sum(run.ok for run in runs),
+        "failed": sum(not run.ok for run in runs),
+        "wall_seconds": wall_seconds,
+        "per_minute": len(runs) / wall_seconds * 60 if wall_seconds else None,
+        "steps": steps,
+        "failures": [
+            {"config_id": run.id, "step": step, "error": outcome.error}
+            for run in runs for step, outcome in run.steps.items() if not outcome.ok
+        ],
+    }
+
+
+def print_report(summary):
+    print(f"\n{summary['configurations']} configurations in {summary['wall_seconds']:.1f}s "
+          f"({summary['per_minute']:.1f}/min): {summary['succeeded']} succeeded, {summary['failed']} failed")
+    print(f"{'step':<8}{'ok':>6}{'failed':>8}{'p50 s':>10}{'p95 s':>10}{'max s':>10}")
+    for step, values in summary["steps"].items():
+        timings = "".join(f"{values[key]:>10.1f}" if values[key] is not None else f"{'-':>10}"
+                          for key in ("p50", "p95", "max"))
+        print(f"{step:<8}{values['ok']:>6}{values['failed']:>8}{timings}")
+    for failure in summary["failures"]:
+        print(f"FAILED {failure['config_id']} {failure['step']}: {failure['error']}")
+
+
+def build_services(use_cache=True, listen=True):
+    """The same shared services the app builds, without Streamlit"""
+    wire = transport.Transport()
+    pool = db.ConnectionPool(db.DB_CONFIG, max_size=10, connect=wire.connect())
+    completion_notifier = None
+    if listen:
+        try:
+            with pool.connection() as conn:
+                notifier.install_trigger(conn)
+        except Exception as e:
+            logger.warning("Could not install result notification trigger: %s", e)
+        completion_notifier = notifier.CompletionNotifier(db.DB_LISTEN_CONFIG, connect=wire.connect()).start()
+    result_poller = poller.ResultPoller(pool, interval=5, idle_interval=30, notifier=completion_notifier)
+    if completion_notifier is not None:
+        completion_notifier.add_listener(result_poller.wake)
+    backend = state.open_backend(pool, cache.CACHE_DIR, wire.store_backend(state.BACKEND))
+    shared = backend if backend.shared else None
+    inflight = singleflight.InFlightJobs(backend=shared)
+    result_poller.add_listener(inflight.complete)
+    response_cache = (cache.ResponseCache(os.path.join(cache.CACHE_DIR, "responses.sqlite3"), shared=shared)
+                      if use_cache else None)
+    client = webhooks.WebhookClient(adapter=wire.webhook_adapter())
+    return pipeline.PipelineServices(client, result_poller.start(), response_cache, inflight)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", help="JSON file listing the configurations to run")
+    parser.add_argument("--data-sources", action="append", default=[],
+                        help="comma-separated data source set; repeat for several sets")
+    parser.add_argument("--use-case", action="append", default=[], help="use case to run; repeat for several")
+    parser.add_argument("--business-rule", action="append", default=[], help="business rule sent with every run")
+    parser.add_argument("--workers", type=int, default=4, help="configurations run at the same time")
+    parser.add_argument("--step-timeout", type=float, default=1800, help="seconds to wait for each step")
+    parser.add_argument("--output", default="batch-output", help="directory for results and the report")
+    parser.add_argument("--format", choices=["json", "parquet"], default="json")
+    parser.add_argument("--no-cache", action="store_true", help="ignore and do not fill the response cache")
+    parser.add_argument("--no-listen", action="store_true", help="poll the results table without LISTEN/NOTIFY")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    forms = load_configs(args)
+    os.makedirs(args.output, exist_ok=True)
+    services = build_services(use_cache=not args.no_cache, listen=not args.no_listen)
+    batch = BatchRunner(services, workers=args.workers, step_timeout=args.step_timeout)
+
+    def on_done(run):
+        logger.info("%s %s", "OK" if run.ok else "FAILED", run.id)
+        if args.format == "json":
+            write_json(run, args.output)
+
+    started = time.time()
+    runs = batch.run(forms, on_done=on_done)
+    summary = report(runs, time.time() - started)
+    if args.format == "parquet":
+        write_parquet(runs, args.output)
+    with open(os.path.join(args.output, "report.json"), "wb") as f:
+        f.write(codec.dumps(summary))
+    if metrics.ENABLED:
+        # Span timings and counters for the whole batch, in Prometheus text format
+        with open(os.path.join(args.output, "metrics.prom"), "w") as f:
+            f.write(metrics.REGISTRY.prometheus_text())
+    print_report(summary)
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1 @@
+"""Offline micro-benchmarks; run a module with ``python -m benchmarks.<name>``"""
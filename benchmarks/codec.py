@@ -0,0 +1,96 @@
+"""Compare the stdlib and orjson codecs on step 3 / step 6 sized payloads
+
+    python -m benchmarks.codec [--tables 300] [--columns 40] [--mappings 200] [--repeat 20]
+"""
+import argparse
+import gzip
+import json
+import statistics
+import time
+
+import codec
+
+
+def step3_payload(tables, columns):
+    """A {"data": [...]} profiling result shaped like the step 3 webhook output"""
+    return {"data": [
+        {
+            "table_name": f"stg_source_{t}",
+            "classification": "Transactional",
+            "summary": f"Daily extract of source system {t} with customer, product and sales facts. " * 3,
+            "column_tags": [
+                {
+                    "column_name": f"column_{c}",
+                    "tag": ("PII", "METRIC", "DIMENSION", "KEY")[c % 4],
+                    "description": f"Column {c} of stg_source_{t}, populated by the nightly load (é, ü, 数据)",
+                }
+                for c in range(columns)
+            ],
+        }
+        for t in range(tables)
+    ]}
+
+
+def step6_payload(mappings):
+    """A {"data": [...]} integration mapping result shaped like the step 6 webhook output"""
+    return {"data": [
+        {
+            "integration_table_name": f"int_subject_{m}",
+            "primary_source_staging_table": f"stg_source_{m}",
+            "secondary_source_staging_table": f"stg_source_{m + 1}",
+            "mapping": [{"source": f"col_{i}", "target": f"attr_{i}", "score": i / 7} for i in range(20)],
+            "sql_query": f"SELECT * FROM stg_source_{m} a JOIN stg_source_{m + 1} b ON a.id = b.id WHERE a.x > {m}",
+            "justification": "Both tables share the customer key and cover the same reporting grain. " * 2,
+        }
+        for m in range(mappings)
+    ]}
+
+
+def _time(fn, arg, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def codecs():
+    found = {"json": (
+        lambda obj: json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8"),
+        json.loads,
+    )}
+    if codec.orjson is not None:
+        found["orjson"] = (codec.orjson.dumps, codec.orjson.loads)
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", type=int, default=300)
+    parser.add_argument("--columns", type=int, default=40)
+    parser.add_argument("--mappings", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    payloads = {
+        "step3": step3_payload(args.tables, args.columns),
+        "step6": step6_payload(args.mappings),
+    }
+    available = codecs()
+    if "orjson" not in available:
+        print("orjson is not installed; only the stdlib codec is measured")
+
+    print(f"{'payload':<8}{'codec':<8}{'size KB':>10}{'gzip KB':>10}{'dumps ms':>10}{'loads ms':>10}")
+    for name, payload in payloads.items():
+        for codec_name, (dumps, loads) in available.items():
+            encoded = dumps(payload)
+            print(
+                f"{name:<8}{codec_name:<8}{len(encoded) / 1024:>10.0f}"
+                f"{len(gzip.compress(encoded, compresslevel=5)) / 1024:>10.0f}"
+                f"{_time(dumps, payload, args.repeat):>10.2f}{_time(loads, encoded, args.repeat):>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,504 @@
+"""Local stand-ins for the n8n webhooks and the results table
+
+FakeN8n serves every webhook in webhooks.ENDPOINTS over HTTP on localhost with
+configurable latency, error rate and payload size. Steps 3 and 6 answer with a
+uniqueID and then play the job's rows into a ResultsStandIn, which behaves
+like the results table for the queries the app issues and counts them. The
+replay transport (see transport.py) plays recorded rows into one too.
+"""
+import gzip
+import itertools
+import json
+import random
+import re
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psycopg2.extensions
+
+import codec
+import normalize
+import notifier
+import poller
+import results
+import schema
+import webhooks
+
+
+class StepProfile:
+    """How a fake webhook behaves: response latency, 5xx rate and, for steps 3 / 6, job duration"""
+
+    def __init__(self, latency=0.2, jitter=0.5, error_rate=0.0, job_seconds=2.0, job_error_rate=0.0):
+        self.latency = latency
+        # Each delay is drawn uniformly from latency * (1 +/- jitter)
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.job_seconds = job_seconds
+        self.job_error_rate = job_error_rate
+
+    def delay(self, seconds=None):
+        seconds = self.latency if seconds is None else seconds
+        return max(0.0, random.uniform(seconds * (1 - self.jitter), seconds * (1 + self.jitter)))
+
+
+def step3_response(table_names, columns):
+    return {"data": [
+        {
+            "table_name": table_name,
+            "classification": ("Transactional", "Reference", "Master")[i % 3],
+            "summary": f"Synthetic profile of {table_name} for benchmarking.",
+            "column_tags": [
+                {"column_name": f"column_{c}", "tag": ("PII", "METRIC", "DIMENSION", "KEY")[c % 4],
+                 "description": f"Column {c} of {table_name}"}
+                for c in range(columns)
+            ],
+        }
+        for i, table_name in enumerate(table_names)
+    ]}
+
+
+def step4_response(table_names, columns):
+    return {
+        "summary": "Synthetic fitness check.",
+        "missing_attributes": [
+            {"table_name": table_name, "column_name": f"missing_{c}", "importance": ("High", "Medium", "Low")[c % 3],
+             "impact": "Synthetic impact"}
+            for table_name in table_names for c in range(max(1, columns // 10))
+        ],
+    }
+
+
+def step5_response(table_names, columns):
+    return [{"parsed": {"data_quality_rules": [
+        {"table_name": table_name, "column_name": f"column_{c}", "rule_name": ("NOT_NULL", "UNIQUE", "FORMAT_CHECK")[c % 3],
+         "configuration_information": "Synthetic rule"}
+        for table_name in table_names for c in range(columns)
+    ]}}]
+
+
+def step6_response(table_names, columns):
+    return {"data": [
+        {"integration_table_name": f"int_{table_name}", "primary_source_staging_table": table_name,
+         "secondary_source_staging_table": table_names[(i + 1) % len(table_names)], "mapping": [],
+         "sql_query": f"SELECT * FROM {table_name}", "justification": "Synthetic mapping"}
+        for i, table_name in enumerate(table_names)
+    ]}
+
+
+def job_rows(step, response, profile, partial_key=None):
+    """Rows an n8n execution writes over time: PROCESSING, optional PARTIAL rows, then COMPLETED or ERROR"""
+    items = response.get(partial_key, []) if partial_key else []
+    duration = profile.delay(profile.job_seconds)
+    rows = [(0.0, step, "PROCESSING", None)]
+    for i, item in enumerate(items, 1):
+        rows.append((duration * i / (len(items) + 1), step, poller.PARTIAL, codec.dumps(item).decode("utf-8")))
+    if random.random() < profile.job_error_rate:
+        rows.append((duration, step, "ERROR", None))
+    else:
+        rows.append((duration, step, "COMPLETED", codec.dumps(response).decode("utf-8")))
+    return rows
+
+
+class _Notify:
+    def __init__(self, channel, payload):
+        self.channel = channel
+        self.payload = payload
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self._rows = self.conn.db.execute(self.conn, query, list(params or ()))
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+
+class _Connection:
+    """Just enough of a psycopg2 connection for db.ConnectionPool and notifier.CompletionNotifier"""
+
+    def __init__(self, db):
+        self.db = db
+        self.autocommit = False
+        self.closed = 0
+        self.status = psycopg2.extensions.STATUS_READY
+        self.notifies = []
+        # select() on the LISTEN connection waits on this socket
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+
+    def cursor(self):
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        return _Cursor(self)
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    def poll(self):
+        try:
+            while self._reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def push(self, notification):
+        self.notifies.append(notification)
+        try:
+            self._writer.send(b"\0")
+        except OSError:
+            pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = 1
+            self.db.forget(self)
+            self._reader.close()
+            self._writer.close()
+
+
+class ResultsStandIn:
+    """In-memory n8n_processing_results that answers the app's queries and counts them by kind.
+
+    ``connect`` stands in for psycopg2.connect, so it can be handed to
+    db.ConnectionPool and notifier.CompletionNotifier.
+
+    With a ``path`` the rows live in that SQLite file instead, so stand-ins in
+    several processes on the host (app replicas, and the fake n8n writing the
+    rows) share one table. Each of them then watches the file for new rows to
+    fire the NOTIFY trigger on its own LISTEN connections.
+    """
+
+    def __init__(self, query_latency=0.002, path=None, watch_interval=0.05):
+        self.query_latency = query_latency
+        self._lock = threading.Lock()
+        self._rows = []
+        # Stands in for the tableoid:ctid row reference the poller keys PARTIAL rows by
+        self._row_ids = itertools.count(1)
+        self._listeners = set()
+        self.queries = Counter()
+        self.jobs = Counter()
+        self._file = None
+        if path:
+            self._file = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._file.execute("PRAGMA journal_mode=WAL")
+            self._file.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " id INTEGER PRIMARY KEY, unique_id TEXT NOT NULL, step TEXT NOT NULL, status TEXT NOT NULL,"
+                " response_data TEXT)"
+            )
+            self._seen = self._file.execute("SELECT COALESCE(MAX(id), 0) FROM results").fetchone()[0]
+            threading.Thread(target=self._watch, args=(watch_interval,), name="results-watch", daemon=True).start()
+
+    def connect(self, **kwargs):
+        """Drop-in for psycopg2.connect"""
+        return _Connection(self)
+
+    def forget(self, conn):
+        with self._lock:
+            self._listeners.discard(conn)
+
+    def insert(self, unique_id, step, status, response_data=None):
+        """Write a row the way n8n does, firing the NOTIFY trigger"""
+        with self._lock:
+            if self._file is not None:
+                # The watcher notifies, here and in every other process sharing the file
+                self._file.execute(
+                    "INSERT INTO results (unique_id, step, status, response_data) VALUES (?, ?, ?, ?)",
+                    (unique_id, step, status, response_data),
+                )
+                return
+            self._rows.append((unique_id, step, status, response_data, f"0:{next(self._row_ids)}"))
+        self._notify(unique_id, step, status)
+
+    def _notify(self, unique_id, step, status):
+        with self._lock:
+            listeners = list(self._listeners)
+        payload = json.dumps({"unique_id": unique_id, "step": step, "status": status})
+        for conn in listeners:
+            conn.push(_Notify(notifier.CHANNEL, payload))
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                new = self._file.execute(
+                    "SELECT id, unique_id, step, status FROM results WHERE id > ? ORDER BY id", (self._seen,)
+                ).fetchall()
+                if new:
+                    self._seen = new[-1][0]
+            for _, unique_id, step, status in new:
+                self._notify(unique_id, step, status)
+
+    def _snapshot(self):
+        """Every row as (unique_id, step, status, response_data, row reference); the caller holds the lock"""
+        if self._file is None:
+            return list(self._rows)
+        return [
+            (unique_id, step, status, response_data, f"0:{row_id}")
+            for row_id, unique_id, step, status, response_data in self._file.execute(
+                "SELECT id, unique_id, step, status, response_data FROM results ORDER BY id"
+            )
+        ]
+
+    def play(self, unique_id, rows, speed=1.0):
+        """Write a job's (offset seconds, step, status, response_data) rows in the background.
+
+        Each row lands ``offset / speed`` seconds from now (immediately when
+        ``speed`` is 0). Rows left from an earlier play of the same job are
+        removed first.
+        """
+        rows = sorted(rows, key=lambda row: row[0])
+        with self._lock:
+            if self._file is not None:
+                self._file.execute("DELETE FROM results WHERE unique_id = ?", (unique_id,))
+            else:
+                self._rows = [row for row in self._rows if row[0] != unique_id]
+            if rows:
+                self.jobs[rows[0][1]] += 1
+
+        def work():
+            started = time.monotonic()
+            for offset, step, status, response_data in rows:
+                if speed:
+                    time.sleep(max(0.0, started + offset / speed - time.monotonic()))
+                self.insert(unique_id, step, status, response_data)
+
+        threading.Thread(target=work, name=f"results-{unique_id}", daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {"queries": dict(self.queries), "jobs": dict(self.jobs), "rows": len(self._snapshot())}
+
+    def execute(self, conn, query, params):
+        if self.query_latency:
+            time.sleep(self.query_latency)
+        text = " ".join(query.split())
+        if text == "SELECT 1":
+            return self._count("health", [(1,)])
+        if text.startswith("LISTEN"):
+            with self._lock:
+                self._listeners.add(conn)
+            return self._count("listen", [])
+        if "FROM pg_trigger" in text or "CREATE OR REPLACE FUNCTION" in text:
+            return self._count("trigger", [(1,)])
+        if query == poller.BATCH_QUERY:
+            return self._count("poll", self._poll(*params))
+        if "jsonb_array_length" in text:
+            return self._count("item_count", self._item_count(*params))
+        if text.startswith("SELECT e.item::text"):
+            return self._count("table_items", self._table_items(*params))
+        if "WITH rows AS" in text:
+            return self._count("projection", self._projection(query, params))
+        if "pg_" in text or "to_regclass" in text or schema.MIGRATIONS_TABLE in text:
+            return self._count("schema", self._schema(text))
+        raise NotImplementedError(f"Results stand-in does not understand: {text[:200]}")
+
+    def _count(self, kind, rows):
+        with self._lock:
+            self.queries[kind] += 1
+        return rows
+
+    def _poll(self, projected_steps, unique_ids, steps, seen_refs):
+        unique_ids = {str(unique_id) for unique_id in unique_ids}
+        seen_refs = set(seen_refs)
+        with self._lock:
+            rows = self._snapshot()
+        found = []
+        for unique_id, step, status, response_data, row_ref in rows:
+            if unique_id not in unique_ids or step not in steps:
+                continue
+            if status == poller.PARTIAL and row_ref in seen_refs:
+                continue
+            shipped = status == poller.PARTIAL or (status == "COMPLETED" and step not in projected_steps)
+            found.append((unique_id, step, status, response_data if shipped else None, row_ref))
+        return found
+
+    def _completed(self, unique_id, step):
+        with self._lock:
+            rows = self._snapshot()
+        for row_id, row_step, status, response_data, _ in rows:
+            if row_id == str(unique_id) and row_step == step and status == "COMPLETED":
+                return codec.loads(response_data)
+        return None
+
+    def _item_count(self, unique_id, step):
+        response = self._completed(unique_id, step)
+        data = response.get("data") if isinstance(response, dict) else None
+        return [(len(data),)] if isinstance(data, list) else []
+
+    def _table_items(self, unique_id, step, *filter_params):
+        response = self._completed(unique_id, step)
+        data = response.get("data") if isinstance(response, dict) else None
+        items = data if isinstance(data, list) else []
+        if filter_params:
+            *paths, table_names = filter_params
+            items = [item for item in items
+                     if next((item[path] for path in paths if item.get(path) is not None), None) in table_names]
+        return [(json.dumps(item),) for item in items]
+
+    def _projection(self, query, params):
+        # Recognise which results.View the query was generated for, then answer it with normalize
+        for view in results.VIEWS.values():
+            view_params = []
+            if (results._items_sql(view, view_params) in query
+                    and params[:len(view_params)] == view_params and params[len(view_params) + 1] == view.step):
+                break
+        else:
+            raise NotImplementedError("Unknown results.py projection")
+        unique_id, step = params[len(view_params):len(view_params) + 2]
+        rest = params[len(view_params) + 2:]
+        response = self._completed(unique_id, step)
+        df = normalize.frame(response if response is not None else {"data": []}, view.name)
+
+        where = query.rsplit("FROM rows", 1)[1]
+        filters = {}
+        for index in re.findall(r"c(\d+) = %s", where):
+            filters[view.labels[int(index)]] = rest.pop(0)
+        search = None
+        if "ILIKE" in where:
+            search = re.sub(r"\\(.)", r"\1", rest.pop(0)[1:-1])
+
+        distinct = re.search(r"SELECT DISTINCT c(\d+)", query)
+        if distinct:
+            return [(value,) for value in normalize.distinct_values(df, view.labels[int(distinct.group(1))])][:rest[0]]
+        if "SELECT count(*) FROM rows" in query:
+            return [(normalize.page(df, 0, len(df), filters, search)[1],)]
+
+        sort = re.search(r"ORDER BY c(\d+) (ASC|DESC)", query)
+        limit, offset = rest
+        rows, total = normalize.page(
+            df, offset, limit, filters, search,
+            sort_by=view.labels[int(sort.group(1))] if sort else None,
+            descending=bool(sort) and sort.group(2) == "DESC",
+        )
+        return [tuple(str(value) for value in row) + (0, 0, total) for row in rows.itertuples(index=False)]
+
+    def _schema(self, text):
+        # Report the managed schema as fully migrated and indexed
+        if "relkind" in text:
+            return [("p",)]
+        if "to_regclass(%s)" in text and "pg_inherits" not in text:
+            return [(schema.MIGRATIONS_TABLE,)]
+        if "MAX(version)" in text:
+            return [(schema.MIGRATIONS[-1][0],)]
+        if "pg_indexes" in text:
+            return [(1,)]
+        if "pg_inherits" in text:
+            return [(f"{schema.TABLE}_p209912", datetime(2099, 12, 1, tzinfo=timezone.utc))]
+        return []
+
+
+class FakeN8n:
+    """Threaded HTTP server answering every configured webhook on localhost"""
+
+    def __init__(self, results_db, profiles=None, columns=20, default_profile=None):
+        self.results_db = results_db
+        self.profiles = dict(profiles or {})
+        self.default_profile = default_profile or StepProfile()
+        self.columns = columns
+        self.requests = Counter()
+        self._steps = {endpoint.webhook_id: step for step, endpoint in webhooks.ENDPOINTS.items()}
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-n8n", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def profile(self, step):
+        return self.profiles.get(step, self.default_profile)
+
+    def respond(self, step, payload):
+        """(status, body) for one webhook call"""
+        profile = self.profile(step)
+        time.sleep(profile.delay())
+        self.requests[step] += 1
+        if random.random() < profile.error_rate:
+            return 500, {"message": "Synthetic failure"}
+
+        if step == "step2":
+            return 200, {"message": f"Received {len(payload.get('data_sources', []))} data sources"}
+        if step == "step4":
+            table_names = payload[0]["table_name"] if isinstance(payload, list) and payload else []
+            return 200, step4_response(table_names or ["stg_unknown"], self.columns)
+        table_names = payload.get("table_name", []) if isinstance(payload, dict) else []
+        table_names = table_names or ["stg_unknown"]
+        if step == "step5":
+            return 200, step5_response(table_names, self.columns)
+        unique_id = str(uuid.uuid4())
+        if step == "step3":
+            rows = job_rows("profiling", step3_response(table_names, self.columns), profile, partial_key="data")
+        else:
+            rows = job_rows("integration_mapping", step6_response(table_names, self.columns), profile)
+        self.results_db.play(unique_id, rows)
+        return 200, {"uniqueID": unique_id}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                step = fake._steps.get(self.path.rsplit("/", 1)[-1])
+                if step is None:
+                    status, response = 404, {"message": "Unknown webhook"}
+                else:
+                    status, response = fake.respond(step, codec.loads(body) if body else {})
+                encoded = codec.dumps(response)
+                if "gzip" in self.headers.get("Accept-Encoding", "") and len(encoded) >= codec.GZIP_MIN_BYTES:
+                    encoded = gzip.compress(encoded, compresslevel=5)
+                    self.send_response(status)
+                    self.send_header("Content-Encoding", "gzip")
+                else:
+                    self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
@@ -0,0 +1,251 @@
+"""Drive the app end to end through Streamlit's AppTest against local stand-ins for n8n and PostgreSQL
+
+    python -m benchmarks.harness [--sessions 8] [--latency 0.3] [--job-seconds 3] [--error-rate 0]
+                                 [--columns 20] [--offset 0] [--state-dir DIR] [--json results.json]
+                                 [--webhook-url URL --results-db FILE]
+
+Each session submits the step 1 form with its own data sources and use case,
+then walks steps 3-6, rerunning the script the way the browser's fragment
+timers would until each step stops loading. Reports wall time and reruns per
+step, results-table queries per job and p50 / p99 across sessions.
+
+benchmarks/replicas.py runs several of these as separate processes sharing
+one ``--state-dir``, each with its own ``--offset`` so the replicas drive
+distinct sessions. It serves one fake n8n for all of them (``--webhook-url``)
+writing to one SQLite-backed results table (``--results-db``).
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_SCRIPT = os.path.join(APP_DIR, "streamlit-chat-app.py")
+
+STEPS = ("step3", "step4", "step5", "step6")
+
+# AppTest installs a process-wide mock Runtime for the duration of each script
+# run, so runs from different sessions must not overlap. Sessions still overlap
+# everywhere else: webhook calls, background jobs, polling and the waits between reruns.
+_RUN_LOCK = threading.Lock()
+
+
+class SessionRun:
+    """Timings and rerun counts for one simulated browser session"""
+
+    def __init__(self, index, data_sources, use_case):
+        self.index = index
+        self.data_sources = data_sources
+        self.use_case = use_case
+        # step -> (seconds, reruns)
+        self.steps = {}
+        self.errors = []
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _rerun(at):
+    with _RUN_LOCK:
+        return at.run()
+
+
+def _click(at, label):
+    for button in at.button:
+        if button.label == label:
+            button.click()
+            return _rerun(at)
+    raise LookupError(f"No {label!r} button on the page; errors: {[e.value for e in at.error]}")
+
+
+def _wait(at, step, run, poll_interval, timeout):
+    """Rerun until ``step`` stops loading, recording the time and reruns it took"""
+    started = time.perf_counter()
+    reruns = 0
+    while at.session_state[f"{step}_loading"] if f"{step}_loading" in at.session_state else False:
+        if time.perf_counter() - started > timeout:
+            run.errors.append(f"{step} still loading after {timeout}s")
+            break
+        time.sleep(poll_interval)
+        _rerun(at)
+        reruns += 1
+    run.steps[step] = (time.perf_counter() - started, reruns)
+    if f"{step}_error" in at.session_state and at.session_state[f"{step}_error"]:
+        run.errors.append(f"{step}: {at.session_state[f'{step}_error']}")
+    for error in at.error:
+        run.errors.append(f"{step}: {error.value}")
+
+
+def drive_session(run, poll_interval=0.25, timeout=120):
+    """Walk one session from the step 1 form to the step 6 results"""
+    from streamlit.testing.v1 import AppTest
+
+    at = _rerun(AppTest.from_file(APP_SCRIPT, default_timeout=timeout))
+    at.multiselect[0].set_value(run.data_sources)
+    at.selectbox[0].set_value(run.use_case)
+    _click(at, "Submit")
+    _click(at, "Proceed to Step 3")
+    _wait(at, "step3", run, poll_interval, timeout)
+    for step_number in (4, 5, 6):
+        _click(at, f"Proceed to Step {step_number}")
+        _wait(at, f"step{step_number}", run, poll_interval, timeout)
+    return run
+
+
+def source_sets():
+    """Every distinct set of data sources, taking one of each size in turn so sizes stay mixed"""
+    import pipeline
+
+    sources = pipeline.DATA_SOURCES
+    by_width = [[list(chosen) for chosen in itertools.combinations(sources, width)]
+                for width in range(1, len(sources) + 1)]
+    ordered = []
+    for rank in range(max(len(group) for group in by_width)):
+        ordered.extend(group[rank] for group in by_width if rank < len(group))
+    return ordered
+
+
+def session_plans(count, offset=0):
+    """(data sources, use case) per session.
+
+    The step 3 payload depends only on the data sources, so sessions get
+    distinct source sets (and therefore distinct jobs) until they run out.
+    """
+    import pipeline
+
+    sets = source_sets()
+    return [(sets[index % len(sets)], pipeline.USE_CASES[index % len(pipeline.USE_CASES)])
+            for index in range(offset, offset + count)]
+
+
+def report(runs, wall_seconds, results_db, fake):
+    """Per-step latency and rerun percentiles plus database traffic as a dict"""
+    steps = {}
+    for step in STEPS:
+        timings = [run.steps[step][0] for run in runs if step in run.steps]
+        reruns = [run.steps[step][1] for run in runs if step in run.steps]
+        steps[step] = {
+            "sessions": len(timings),
+            "p50": statistics.median(timings) if timings else None,
+            "p99": _percentile(timings, 0.99) if timings else None,
+            "max": max(timings) if timings else None,
+            "reruns_p50": statistics.median(reruns) if reruns else None,
+            "reruns_max": max(reruns) if reruns else None,
+        }
+    db_stats = results_db.stats()
+    jobs = sum(db_stats["jobs"].values())
+    return {
+        "sessions": len(runs),
+        "wall_seconds": wall_seconds,
+        "steps": steps,
+        "webhook_requests": dict(fake.requests) if fake is not None else {},
+        "jobs": db_stats["jobs"],
+        "queries": db_stats["queries"],
+        "polls_per_job": db_stats["queries"].get("poll", 0) / jobs if jobs else None,
+        "queries_per_job": sum(db_stats["queries"].values()) / jobs if jobs else None,
+        "errors": [f"session {run.index}: {error}" for run in runs for error in run.errors],
+        "session_steps": {run.index: {step: seconds for step, (seconds, _) in run.steps.items()} for run in runs},
+    }
+
+
+def print_report(summary):
+    print(f"\n{summary['sessions']} sessions in {summary['wall_seconds']:.1f}s")
+    print(f"{'step':<8}{'p50 s':>10}{'p99 s':>10}{'max s':>10}{'reruns p50':>12}{'reruns max':>12}")
+    for step, values in summary["steps"].items():
+        timings = "".join(f"{values[key]:>10.2f}" if values[key] is not None else f"{'-':>10}"
+                          for key in ("p50", "p99", "max"))
+        reruns = "".join(f"{values[key]:>12.0f}" if values[key] is not None else f"{'-':>12}"
+                         for key in ("reruns_p50", "reruns_max"))
+        print(f"{step:<8}{timings}{reruns}")
+    print(f"webhook requests: {summary['webhook_requests']}")
+    print(f"results-table queries: {summary['queries']}")
+    if summary["queries_per_job"] is not None:
+        print(f"per job: {summary['polls_per_job']:.1f} polls, {summary['queries_per_job']:.1f} queries in total")
+    for error in summary["errors"]:
+        print(f"ERROR {error}")
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent AppTest sessions")
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds each webhook takes to answer")
+    parser.add_argument("--job-seconds", type=float, default=3.0, help="seconds a step 3 / step 6 job runs in n8n")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of webhook calls answered with a 500")
+    parser.add_argument("--job-error-rate", type=float, default=0.0, help="fraction of jobs that end in ERROR")
+    parser.add_argument("--columns", type=int, default=20, help="columns per table in the synthetic payloads")
+    parser.add_argument("--query-latency", type=float, default=0.002, help="seconds each results-table query takes")
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="seconds between simulated fragment reruns")
+    parser.add_argument("--timeout", type=float, default=120, help="give up on a step after this many seconds")
+    parser.add_argument("--offset", type=int, default=0, help="index of the first session plan, to keep replicas apart")
+    parser.add_argument("--state-dir", help="cache and state directory shared with other replicas (default: a fresh one)")
+    parser.add_argument("--webhook-url", help="n8n stand-in served by another process (default: start one here)")
+    parser.add_argument("--results-db", help="SQLite file holding the results table, shared with other processes")
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser
+
+
+def step_profile(args):
+    """How the fake webhooks behave, from the command line"""
+    from benchmarks.fakes import StepProfile
+
+    return StepProfile(latency=args.latency, error_rate=args.error_rate,
+                       job_seconds=args.job_seconds, job_error_rate=args.job_error_rate)
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    # Responses must come from the stand-ins, not from a previous run's disk cache
+    os.environ["DATAGPT_CACHE_DIR"] = args.state_dir or tempfile.mkdtemp(prefix="datagpt-bench-")
+    # The app runs in live transport mode against the results-table stand-in, which
+    # answers only the poller's and results.py's queries, not the run store's
+    os.environ.setdefault("DATAGPT_RUN_STORE", "sqlite")
+    import cache
+    import webhooks
+    from benchmarks.fakes import FakeN8n, ResultsStandIn
+
+    cache.CACHE_DIR = os.environ["DATAGPT_CACHE_DIR"]
+    results_db = ResultsStandIn(query_latency=args.query_latency, path=args.results_db)
+    fake = None
+    if args.webhook_url is None:
+        fake = FakeN8n(results_db, columns=args.columns, default_profile=step_profile(args)).start()
+    # The app's pool and LISTEN thread connect through psycopg2.connect; point them at the stand-in
+    psycopg2.connect = results_db.connect
+    webhooks.WEBHOOK_BASE_URL = args.webhook_url or fake.url
+
+    plans = session_plans(args.sessions, args.offset)
+    runs = [SessionRun(index, sources, use_case) for index, (sources, use_case) in enumerate(plans, args.offset)]
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.sessions, thread_name_prefix="session") as executor:
+            futures = [executor.submit(drive_session, run, args.poll_interval, args.timeout) for run in runs]
+            for run, future in zip(runs, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    run.errors.append(f"{type(e).__name__}: {e}")
+    finally:
+        if fake is not None:
+            fake.stop()
+    summary = report(runs, time.perf_counter() - started, results_db, fake)
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
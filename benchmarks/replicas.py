@@ -0,0 +1,118 @@
+"""Throughput against replica count: the AppTest harness run as several processes sharing one state store
+
+    python -m benchmarks.replicas [--replicas 1,2,4] [--sessions 8] [harness options...]
+
+For each replica count R the same total number of sessions is split across R
+``benchmarks.harness`` processes. They share a cache / state directory with
+DATAGPT_STATE_BACKEND=sqlite and DATAGPT_RUN_STORE=sqlite, the single-host
+stand-ins for the datagpt_state and datagpt_runs tables. Like real replicas
+they also share one n8n: this process serves the fake webhooks, whose jobs
+write to a SQLite-backed results table every replica reads, so a job started
+on one replica can be joined and polled from another. Reports, for each R,
+the wall time including process start-up, completed sessions per minute of
+serving time (the slowest replica's own wall time) and the webhook calls n8n
+received.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_replicas(replicas, sessions, harness_args, workdir, webhook_url, results_path):
+    """Run ``sessions`` split across ``replicas`` processes; (wall seconds, per-replica reports)"""
+    state_dir = os.path.join(workdir, f"state-{replicas}")
+    os.makedirs(state_dir)
+    harness_args = harness_args + ["--webhook-url", webhook_url, "--results-db", results_path]
+    env = dict(os.environ, DATAGPT_STATE_BACKEND="sqlite", DATAGPT_RUN_STORE="sqlite")
+    share, extra = divmod(sessions, replicas)
+    processes = []
+    offset = 0
+    started = time.perf_counter()
+    for index in range(replicas):
+        count = share + (1 if index < extra else 0)
+        if count == 0:
+            continue
+        out = os.path.join(workdir, f"replicas-{replicas}-{index}.json")
+        command = [sys.executable, "-m", "benchmarks.harness", "--sessions", str(count), "--offset", str(offset),
+                   "--state-dir", state_dir, "--json", out] + harness_args
+        processes.append((subprocess.Popen(command, cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL), out))
+        offset += count
+    for process, _ in processes:
+        process.wait()
+    wall_seconds = time.perf_counter() - started
+    reports = []
+    for process, out in processes:
+        if not os.path.exists(out):
+            raise RuntimeError(f"A replica exited with status {process.returncode} without a report")
+        with open(out) as f:
+            reports.append(json.load(f))
+    return wall_seconds, reports
+
+
+def summarize(replicas, wall_seconds, reports, fake):
+    completed = sum(1 for report in reports for steps in report["session_steps"].values() if "step6" in steps)
+    serving_seconds = max(report["wall_seconds"] for report in reports)
+    return {
+        "replicas": replicas,
+        "sessions": sum(report["sessions"] for report in reports),
+        "completed": completed,
+        "wall_seconds": wall_seconds,
+        "serving_seconds": serving_seconds,
+        "sessions_per_minute": completed / serving_seconds * 60 if serving_seconds else None,
+        "webhook_requests": dict(fake.requests),
+        "errors": [error for report in reports for error in report["errors"]],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replicas", default="1,2,4", help="comma-separated replica counts to compare")
+    parser.add_argument("--sessions", type=int, default=8, help="total sessions, split across the replicas")
+    parser.add_argument("--json", help="also write the comparison to this file")
+    args, harness_args = parser.parse_known_args(argv)
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    from benchmarks.fakes import FakeN8n, ResultsStandIn
+    from benchmarks.harness import make_parser, step_profile
+
+    # The fake n8n lives here, so it takes the harness's webhook options
+    options = make_parser().parse_args(harness_args)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="datagpt-replicas-") as workdir:
+        for replicas in (int(value) for value in args.replicas.split(",")):
+            results_path = os.path.join(workdir, f"results-{replicas}.sqlite")
+            results_db = ResultsStandIn(query_latency=0, path=results_path)
+            fake = FakeN8n(results_db, columns=options.columns, default_profile=step_profile(options)).start()
+            try:
+                wall_seconds, reports = run_replicas(replicas, args.sessions, harness_args, workdir,
+                                                     fake.url, results_path)
+            finally:
+                fake.stop()
+            results.append(summarize(replicas, wall_seconds, reports, fake))
+            print(f"{replicas} replica(s): {results[-1]['completed']}/{results[-1]['sessions']} sessions"
+                  f" in {wall_seconds:.1f}s, webhook calls {results[-1]['webhook_requests']}")
+
+    baseline = results[0]["sessions_per_minute"] if results else None
+    print(f"\n{'replicas':>8}{'sessions':>10}{'wall s':>10}{'serving s':>11}{'sessions/min':>14}{'speedup':>10}")
+    for result in results:
+        rate = result["sessions_per_minute"]
+        speedup = f"{rate / baseline:>10.2f}" if rate and baseline else f"{'-':>10}"
+        print(f"{result['replicas']:>8}{result['completed']:>10}{result['wall_seconds']:>10.1f}"
+              f"{result['serving_seconds']:>11.1f}{rate or 0:>14.1f}{speedup}")
+    for result in results:
+        for error in result["errors"]:
+            print(f"ERROR ({result['replicas']} replicas) {error}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if any(result["errors"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
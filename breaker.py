@@ -0,0 +1,96 @@
+"""Per-endpoint circuit breaker so a dead workflow fails fast instead of timing out"""
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an endpoint whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker shared by every session calling one endpoint.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and calls
+    fail immediately with CircuitOpen. Once ``reset_timeout`` seconds have
+    passed it goes half-open and lets up to ``half_open_max_calls`` probe
+    requests through: a successful probe closes the circuit, a failed one opens
+    it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probes = 0
+        self._stats = {"successes": 0, "failures": 0, "short_circuited": 0, "opened": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def before_call(self):
+        """Raise CircuitOpen if the call must not go out"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return
+            self._stats["short_circuited"] += 1
+            retry_in = max(0, self._opened_at + self.reset_timeout - time.monotonic())
+        raise CircuitOpen(
+            f"The {self.name} webhook is failing; skipping the call for now "
+            f"(next attempt in {retry_in:.0f}s)."
+        )
+
+    def record_success(self):
+        with self._lock:
+            self._stats["successes"] += 1
+            self._failures = 0
+            self._probes = 0
+            self._state = CLOSED
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._stats["failures"] += 1
+            self._failures += 1
+            state = self._current_state()
+            if state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if state != OPEN:
+                    self._stats["opened"] += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+
+    def abandon(self):
+        """Give back a half-open probe slot when the call never went out"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["state"] = self._current_state()
+            snapshot["consecutive_failures"] = self._failures
+        return snapshot
+
+    def _current_state(self):
+        # An open circuit turns half-open by itself once the reset timeout has passed
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
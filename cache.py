@@ -0,0 +1,270 @@
+"""Content-addressed cache of step responses keyed by a hash of the step payload"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import codec
+
+CACHE_DIR = os.environ.get("DATAGPT_CACHE_DIR", ".cache")
+
+
+def payload_hash(payload):
+    """Canonical SHA-256 of a JSON payload, independent of key order and whitespace.
+
+    Always uses the stdlib encoder so keys stay the same whichever codec is installed.
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """Per-process LRU of decoded responses, bounded by entry count"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self, step=None):
+        if step is None:
+            self._entries.clear()
+        else:
+            for key in [k for k in self._entries if k[0] == step]:
+                del self._entries[key]
+
+
+class SqliteTier:
+    """On-disk tier shared by every process on the host, bounded by total bytes.
+
+    The size of the stored responses is tracked as a running total rather
+    than summed on every write. Every ``maintenance_interval`` seconds
+    expired rows are purged and the total is re-read, which also picks up
+    what other processes wrote to the file.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, maintenance_interval=60):
+        self.max_bytes = max_bytes
+        self.maintenance_interval = maintenance_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " step TEXT NOT NULL, payload_hash TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (step, payload_hash))"
+        )
+        self.evictions = 0
+        # Guards the connection and the running total; held only for this tier's own I/O
+        self._lock = threading.Lock()
+        self._maintain(time.time())
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE step = ? AND payload_hash = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._delete(key)
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE step = ? AND payload_hash = ?", (now, *key)
+            )
+        return codec.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at, now):
+        encoded = codec.dumps(value)
+        with self._lock:
+            self._delete(key)
+            self._conn.execute(
+                "INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (*key, encoded, len(encoded), expires_at, now),
+            )
+            self._total += len(encoded)
+            if now - self._maintained_at >= self.maintenance_interval:
+                self._maintain(now)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            self._delete(key)
+
+    def clear(self, step=None):
+        with self._lock:
+            if step is None:
+                self._conn.execute("DELETE FROM responses")
+            else:
+                self._conn.execute("DELETE FROM responses WHERE step = ?", (step,))
+            self._maintain(time.time())
+
+    def _delete(self, key):
+        row = self._conn.execute(
+            "SELECT size FROM responses WHERE step = ? AND payload_hash = ?", key
+        ).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM responses WHERE step = ? AND payload_hash = ?", key)
+            self._total -= row[0]
+
+    def _maintain(self, now):
+        self._conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self._maintained_at = now
+
+    def _evict(self):
+        # Drop least recently used rows until we are back under the byte budget
+        for step, digest, size in self._conn.execute(
+            "SELECT step, payload_hash, size FROM responses ORDER BY accessed_at"
+        ).fetchall():
+            self._delete((step, digest))
+            self.evictions += 1
+            if self._total <= self.max_bytes:
+                break
+
+
+class SharedTier:
+    """Tier in a state.py backend, shared by every replica using the same backend"""
+
+    NAMESPACE = "responses"
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.evictions = 0
+
+    def get(self, key, now):
+        entry = self.backend.get(self.NAMESPACE, ":".join(key))
+        if entry is None or entry["expires_at"] < now:
+            return None
+        return entry["value"], entry["expires_at"]
+
+    def set(self, key, value, expires_at, now):
+        self.backend.set(self.NAMESPACE, ":".join(key), {"value": value, "expires_at": expires_at},
+                         ttl=expires_at - now)
+
+    def delete(self, key):
+        self.backend.delete(self.NAMESPACE, ":".join(key))
+
+    def clear(self, step=None):
+        self.backend.clear(self.NAMESPACE, f"{step}:" if step else "")
+
+
+class ResponseCache:
+    """Two-tier cache of step responses keyed by (step, payload hash).
+
+    Lookups hit the in-memory LRU first, then the on-disk tier, then the
+    ``shared`` tier (a state.py backend other replicas also use); a hit in a
+    lower tier is promoted into memory. Entries expire after the step's TTL.
+    Only successful webhook responses should be stored; sample fallback data
+    never is. The cache's lock covers only the in-memory LRU and counters, so
+    a slow disk or shared-store round trip does not hold up other sessions.
+    """
+
+    def __init__(self, path=None, max_entries=256, max_bytes=256 * 1024 * 1024,
+                 default_ttl=24 * 3600, ttls=None, shared=None):
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.memory = MemoryTier(max_entries)
+        self.disk = SqliteTier(path, max_bytes) if path else None
+        self.shared = SharedTier(shared) if shared is not None else None
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "shared_hits": 0, "misses": 0, "sets": 0,
+                          "invalidations": 0}
+
+    def get(self, step, payload):
+        """Cached response for the step and payload, or None"""
+        key = (step, payload_hash(payload))
+        now = time.time()
+        with self._lock:
+            entry = self.memory.get(key, now)
+            if entry is not None:
+                self._counters["memory_hits"] += 1
+                return entry[0]
+        for name, tier in (("disk", self.disk), ("shared", self.shared)):
+            entry = tier.get(key, now) if tier else None
+            if entry is not None:
+                with self._lock:
+                    self._counters[f"{name}_hits"] += 1
+                    self.memory.set(key, *entry)
+                return entry[0]
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def set(self, step, payload, value, ttl=None):
+        key = (step, payload_hash(payload))
+        now = time.time()
+        expires_at = now + (ttl or self.ttls.get(step, self.default_ttl))
+        with self._lock:
+            self._counters["sets"] += 1
+            self.memory.set(key, value, expires_at)
+        if self.disk:
+            self.disk.set(key, value, expires_at, now)
+        if self.shared:
+            self.shared.set(key, value, expires_at, now)
+
+    def invalidate(self, step, payload):
+        """Drop the cached response for one step and payload"""
+        key = (step, payload_hash(payload))
+        with self._lock:
+            self._counters["invalidations"] += 1
+            self.memory.delete(key)
+        if self.disk:
+            self.disk.delete(key)
+        if self.shared:
+            self.shared.delete(key)
+
+    def clear(self, step=None):
+        """Drop every cached response, or every response for one step"""
+        with self._lock:
+            self.memory.clear(step)
+        if self.disk:
+            self.disk.clear(step)
+        if self.shared:
+            self.shared.clear(step)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["memory_entries"] = len(self.memory._entries)
+            snapshot["evictions"] = self.memory.evictions + (self.disk.evictions if self.disk else 0)
+        return snapshot
+
+    def samples(self):
+        """Lookups by answering tier and memory entries, for metrics.register_collector"""
+        stats = self.stats()
+        return [
+            ("datagpt_cache_lookups_total", stats[f"{tier}_hits"], {"result": tier})
+            for tier in ("memory", "disk", "shared")
+        ] + [
+            ("datagpt_cache_lookups_total", stats["misses"], {"result": "miss"}),
+            ("datagpt_cache_entries", stats["memory_entries"], {}),
+        ]
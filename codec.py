@@ -0,0 +1,46 @@
+"""JSON encoding for webhook bodies, responses and stored payloads: orjson when installed, stdlib json otherwise"""
+import gzip
+import json
+import os
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+# Set DATAGPT_JSON_CODEC=json to force the stdlib codec even when orjson is installed
+NAME = "orjson" if orjson is not None and os.environ.get("DATAGPT_JSON_CODEC") != "json" else "json"
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch this either way
+JSONDecodeError = json.JSONDecodeError
+
+# Bodies smaller than this are sent as-is; gzip costs more than it saves on them
+GZIP_MIN_BYTES = 1024
+
+
+if NAME == "orjson":
+    def dumps(obj):
+        """Compact UTF-8 JSON bytes"""
+        return orjson.dumps(obj)
+
+    def loads(data):
+        """Decode JSON from bytes, bytearray, memoryview or str without an intermediate copy"""
+        return orjson.loads(data)
+else:
+    def dumps(obj):
+        """Compact UTF-8 JSON bytes"""
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def loads(data):
+        """Decode JSON from bytes, bytearray, memoryview or str"""
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+def encode_body(obj, min_bytes=GZIP_MIN_BYTES):
+    """Request body and extra headers for ``obj``, gzipped when it is large enough to be worth it"""
+    body = dumps(obj)
+    if len(body) < min_bytes:
+        return body, {}
+    return gzip.compress(body, compresslevel=5), {"Content-Encoding": "gzip"}
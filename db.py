@@ -0,0 +1,214 @@
+"""Shared PostgreSQL access for the Data to Insights pipeline"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+
+# PostgreSQL connection parameters for the n8n results database
+# These should be stored securely in a production environment
+# Consider using st.secrets or environment variables for secure storage
+DB_CONFIG = {
+    "host": os.environ.get("DATAGPT_DB_HOST", "aws-0-ap-south-1.pooler.supabase.com"),
+    "database": os.environ.get("DATAGPT_DB_NAME", "postgres"),
+    "user": os.environ.get("DATAGPT_DB_USER", "postgres.pguxhjesyiffkujrrqyq"),
+    "password": os.environ.get("DATAGPT_DB_PASSWORD", "MfmoYcfS2n6CXkyw"),
+    "port": os.environ.get("DATAGPT_DB_PORT", "6543"),
+}
+
+# LISTEN needs a session-mode connection; the transaction-mode pooler on 6543
+# does not deliver notifications, so the listener connects to the session port
+DB_LISTEN_CONFIG = dict(DB_CONFIG, port=os.environ.get("DATAGPT_DB_LISTEN_PORT", "5432"))
+
+RESULTS_TABLE = "demo_datawarehouse.n8n_processing_results"
+# Checkpointed wizard state per pipeline run (see runs.py)
+RUNS_TABLE = "demo_datawarehouse.datagpt_runs"
+# Shared in-flight job registry and response cache entries (see state.py)
+STATE_TABLE = "demo_datawarehouse.datagpt_state"
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within the wait timeout"""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of PostgreSQL connections shared by every session.
+
+    Unlike psycopg2's ThreadedConnectionPool, callers block (up to
+    ``wait_timeout`` seconds) when all ``max_size`` connections are checked out
+    instead of failing immediately. Idle connections are closed after
+    ``idle_timeout`` seconds and connections that sat idle longer than
+    ``health_check_after`` seconds are pinged before being handed out.
+    """
+
+    def __init__(self, connect_kwargs, max_size=10, idle_timeout=300,
+                 wait_timeout=30, health_check_after=30, connect=None):
+        self.connect_kwargs = dict(connect_kwargs)
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.health_check_after = health_check_after
+        # Looked up at call time so psycopg2.connect can be swapped out (see benchmarks/)
+        self._connect = connect or (lambda **kwargs: psycopg2.connect(**kwargs))
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        # Idle connections as (connection, last_used) pairs, most recently used last
+        self._idle = []
+        self._size = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "timeouts": 0,
+            "opened": 0,
+            "evicted_idle": 0,
+            "health_check_failures": 0,
+        }
+
+    def getconn(self):
+        """Check a healthy connection out of the pool, waiting for a free slot if needed"""
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeout(
+                f"No database connection available after {self.wait_timeout}s "
+                f"(pool size {self.max_size})"
+            )
+        waited = time.monotonic() - started
+
+        try:
+            with self._lock:
+                self._stats["checkouts"] += 1
+                if waited > 0.001:
+                    self._stats["waits"] += 1
+                self._stats["wait_seconds_total"] += waited
+                self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+
+            conn = self._take_idle()
+            if conn is None:
+                conn = self._open()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, closing it if it is broken or discarded"""
+        try:
+            if not discard and not conn.closed:
+                try:
+                    if conn.status != psycopg2.extensions.STATUS_READY:
+                        conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+            if discard or conn.closed:
+                self._close(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+            self.evict_idle()
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it"""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # The server or network went away; do not hand this connection out again
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def evict_idle(self):
+        """Close connections that have been idle for longer than idle_timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            expired = [conn for conn, last_used in self._idle if last_used < cutoff]
+            self._idle = [(conn, last_used) for conn, last_used in self._idle if last_used >= cutoff]
+            self._stats["evicted_idle"] += len(expired)
+        for conn in expired:
+            self._close(conn)
+
+    def stats(self):
+        """Snapshot of pool size, usage and wait metrics"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["size"] = self._size
+            snapshot["idle"] = len(self._idle)
+            snapshot["in_use"] = self._size - len(self._idle)
+            snapshot["max_size"] = self.max_size
+        return snapshot
+
+    def samples(self):
+        """stats() as (name, value, labels) for metrics.register_collector"""
+        stats = self.stats()
+        return [
+            ("datagpt_db_pool_connections", stats["in_use"], {"state": "in_use"}),
+            ("datagpt_db_pool_connections", stats["idle"], {"state": "idle"}),
+            ("datagpt_db_pool_checkouts_total", stats["checkouts"], {}),
+            ("datagpt_db_pool_waits_total", stats["waits"], {}),
+            ("datagpt_db_pool_timeouts_total", stats["timeouts"], {}),
+        ]
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+    def _take_idle(self):
+        # Evict stale connections first so they are never handed out
+        self.evict_idle()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                conn, last_used = self._idle.pop()
+            if conn.closed:
+                self._close(conn)
+                continue
+            if time.monotonic() - last_used > self.health_check_after and not self._ping(conn):
+                with self._lock:
+                    self._stats["health_check_failures"] += 1
+                self._close(conn)
+                continue
+            return conn
+
+    def _open(self):
+        conn = self._connect(**self.connect_kwargs)
+        # Polling queries are read-only; autocommit avoids idle-in-transaction
+        # sessions holding a server connection at the Supabase pooler
+        conn.autocommit = True
+        with self._lock:
+            self._size += 1
+            self._stats["opened"] += 1
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
+
+    @staticmethod
+    def _ping(conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            return True
+        except psycopg2.Error:
+            return False
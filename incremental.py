@@ -0,0 +1,94 @@
+"""Per-table reuse of step 3 / step 5 results when the step 1 form is submitted again
+
+Profiling (step 3) and data quality rules (step 5) produce independent
+results for each staging table. After a resubmit, a table that was also in
+the previous run's payload keeps its items from that run. Only new tables are
+sent to the webhook, and the two sets are merged back in payload order.
+Integration mapping (step 6) pairs tables up, so it always runs in full.
+"""
+from results import TABLE_NAME_PATHS
+
+
+def payload_tables(payload):
+    """Staging tables a step 3 / step 5 payload asks for"""
+    return list(payload.get("table_name", [])) if isinstance(payload, dict) else []
+
+
+def table_of(item):
+    for key in TABLE_NAME_PATHS:
+        if item.get(key):
+            return item[key]
+    return None
+
+
+def response_items(step, response):
+    """The per-table items of a step response, or None when it has an unexpected shape"""
+    if step == "step3":
+        items = response.get("data") if isinstance(response, dict) else None
+    else:
+        # Either [{"parsed": {...}}] or {"parsed": {...}}
+        if isinstance(response, list) and response:
+            response = response[0]
+        parsed = response.get("parsed") if isinstance(response, dict) else None
+        items = parsed.get("data_quality_rules") if isinstance(parsed, dict) else None
+    return items if isinstance(items, list) else None
+
+
+def reusable(step, payload, previous_payload, previous_items):
+    """table -> items of the previous run for every table of ``payload`` that need not run again.
+
+    ``previous_items`` are the per-table items of the previous run's
+    response. Anything in the payload besides the table list must be
+    unchanged. Step 3 has one item per table, so a table the previous run
+    returned nothing for is profiled again. Step 5 can legitimately
+    recommend no rules for a table.
+    """
+    if not isinstance(previous_payload, dict) or not isinstance(previous_items, list):
+        return {}
+    if {k: v for k, v in payload.items() if k != "table_name"} != \
+            {k: v for k, v in previous_payload.items() if k != "table_name"}:
+        return {}
+    previous_tables = set(payload_tables(previous_payload))
+    by_table = {}
+    for item in previous_items:
+        if isinstance(item, dict) and table_of(item) in previous_tables:
+            by_table.setdefault(table_of(item), []).append(item)
+    return {
+        table: by_table.get(table, [])
+        for table in payload_tables(payload)
+        if table in previous_tables and (table in by_table or step != "step3")
+    }
+
+
+def pending(payload, reused):
+    """Tables of ``payload`` that still have to be sent to the webhook"""
+    return [table for table in payload_tables(payload) if table not in (reused or {})]
+
+
+def request(payload, reused):
+    """The payload to send for the tables ``reused`` does not cover"""
+    return {**payload, "table_name": pending(payload, reused)}
+
+
+def merge(step, payload, reused, response):
+    """``response`` for the pending tables with the reused tables' items merged in, in payload order.
+
+    ``response`` may be None when every table was reused.
+    """
+    fresh = {}
+    unnamed = []
+    for item in response_items(step, response) or []:
+        table = table_of(item) if isinstance(item, dict) else None
+        if table is None:
+            unnamed.append(item)
+        else:
+            fresh.setdefault(table, []).append(item)
+    tables = payload_tables(payload)
+    # A reused table the webhook answered for anyway takes the new answer
+    ordered = [item for table in tables for item in fresh.get(table, reused.get(table, []))]
+    ordered += [item for table, items in fresh.items() if table not in tables for item in items] + unnamed
+    if step == "step3":
+        base = {key: value for key, value in response.items() if key != "result_id"} \
+            if isinstance(response, dict) else {}
+        return {**base, "data": ordered}
+    return {"parsed": {"data_quality_rules": ordered}}
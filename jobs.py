@@ -0,0 +1,158 @@
+"""Bounded background execution of long-running webhook calls"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "QUEUED"
+RUNNING = "RUNNING"
+DONE = "DONE"
+FAILED = "FAILED"
+
+
+_local = threading.local()
+
+
+def current_job():
+    """The Job executing on this thread, or None outside the JobRunner"""
+    return getattr(_local, "job", None)
+
+
+class JobQueueFull(Exception):
+    """Raised when the runner already holds as many jobs as it is allowed to"""
+
+
+class Job:
+    """A unit of work submitted to the JobRunner, polled by id on later reruns"""
+
+    def __init__(self, job_id, name):
+        self.id = job_id
+        self.name = name
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Admission ticket while the job waits for a webhook slot (see admission.py)
+        self.ticket = None
+        self._finished = threading.Event()
+
+    @property
+    def done(self):
+        return self.state in (DONE, FAILED)
+
+    def elapsed(self):
+        """Seconds since submission, or total run time once finished"""
+        end = self.finished_at or time.time()
+        return end - self.submitted_at
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    def __repr__(self):
+        return f"Job(id={self.id!r}, name={self.name!r}, state={self.state!r})"
+
+
+class JobRunner:
+    """Runs jobs on fixed-size thread pools so slow webhooks never block a script thread.
+
+    At most ``max_workers`` jobs run at once and at most ``max_pending`` jobs
+    may be queued or running; beyond that ``submit`` raises JobQueueFull.
+    ``lanes`` maps a job name to the size of a pool of its own. A lane never
+    queues: ``submit`` raises JobQueueFull once all of its workers are busy,
+    so a lane sized to its endpoint's admission capacity leaves the admission
+    queue as the only place its jobs wait. Finished jobs are kept for
+    ``result_ttl`` seconds so a later rerun can pick them up.
+    """
+
+    def __init__(self, max_workers=4, max_pending=32, result_ttl=3600, lanes=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.lanes = dict(lanes or {})
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="webhook-job")
+        self._lane_executors = {
+            name: ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"{name}-job")
+            for name, size in self.lanes.items()
+        }
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def submit(self, name, fn, *args, on_done=None, **kwargs):
+        """Queue ``fn(*args, **kwargs)`` and return the new job's id.
+
+        ``on_done(job)`` is called from the worker thread once the job finishes.
+        """
+        self._expire()
+        job = Job(uuid.uuid4().hex, name)
+        lane = self.lanes.get(name)
+        with self._lock:
+            if lane is not None:
+                active = sum(1 for j in self._jobs.values() if not j.done and j.name == name)
+                if active >= lane:
+                    raise JobQueueFull(f"All {lane} {name} workers are busy")
+            else:
+                active = sum(1 for j in self._jobs.values() if not j.done and j.name not in self.lanes)
+                if active >= self.max_pending:
+                    raise JobQueueFull(f"{active} webhook jobs are already queued or running")
+            self._jobs[job.id] = job
+        executor = self._lane_executors.get(name, self._executor)
+        executor.submit(self._execute, job, fn, args, kwargs, on_done)
+        return job.id
+
+    def get(self, job_id):
+        """The Job for ``job_id``, or None if it is unknown or has expired"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout=None):
+        """Block up to ``timeout`` seconds for the job to finish and return it"""
+        job = self.get(job_id)
+        if job is not None:
+            job.wait(timeout)
+        return job
+
+    def forget(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def stats(self):
+        with self._lock:
+            states = [job.state for job in self._jobs.values()]
+        return {state: states.count(state) for state in (QUEUED, RUNNING, DONE, FAILED)}
+
+    def samples(self):
+        """Jobs by state, for metrics.register_collector"""
+        return [("datagpt_jobs", count, {"state": state.lower()}) for state, count in self.stats().items()]
+
+    def _execute(self, job, fn, args, kwargs, on_done):
+        job.state = RUNNING
+        job.started_at = time.time()
+        _local.job = job
+        try:
+            job.result = fn(*args, **kwargs)
+            job.state = DONE
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job.id, job.name)
+            job.error = e
+            job.state = FAILED
+        finally:
+            _local.job = None
+            job.finished_at = time.time()
+            job._finished.set()
+        if on_done is not None:
+            try:
+                on_done(job)
+            except Exception:
+                logger.exception("Completion callback for job %s failed", job.id)
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.done and job.finished_at < cutoff:
+                    del self._jobs[job_id]
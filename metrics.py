@@ -0,0 +1,331 @@
+"""Timed spans, counters and latency histograms for the pipeline, exported as Prometheus text and JSON logs
+
+Everything is off unless DATAGPT_METRICS=1. While disabled, span() returns a
+shared no-op context manager and increment() / observe() return at once, so
+instrumented code pays one global lookup per call.
+
+DATAGPT_METRICS_PORT serves /metrics (Prometheus text format) and
+/metrics.json from a background thread. DATAGPT_METRICS_LOG=1 also writes
+each finished span to the "datagpt.metrics" logger as one JSON line. The line
+carries the span's trace, parent and duration.
+
+Components that keep their own counters (the connection pool, response cache,
+in-flight job table, job runner, result poller and the webhook client's
+breakers and admission queues) are read through register_collector on each
+scrape.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("datagpt.metrics")
+
+
+def _flag(name):
+    return os.environ.get(name, "").lower() in ("1", "true", "yes", "on")
+
+
+ENABLED = _flag("DATAGPT_METRICS")
+LOG_SPANS = _flag("DATAGPT_METRICS_LOG")
+PORT = int(os.environ.get("DATAGPT_METRICS_PORT", "0")) or None
+
+# Upper bounds in seconds, from a fast DB poll to a slow LLM step
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+SPAN_SECONDS = "datagpt_span_seconds"
+
+# What each metric means, for the Prometheus HELP lines
+HELP = {
+    SPAN_SECONDS: "Duration of an instrumented phase (webhook_send, job_wait, db_fetch, decode, render)",
+    "datagpt_reruns_total": "Script reruns, by the step being displayed",
+    "datagpt_polls_total": "Batched polls of the results table",
+    "datagpt_sample_fallbacks_total": "Responses replaced by generate_sample_* data because the webhook failed",
+    "datagpt_webhook_retries_total": "Webhook calls retried after a connection error or 5xx",
+    "datagpt_webhook_circuit_state": "Circuit breaker state per webhook endpoint: 0 closed, 1 half-open, 2 open",
+    "datagpt_webhook_short_circuits_total": "Webhook calls refused by an open circuit breaker",
+    "datagpt_webhook_queue_depth": "Requests waiting in a webhook endpoint's admission queue",
+    "datagpt_webhook_in_flight": "Requests admitted to a webhook endpoint and not yet finished",
+    "datagpt_webhook_rejected_total": "Requests turned away by a webhook endpoint's admission control",
+    "datagpt_db_pool_connections": "Pooled PostgreSQL connections, by state",
+    "datagpt_db_pool_checkouts_total": "Connections handed out by the pool",
+    "datagpt_db_pool_waits_total": "Checkouts that had to wait for a free connection",
+    "datagpt_db_pool_timeouts_total": "Checkouts that gave up waiting for a connection",
+    "datagpt_cache_lookups_total": "Response cache lookups, by the tier that answered (or miss)",
+    "datagpt_cache_entries": "Responses held in the in-memory cache tier",
+    "datagpt_inflight_requests_total": "Step 3 / step 6 requests, by whether they started a job or joined one",
+    "datagpt_inflight_jobs": "n8n jobs this process is coalescing requests onto",
+    "datagpt_jobs": "Background webhook jobs held by the job runner, by state",
+    "datagpt_poller_pending_jobs": "Jobs the result poller is waiting on",
+}
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """[(upper bound, observations <= bound)] ending with +Inf"""
+        running = 0
+        found = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            running += count
+            found.append((bound, running))
+        return found
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class Registry:
+    """Thread-safe counters and histograms keyed by metric name and label set"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # name -> {labels: value}
+        self._counters = {}
+        # name -> {labels: Histogram}
+        self._histograms = {}
+        # Callables returning current (name, value, labels) samples, read on every export
+        self._collectors = []
+
+    def increment(self, name, amount=1, labels=()):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def add_collector(self, collect):
+        with self._lock:
+            self._collectors.append(collect)
+
+    def _collect(self):
+        """(counters, gauges) from the collectors, as {name: {labels: value}}"""
+        with self._lock:
+            collectors = list(self._collectors)
+        counters, gauges = {}, {}
+        for collect in collectors:
+            try:
+                samples = collect()
+            except Exception:
+                logger.exception("Metrics collector failed")
+                continue
+            for name, value, labels in samples:
+                series = (counters if name.endswith("_total") else gauges).setdefault(name, {})
+                series[_labels(labels)] = value
+        return counters, gauges
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """Every series as plain dicts, for JSON"""
+        collected, gauges = self._collect()
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for name, series in sorted({**self._counters, **collected}.items())
+                    for labels, value in series.items()
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for name, series in sorted(gauges.items()) for labels, value in series.items()
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), "count": histogram.count, "sum": histogram.sum,
+                     "buckets": {_format_bound(bound): count for bound, count in histogram.cumulative()}}
+                    for name, series in sorted(self._histograms.items()) for labels, histogram in series.items()
+                ],
+            }
+
+    def prometheus_text(self):
+        """Every series in the Prometheus text exposition format"""
+        collected, gauges = self._collect()
+        lines = []
+        with self._lock:
+            for kind, by_name in (("counter", {**self._counters, **collected}), ("gauge", gauges)):
+                for name, series in sorted(by_name.items()):
+                    if name in HELP:
+                        lines.append(f"# HELP {name} {HELP[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for labels, value in sorted(series.items()):
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(series.items()):
+                    for bound, count in histogram.cumulative():
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', _format_bound(bound))])} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# The innermost open span in this thread / context, so nested spans know their parent
+_current = contextvars.ContextVar("datagpt_span", default=None)
+
+
+def enable(enabled=True):
+    """Turn collection on or off at runtime, e.g. from a benchmark"""
+    global ENABLED
+    ENABLED = enabled
+
+
+def increment(name, amount=1, **labels):
+    """Add ``amount`` to a counter; ``name`` should end in _total"""
+    if not ENABLED:
+        return
+    REGISTRY.increment(name, amount, _labels(labels))
+
+
+def observe(name, seconds, **labels):
+    """Record one observation in a latency histogram"""
+    if not ENABLED:
+        return
+    REGISTRY.observe(name, seconds, _labels(labels))
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Span:
+    """A timed phase, recorded in datagpt_span_seconds when it exits"""
+
+    __slots__ = ("name", "labels", "trace_id", "span_id", "parent_id", "started", "_token")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        parent = _current.get()
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent is not None else None
+        self._token = _current.set(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        _current.reset(self._token)
+        REGISTRY.observe(SPAN_SECONDS, duration, _labels(dict(self.labels, span=self.name)))
+        if LOG_SPANS:
+            record = {
+                "event": "span", "span": self.name, "duration_ms": round(duration * 1000, 3),
+                "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            }
+            record.update((key, value) for key, value in self.labels.items() if value is not None)
+            if exc_type is not None:
+                # Includes Streamlit's rerun / stop control flow, which is not a failure
+                record["exception"] = exc_type.__name__
+            logger.info(json.dumps(record, default=str))
+        return False
+
+
+def register_collector(collect):
+    """Export ``collect()``'s samples with every scrape.
+
+    ``collect`` returns (name, value, labels) tuples read from a component's
+    own counters, e.g. a pool's ``samples()``. Names ending in _total are
+    exported as counters and the rest as gauges. Collectors cost nothing
+    until something is scraped.
+    """
+    REGISTRY.add_collector(collect)
+
+
+def span(name, **labels):
+    """Context manager timing one phase, e.g. ``with metrics.span("decode", step="step3"):``"""
+    if not ENABLED:
+        return _NO_SPAN
+    return Span(name, labels)
+
+
+def serve(port=PORT, host="0.0.0.0"):
+    """Serve /metrics and /metrics.json on ``port`` from a daemon thread and return the server"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] == "/metrics":
+                body, content_type = REGISTRY.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4"
+            elif self.path.split("?", 1)[0] == "/metrics.json":
+                body, content_type = json.dumps(REGISTRY.snapshot()).encode("utf-8"), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-endpoint", daemon=True).start()
+    return server
+
+
+if LOG_SPANS and not logger.handlers:
+    # JSON lines on stderr, whatever logging configuration the host process has
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
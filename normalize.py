@@ -0,0 +1,171 @@
+"""Columnar normalization of step responses into typed DataFrames, memoized by response hash"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import codec
+from results import COLUMN_TAGS, INTEGRATION_MAPPINGS, TABLE_TAGS, Column, View
+
+
+class SchemaError(ValueError):
+    """Raised when a response does not have the shape a frame is built from"""
+
+
+def _data(response):
+    return response.get("data") if isinstance(response, dict) else None
+
+
+def _missing_attributes(response):
+    if isinstance(response, dict):
+        response = response.get("parsed", response)
+        return response.get("missing_attributes")
+    return None
+
+
+def _data_quality_rules(response):
+    # Either [{"parsed": {...}}] or {"parsed": {...}}
+    if isinstance(response, list) and response:
+        response = response[0]
+    if isinstance(response, dict) and isinstance(response.get("parsed"), dict):
+        return response["parsed"].get("data_quality_rules")
+    return None
+
+
+MISSING_ATTRIBUTES = View("missing_attributes", "step4", [
+    Column("table_name", ["table_name"], categorical=True),
+    Column("column_name", ["column_name"]),
+    Column("importance", ["importance"], categorical=True),
+    Column("impact", ["impact"]),
+])
+
+DATA_QUALITY_RULES = View("data_quality_rules", "step5", [
+    Column("table_name", ["table_name"], categorical=True),
+    Column("column_name", ["column_name"]),
+    Column("rule_name", ["rule_name"], categorical=True),
+    Column("configuration_information", ["configuration_information"]),
+])
+
+# view name -> (view, function locating the list of records in a response, sort columns)
+FRAMES = {
+    TABLE_TAGS.name: (TABLE_TAGS, _data, None),
+    COLUMN_TAGS.name: (COLUMN_TAGS, _data, None),
+    INTEGRATION_MAPPINGS.name: (INTEGRATION_MAPPINGS, _data, None),
+    MISSING_ATTRIBUTES.name: (MISSING_ATTRIBUTES, _missing_attributes, None),
+    DATA_QUALITY_RULES.name: (DATA_QUALITY_RULES, _data_quality_rules, ["table_name", "column_name"]),
+}
+
+MEMO_SIZE = 64
+
+_lock = threading.Lock()
+# (view name, digest of the response or of its records) -> DataFrame
+_memo = OrderedDict()
+_counters = {"hits": 0, "misses": 0}
+
+
+def frame(response, view_name, digest=None):
+    """The view's columns for ``response`` as a DataFrame.
+
+    ``digest`` identifies the response, normally its cache.payload_hash taken
+    once when the response was stored; without it the view's records are
+    hashed on every call. Frames are shared by every session showing the same
+    response, so callers must not modify them. Raises SchemaError when the
+    response has no list of records for the view.
+    """
+    view, locate, sort_by = FRAMES[view_name]
+    records = locate(response)
+    if not isinstance(records, list):
+        raise SchemaError(f"Response has no records for {view_name}")
+
+    if digest is None:
+        digest = hashlib.blake2b(codec.dumps(records), digest_size=16).digest()
+    key = (view_name, digest)
+    with _lock:
+        cached = _memo.get(key)
+        if cached is not None:
+            _memo.move_to_end(key)
+            _counters["hits"] += 1
+            return cached
+        _counters["misses"] += 1
+
+    built = _build([record for record in records if isinstance(record, dict)], view, sort_by)
+    with _lock:
+        _memo[key] = built
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return built
+
+
+def _build(records, view, sort_by):
+    if view.children:
+        # One row per nested record; items whose nested field is not a list contribute none
+        records = [record for record in records if isinstance(record.get(view.children), list)]
+        meta = sorted({tuple(path) for column in view.columns if column.source == "item" for path in column.paths})
+        flat = pd.json_normalize(
+            records, record_path=view.children, meta=[list(path) for path in meta],
+            record_prefix="child.", meta_prefix="item.", errors="ignore",
+        ) if records else pd.DataFrame()
+    else:
+        flat = pd.json_normalize(records).add_prefix("item.") if records else pd.DataFrame()
+
+    columns = {}
+    for column in view.columns:
+        series = pd.Series([None] * len(flat), index=flat.index, dtype=object)
+        # Later paths only fill the gaps left by earlier ones
+        for path in reversed(column.paths):
+            name = f"{column.source}.{'.'.join(path)}"
+            if name in flat:
+                series = flat[name].where(flat[name].notna(), series)
+        series = series.where(series.isna(), series.astype(str)).fillna(column.default)
+        columns[column.label] = series.astype("category" if column.categorical else "string")
+    built = pd.DataFrame(columns, index=flat.index, columns=view.labels)
+    if sort_by:
+        built = built.sort_values(by=sort_by, kind="stable")
+    return built.reset_index(drop=True)
+
+
+def _contains(series, needle):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Match each distinct value once rather than every row
+        matching = series.cat.categories[series.cat.categories.astype(str).str.contains(needle, case=False, regex=False)]
+        return series.isin(matching)
+    return series.str.contains(needle, case=False, regex=False).fillna(False)
+
+
+def page(df, offset=0, limit=50, filters=None, search=None, sort_by=None, descending=False):
+    """(rows, total) for one page of ``df`` after exact-match ``filters``, a case-insensitive ``search`` and sorting.
+
+    Only the requested window is copied out of the shared frame.
+    """
+    mask = pd.Series(True, index=df.index)
+    for label, value in (filters or {}).items():
+        if label not in df.columns:
+            raise ValueError(f"Unknown column: {label}")
+        mask &= df[label] == value
+    if search:
+        matched = pd.Series(False, index=df.index)
+        for label in df.columns:
+            matched |= _contains(df[label], search)
+        mask &= matched
+    selected = df if mask.all() else df[mask]
+    if sort_by is not None:
+        if sort_by not in df.columns:
+            raise ValueError(f"Unknown column: {sort_by}")
+        # Categorical columns sort by their (lexically ordered) categories
+        selected = selected.sort_values(by=sort_by, ascending=not descending, kind="stable")
+    return selected.iloc[offset:offset + limit], len(selected)
+
+
+def distinct_values(df, label):
+    """Sorted distinct values of one column, for filter choices"""
+    column = df[label]
+    values = column.cat.categories if isinstance(column.dtype, pd.CategoricalDtype) else column.dropna().unique()
+    return sorted(str(value) for value in values)
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_counters)
+        snapshot["frames"] = len(_memo)
+    return snapshot
@@ -0,0 +1,173 @@
+"""Push-based completion notifications for n8n_processing_results via LISTEN/NOTIFY"""
+import json
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+
+from db import RESULTS_TABLE
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "n8n_processing_results"
+TRIGGER_NAME = "n8n_processing_results_notify"
+
+# Fires a notification carrying (unique_id, step, status) whenever a result row is
+# written or its status changes, so waiting sessions do not have to poll
+TRIGGER_SQL = f"""
+CREATE OR REPLACE FUNCTION demo_datawarehouse.notify_n8n_processing_result()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_notify(
+        '{CHANNEL}',
+        json_build_object(
+            'unique_id', NEW.unique_id,
+            'step', NEW.step,
+            'status', NEW.status
+        )::text
+    );
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER {TRIGGER_NAME}
+AFTER INSERT OR UPDATE OF status ON {RESULTS_TABLE}
+FOR EACH ROW EXECUTE FUNCTION demo_datawarehouse.notify_n8n_processing_result();
+"""
+
+
+def install_trigger(conn):
+    """Create (or replace) the NOTIFY trigger on the results table"""
+    with conn.cursor() as cur:
+        cur.execute(TRIGGER_SQL)
+    if not conn.autocommit:
+        conn.commit()
+
+
+class CompletionNotifier:
+    """Background LISTEN thread that wakes sessions waiting on a (unique_id, step).
+
+    Sessions read ``version(unique_id, step)`` before checking the results table
+    and then call ``wait(unique_id, step, version, timeout)``, which returns as
+    soon as a notification for exactly that row arrives. While the listener is
+    disconnected or the trigger is missing ``available`` is False and callers
+    should fall back to a short polling interval.
+    """
+
+    # How many seconds of notification history to keep for late waiters
+    HISTORY_SECONDS = 3600
+
+    def __init__(self, connect_kwargs, reconnect_delay=5, connect=None):
+        self.connect_kwargs = dict(connect_kwargs)
+        self.reconnect_delay = reconnect_delay
+        # Looked up at call time so psycopg2.connect can be swapped out (see benchmarks/)
+        self._connect = connect or (lambda **kwargs: psycopg2.connect(**kwargs))
+
+        self._lock = threading.Lock()
+        # (unique_id, step) -> (change count, time of last change)
+        self._versions = {}
+        # (unique_id, step) -> Event shared by the sessions currently waiting on it
+        self._events = {}
+        # Callbacks invoked with (unique_id, step) for every notification
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.available = False
+        self.notifications = 0
+
+    def start(self):
+        """Start the listener thread if it is not already running"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="completion-notifier", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.reconnect_delay + 1)
+
+    def add_listener(self, callback):
+        """Call ``callback(unique_id, step)`` from the listener thread on every notification"""
+        self._listeners.append(callback)
+
+    def version(self, unique_id, step):
+        """Number of notifications seen so far for a (unique_id, step)"""
+        with self._lock:
+            return self._versions.get((str(unique_id), step), (0, 0))[0]
+
+    def wait(self, unique_id, step, since, timeout):
+        """Block until the row changes after ``since`` or ``timeout`` elapses.
+
+        Returns True if a notification arrived, False on timeout.
+        """
+        key = (str(unique_id), step)
+        with self._lock:
+            if self._versions.get(key, (0, 0))[0] != since:
+                return True
+            event = self._events.setdefault(key, threading.Event())
+        return event.wait(timeout)
+
+    def notify(self, unique_id, step):
+        """Record a change for (unique_id, step) and wake its waiters"""
+        key = (str(unique_id), step)
+        now = time.monotonic()
+        with self._lock:
+            count = self._versions.get(key, (0, 0))[0]
+            self._versions[key] = (count + 1, now)
+            event = self._events.pop(key, None)
+            self.notifications += 1
+            if len(self._versions) > 1000:
+                cutoff = now - self.HISTORY_SECONDS
+                self._versions = {k: v for k, v in self._versions.items() if v[1] >= cutoff}
+        if event is not None:
+            event.set()
+        for callback in self._listeners:
+            try:
+                callback(unique_id, step)
+            except Exception:
+                logger.exception("Notification listener failed")
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect(**self.connect_kwargs)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = %s", (TRIGGER_NAME,))
+                    has_trigger = cur.fetchone() is not None
+                    cur.execute(f"LISTEN {CHANNEL}")
+                if not has_trigger:
+                    logger.warning("Trigger %s is missing; sessions will keep polling", TRIGGER_NAME)
+                self.available = has_trigger
+                self._listen(conn)
+            except Exception:
+                logger.exception("Completion listener lost its connection; polling until it reconnects")
+            finally:
+                self.available = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(self.reconnect_delay)
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            # Wake up periodically so stop() is honoured even when the channel is quiet
+            if select.select([conn], [], [], 5) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notification = conn.notifies.pop(0)
+                try:
+                    message = json.loads(notification.payload)
+                    self.notify(message["unique_id"], message["step"])
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Ignoring malformed notification: %r", notification.payload)
@@ -0,0 +1,348 @@
+"""Declarative pipeline step definitions and a scheduler that runs them concurrently"""
+import logging
+import threading
+import time
+import uuid
+
+import admission
+import codec
+import incremental
+import jobs
+import metrics
+from samples import generate_sample_step4_data, generate_sample_step5_data
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookError(Exception):
+    """Raised when an n8n webhook does not return a usable response"""
+
+
+# Choices offered by the step 1 form
+DATA_SOURCES = [
+    "iqvia_xpo_rx",
+    "semarchy_cm_pub_m_hcp_profile",
+    "semarchy_cm_pub_x_address",
+    "zip_territory",
+    "semarchy_cm_pub_x_hcp_address",
+]
+
+USE_CASES = [
+    "Field Reporting",
+    "IC Operations",
+    "Segmentation",
+]
+
+
+def build_form_payload(data_sources, use_case, business_rules=()):
+    """Step 1 form payload, sent to the step 2 webhook; blank business rules are dropped"""
+    return {
+        "data_sources": list(data_sources),
+        "use_case": use_case,
+        "business_rules": [rule for rule in business_rules if rule.strip()],
+    }
+
+
+def build_step3_payload(form_payload):
+    """Profiling payload: the staging tables for the selected data sources"""
+    data_sources = form_payload.get("data_sources", [])
+    table_names = [f"stg_{source}" for source in data_sources]
+    return {"table_name": table_names}
+
+
+def build_step4_payload(form_payload):
+    """Fitness check payload as per the step 4 webhook schema"""
+    data_sources = form_payload.get("data_sources", [])
+    table_names = [f"stg_{source}" for source in data_sources]
+    return [{
+        "table_name": table_names,
+        "usecase_name": form_payload.get("use_case", ""),
+        "business_rules": form_payload.get("business_rules", [])
+    }]
+
+
+def build_step5_payload(step3_payload):
+    """Data quality rules use the same payload as Step 3"""
+    return step3_payload
+
+
+def build_step6_payload(step5_payload):
+    """Integration mapping uses the same payload as Step 5"""
+    return step5_payload
+
+
+def call_step_webhook(client, step, payload, generate_sample):
+    """Call a step webhook and return (response_data, error_message).
+
+    Runs on a background worker, so it must not use any st.* APIs. Falls back to
+    the step's sample data when the webhook fails, but lets admission.Rejected
+    propagate so the page can ask the user to retry instead.
+    """
+    step_label = f"Step {step[-1]}"
+
+    def fallback():
+        metrics.increment("datagpt_sample_fallbacks_total", step=step)
+        return generate_sample()
+
+    try:
+        response = client.post(step, payload)
+
+        if response.status_code == 200:
+            if response.text.strip():
+                try:
+                    with metrics.span("decode", step=step):
+                        return codec.loads(response.content), None
+                except codec.JSONDecodeError:
+                    return fallback(), f"Invalid JSON response from webhook: {response.text}"
+            return fallback(), "Webhook returned an empty response"
+        return fallback(), f"{step_label} webhook failed: {response.status_code} - {response.text}"
+    except admission.Rejected:
+        raise
+    except Exception as e:
+        return fallback(), f"Exception during {step_label} webhook call: {str(e)}"
+
+
+def request_unique_id(client, step, payload):
+    """Start an asynchronous n8n workflow and return the uniqueID it reports"""
+    response = client.post(step, payload)
+    if response.status_code != 200 or not response.text.strip():
+        raise WebhookError(f"Webhook returned an error status: {response.status_code} - {response.text}")
+    try:
+        # Assuming webhook returns {"uniqueID": "some-unique-id"}
+        unique_id_response = codec.loads(response.content)
+    except codec.JSONDecodeError:
+        raise WebhookError(f"Invalid JSON response from webhook: {response.text}")
+    if "uniqueID" not in unique_id_response:
+        raise WebhookError("Webhook response doesn't contain uniqueID")
+    return unique_id_response["uniqueID"]
+
+
+class PipelineServices:
+    """Shared clients a step needs to execute"""
+
+    def __init__(self, webhooks, poller, cache=None, inflight=None):
+        self.webhooks = webhooks
+        self.poller = poller
+        self.cache = cache
+        self.inflight = inflight
+
+
+class StepSpec:
+    """One pipeline step: the context values it needs and how to build and run it.
+
+    When launched the step adds ``<name>_payload`` to the run context; when its
+    job finishes it adds ``<name>_result``. A step is launched as soon as every
+    name in ``requires`` is present in the context.
+    """
+
+    def __init__(self, name, requires, build_payload, run):
+        self.name = name
+        self.requires = tuple(requires)
+        self.build_payload = build_payload
+        self.run = run
+
+
+# Steps that run as asynchronous n8n jobs, and the step name their results are stored under
+RESULT_STEPS = {"step3": "profiling", "step6": "integration_mapping"}
+
+
+def start_async_step(services, step, payload):
+    """Start the n8n job for step 3 / step 6 and return its uniqueID.
+
+    An identical payload already in flight, here or on another replica, is
+    joined instead of triggering a second webhook call. This process's poller
+    collects the result in the background either way.
+    """
+    def start():
+        return request_unique_id(services.webhooks, step, payload)
+
+    unique_id = start() if services.inflight is None else services.inflight.do(step, payload, start)
+    services.poller.register(unique_id, RESULT_STEPS[step])
+    return unique_id
+
+
+def cached_response(services, step, payload):
+    """Previously stored response for this exact payload, or None"""
+    return services.cache.get(step, payload) if services.cache is not None else None
+
+
+def _cached_step_webhook(services, step, payload, generate_sample):
+    cached = cached_response(services, step, payload)
+    if cached is not None:
+        return cached, None
+
+    def call():
+        response_data, error = call_step_webhook(services.webhooks, step, payload, generate_sample)
+        # Never cache the sample data served when the webhook failed
+        if error is None and services.cache is not None:
+            services.cache.set(step, payload, response_data)
+        return response_data, error
+
+    def lookup():
+        cached = cached_response(services, step, payload)
+        return (cached, None) if cached is not None else None
+
+    if services.inflight is None or services.cache is None:
+        return call()
+    # Job handles live in one process, so the same run opened on another replica
+    # submits its own job; that job waits for this call and reads the shared cache
+    return services.inflight.do_cached(step, payload, call, lookup)
+
+
+def run_step3(services, payload, reused=None):
+    """Start profiling and return its uniqueID, or None when the result is already cached.
+
+    Tables in ``reused`` (see incremental.py) keep the previous run's tags and
+    are left out of the job; None is also returned when that covers them all.
+    """
+    if cached_response(services, "step3", payload) is not None:
+        return None
+    if reused:
+        if not incremental.pending(payload, reused):
+            return None
+        return start_async_step(services, "step3", incremental.request(payload, reused))
+    return start_async_step(services, "step3", payload)
+
+
+def run_step4(services, payload):
+    """Fitness check; returns (response_data, error_message)"""
+    return _cached_step_webhook(services, "step4", payload, generate_sample_step4_data)
+
+
+def run_step5(services, payload, reused=None):
+    """Data quality rule recommendation; returns (response_data, error_message).
+
+    Tables in ``reused`` (see incremental.py) keep the previous run's rules;
+    only the other tables are sent to the webhook.
+    """
+    if not reused:
+        return _cached_step_webhook(services, "step5", payload, generate_sample_step5_data)
+    cached = cached_response(services, "step5", payload)
+    if cached is not None:
+        return cached, None
+    response_data = None
+    if incremental.pending(payload, reused):
+        response_data, error = _cached_step_webhook(
+            services, "step5", incremental.request(payload, reused), generate_sample_step5_data
+        )
+        if error is not None:
+            # Sample rules stand in for the pending tables only; the reused ones keep theirs
+            return incremental.merge("step5", payload, reused, response_data), error
+    merged = incremental.merge("step5", payload, reused, response_data)
+    if services.cache is not None:
+        services.cache.set("step5", payload, merged)
+    return merged, None
+
+
+def run_step6(services, payload):
+    """Start integration mapping and return its uniqueID, or None when already cached"""
+    if cached_response(services, "step6", payload) is not None:
+        return None
+    return start_async_step(services, "step6", payload)
+
+
+# None of steps 4-6 needs an earlier step's result, only its payload, so all of
+# them start as soon as the step 1 form is submitted
+PIPELINE = [
+    StepSpec("step3", ["form"], lambda ctx: build_step3_payload(ctx["form"]), run_step3),
+    StepSpec("step4", ["form"], lambda ctx: build_step4_payload(ctx["form"]), run_step4),
+    StepSpec("step5", ["step3_payload"], lambda ctx: build_step5_payload(ctx["step3_payload"]), run_step5),
+    StepSpec("step6", ["step5_payload"], lambda ctx: build_step6_payload(ctx["step5_payload"]), run_step6),
+]
+
+
+class PipelineRun:
+    """State of one scheduled pipeline run"""
+
+    def __init__(self, run_id, form_payload, reused=None):
+        self.id = run_id
+        self.created_at = time.time()
+        self.context = {"form": form_payload}
+        # step name -> {table: items} carried over from the previous run (see incremental.py)
+        self.reused = reused or {}
+        # step name -> job id on the JobRunner
+        self.jobs = {}
+
+
+class PipelineScheduler:
+    """Launches every step whose inputs are ready on the shared JobRunner.
+
+    The numbered pages look up the step's job with ``job_for`` and simply pick
+    up its result, which is usually already there by the time the user gets to
+    the page.
+    """
+
+    def __init__(self, runner, services, steps=PIPELINE, run_ttl=3600):
+        self.runner = runner
+        self.services = services
+        self.steps = list(steps)
+        self.run_ttl = run_ttl
+        self._lock = threading.Lock()
+        self._runs = {}
+
+    def start(self, form_payload, reused=None):
+        """Schedule a run for a submitted step 1 form and return its id.
+
+        ``reused`` maps step 3 / step 5 to the tables whose previous results
+        carry over, so only the other tables are sent to those webhooks.
+        """
+        self._expire()
+        run = PipelineRun(uuid.uuid4().hex, form_payload, reused)
+        with self._lock:
+            self._runs[run.id] = run
+        self._advance(run)
+        return run.id
+
+    def get(self, run_id):
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def job_for(self, run_id, step, payload):
+        """Job id of ``step`` in the run, provided it was launched with ``payload``"""
+        run = self.get(run_id)
+        if run is None:
+            return None
+        with self._lock:
+            if run.context.get(f"{step}_payload") != payload:
+                return None
+            return run.jobs.get(step)
+
+    def _advance(self, run):
+        # Launching a step publishes its payload, which may make further steps ready
+        launched = True
+        while launched:
+            launched = False
+            for spec in self.steps:
+                with self._lock:
+                    if spec.name in run.jobs or not all(name in run.context for name in spec.requires):
+                        continue
+                    payload = spec.build_payload(run.context)
+                    run.context[f"{spec.name}_payload"] = payload
+                    # Reserve the slot so a concurrent _advance does not launch it twice
+                    run.jobs[spec.name] = None
+                kwargs = {"reused": run.reused[spec.name]} if run.reused.get(spec.name) else {}
+                try:
+                    job_id = self.runner.submit(
+                        spec.name, spec.run, self.services, payload,
+                        on_done=lambda job, spec=spec: self._on_done(run, spec, job), **kwargs
+                    )
+                except jobs.JobQueueFull:
+                    # The page will make the call itself when the user gets there
+                    logger.warning("Not scheduling %s for run %s: job queue is full", spec.name, run.id)
+                    job_id = None
+                with self._lock:
+                    run.jobs[spec.name] = job_id
+                launched = True
+
+    def _on_done(self, run, spec, job):
+        if job.state == jobs.DONE:
+            with self._lock:
+                run.context[f"{spec.name}_result"] = job.result
+            self._advance(run)
+
+    def _expire(self):
+        cutoff = time.time() - self.run_ttl
+        with self._lock:
+            for run_id, run in list(self._runs.items()):
+                if run.created_at < cutoff:
+                    del self._runs[run_id]
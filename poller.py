@@ -0,0 +1,285 @@
+"""App-wide poller that batches every pending n8n job into a single results query"""
+import logging
+import threading
+import time
+
+import psycopg2.extensions
+
+import metrics
+from db import RESULTS_TABLE
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("COMPLETED", "ERROR")
+
+# Status of a row holding one chunk of a job's output (e.g. one profiled table)
+# that n8n wrote before the job as a whole finished
+PARTIAL = "PARTIAL"
+
+# One round trip for every outstanding (unique_id, step) pair. The payload is
+# only shipped for completed and partial rows; in-flight rows just report their
+# status, and completed rows of projected steps are read page by page through
+# results.py. Each row is identified by its partition and ctid; PARTIAL rows
+# whose reference was already fetched are not sent again. Unlike a created_at
+# cursor this cannot skip a row whose transaction commits late, and it works
+# on a table that predates the managed schema.
+BATCH_QUERY = f"""
+SELECT unique_id, step, status,
+       CASE WHEN status = '{PARTIAL}'
+              OR (status = 'COMPLETED' AND NOT step = ANY(%s::text[]))
+            THEN response_data::text END AS response_data,
+       tableoid::text || ':' || ctid::text AS row_ref
+FROM {RESULTS_TABLE}
+WHERE unique_id = ANY(%s) AND step = ANY(%s)
+  AND (status <> '{PARTIAL}' OR NOT (tableoid::text || ':' || ctid::text) = ANY(%s::text[]))
+"""
+
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class JobResult:
+    """Terminal outcome of an n8n job as read from the results table.
+
+    ``response_data`` is the raw UTF-8 bytes of the payload, ready for codec.loads.
+    """
+
+    def __init__(self, status, response_data=None):
+        self.status = status
+        self.response_data = response_data
+
+    def __repr__(self):
+        return f"JobResult(status={self.status!r})"
+
+
+class ResultPoller:
+    """Single background thread that polls all outstanding (unique_id, step) pairs.
+
+    Sessions ``register`` the job they are waiting on and then ``wait`` on its
+    mailbox slot, calling ``release`` once they have consumed the result.
+    Several sessions may wait on the same job, so a released result stays in
+    the mailbox for ``release_grace`` seconds before it is dropped.
+
+    Each cycle the poller fetches status and payload for every registered job
+    with one query and delivers terminal results to the mailbox, so database
+    load does not grow with the number of waiting sessions. Rows with status
+    PARTIAL carry a chunk of the output written before the job finished; each
+    is fetched once, collected in arrival order and exposed through
+    ``partials`` so pages can show results incrementally. For steps in
+    ``projected_steps`` the completed payload is not fetched at all; their
+    JobResult has ``response_data`` None and pages read the payload through
+    results.py instead. ``wake()`` triggers an immediate cycle (used by the
+    LISTEN/NOTIFY listener).
+    """
+
+    def __init__(self, pool, interval=5, idle_interval=30, notifier=None,
+                 max_pending_age=7200, mailbox_ttl=3600, release_grace=60, projected_steps=()):
+        self.pool = pool
+        # Poll every `interval` seconds, or every `idle_interval` seconds as a safety
+        # net while the notifier is pushing changes to us
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.notifier = notifier
+        self.max_pending_age = max_pending_age
+        self.mailbox_ttl = mailbox_ttl
+        self.release_grace = release_grace
+        self.projected_steps = list(projected_steps)
+
+        self._lock = threading.Lock()
+        # (str(unique_id), step) -> (unique_id as submitted, registered at)
+        self._pending = {}
+        # (str(unique_id), step) -> (JobResult, time it expires)
+        self._mailbox = {}
+        # (str(unique_id), step) -> latest non-terminal status
+        self._statuses = {}
+        # (str(unique_id), step) -> {row reference: raw response_data} of each PARTIAL row, in arrival order
+        self._partials = {}
+        # (str(unique_id), step) -> Event set when a result lands in the mailbox
+        self._events = {}
+        # Callbacks invoked with (unique_id, step, JobResult) when a job finishes
+        self._listeners = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_error = None
+        self._stats = {"cycles": 0, "queries": 0, "jobs_polled": 0, "delivered": 0, "errors": 0}
+
+    def start(self):
+        """Start the poller thread if it is not already running"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="result-poller", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def wake(self, *args):
+        """Run the next poll cycle immediately"""
+        self._wake.set()
+
+    def add_listener(self, callback):
+        """Call ``callback(unique_id, step, result)`` from the poller thread when a job finishes"""
+        self._listeners.append(callback)
+
+    def register(self, unique_id, step):
+        """Add a job to the set polled each cycle (idempotent)"""
+        key = (str(unique_id), step)
+        with self._lock:
+            if key not in self._pending and key not in self._mailbox:
+                self._pending[key] = (unique_id, time.monotonic())
+                self._wake.set()
+
+    def release(self, unique_id, step):
+        """Stop polling a job; its result is dropped once the release grace period ends"""
+        key = (str(unique_id), step)
+        expires_at = time.monotonic() + self.release_grace
+        with self._lock:
+            self._pending.pop(key, None)
+            self._statuses.pop(key, None)
+            self._partials.pop(key, None)
+            if key in self._mailbox:
+                result, current_expiry = self._mailbox[key]
+                self._mailbox[key] = (result, min(current_expiry, expires_at))
+
+    def result(self, unique_id, step):
+        """The job's terminal JobResult from the mailbox, or None if it is not done"""
+        with self._lock:
+            entry = self._mailbox.get((str(unique_id), step))
+        return entry[0] if entry else None
+
+    def wait(self, unique_id, step, timeout):
+        """Register the job if needed and block until its result arrives or timeout elapses.
+
+        Returns the JobResult, or None while the job is still running.
+        """
+        self.register(unique_id, step)
+        key = (str(unique_id), step)
+        with self._lock:
+            if key in self._mailbox:
+                event = None
+            else:
+                event = self._events.setdefault(key, threading.Event())
+        if event is not None:
+            event.wait(timeout)
+        return self.result(unique_id, step)
+
+    def partials(self, unique_id, step):
+        """Raw response_data of every PARTIAL row seen so far for the job, oldest first"""
+        with self._lock:
+            return list(self._partials.get((str(unique_id), step), {}).values())
+
+    def status(self, unique_id, step):
+        """Latest in-flight status seen for the job, if any"""
+        with self._lock:
+            return self._statuses.get((str(unique_id), step))
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["pending"] = len(self._pending)
+            snapshot["undelivered"] = len(self._mailbox)
+        return snapshot
+
+    def samples(self):
+        """Pending jobs, for metrics.register_collector; polls are counted as they happen"""
+        return [("datagpt_poller_pending_jobs", self.stats()["pending"], {})]
+
+    def poll_once(self):
+        """Fetch and dispatch results for every registered job in one query"""
+        now = time.monotonic()
+        with self._lock:
+            # Forget jobs nobody is waiting on any more
+            for key, (_, registered_at) in list(self._pending.items()):
+                if now - registered_at > self.max_pending_age:
+                    del self._pending[key]
+                    self._partials.pop(key, None)
+            for key, (_, expires_at) in list(self._mailbox.items()):
+                if now > expires_at:
+                    del self._mailbox[key]
+                    self._partials.pop(key, None)
+            pending = dict(self._pending)
+            seen_refs = [ref for key in pending for ref in self._partials.get(key, ())]
+        if not pending:
+            return
+
+        unique_ids = [unique_id for unique_id, _ in pending]
+        steps = [step for _, step in pending]
+        metrics.increment("datagpt_polls_total")
+        with metrics.span("db_fetch", query="poll"), self.pool.connection() as conn, conn.cursor() as cur:
+            # Read text columns as bytes so payloads reach codec.loads without being decoded to str first
+            if isinstance(cur, psycopg2.extensions.cursor):
+                psycopg2.extensions.register_type(psycopg2.extensions.BYTES, cur)
+            cur.execute(BATCH_QUERY, (self.projected_steps, unique_ids, steps, seen_refs))
+            rows = cur.fetchall()
+
+        # A job may have several rows (e.g. PROCESSING then COMPLETED); prefer
+        # COMPLETED, then ERROR, then whatever in-flight status is reported
+        rank = {"COMPLETED": 2, "ERROR": 1}
+        best = {}
+        chunks = {}
+        for unique_id, step, status, response_data, row_ref in rows:
+            unique_id, step, status = _text(unique_id), _text(step), _text(status)
+            key = (str(unique_id), step)
+            if key not in pending:
+                continue
+            if status == PARTIAL and response_data is not None:
+                chunks.setdefault(key, []).append((_text(row_ref), response_data))
+            if key not in best or rank.get(status, 0) > rank.get(best[key][0], 0):
+                best[key] = (status, response_data)
+
+        delivered = []
+        finished = []
+        waits = []
+        with self._lock:
+            self._stats["cycles"] += 1
+            self._stats["queries"] += 1
+            self._stats["jobs_polled"] += len(pending)
+            for key, raw_chunks in chunks.items():
+                if key in self._pending:
+                    self._partials.setdefault(key, {}).update(raw_chunks)
+            for key, (status, response_data) in best.items():
+                if status in TERMINAL_STATUSES:
+                    original, registered_at = self._pending.pop(key, (None, None))
+                    if original is not None:
+                        waits.append((key[1], now - registered_at))
+                        result = JobResult(status, response_data)
+                        self._statuses.pop(key, None)
+                        self._mailbox[key] = (result, now + self.mailbox_ttl)
+                        self._stats["delivered"] += 1
+                        delivered.append(self._events.pop(key, None))
+                        finished.append((original, key[1], result))
+                elif key in self._pending:
+                    self._statuses[key] = status
+        for step, waited in waits:
+            # Measured from registration, so it includes n8n's run time and the poll delay
+            metrics.observe(metrics.SPAN_SECONDS, waited, span="job_wait", step=step)
+        for event in delivered:
+            if event is not None:
+                event.set()
+        for unique_id, step, result in finished:
+            for callback in self._listeners:
+                try:
+                    callback(unique_id, step, result)
+                except Exception:
+                    logger.exception("Result listener failed")
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Clear before polling so a wake() during the query triggers another cycle
+            self._wake.clear()
+            try:
+                self.poll_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                with self._lock:
+                    self._stats["errors"] += 1
+                logger.exception("Result poll failed")
+            pushed = self.notifier is not None and self.notifier.available
+            self._wake.wait(self.idle_interval if pushed else self.interval)
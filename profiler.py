@@ -0,0 +1,205 @@
+"""Opt-in sampling profiler for script reruns, with flamegraph dumps and a rolling hot-function summary
+
+Turned on for every session with DATAGPT_PROFILE=1, or for one session by
+opening the app with ``?profile=1``. Each profiled rerun of a step page is
+sampled from a background thread every DATAGPT_PROFILE_INTERVAL seconds. The
+samples are written under DATAGPT_PROFILE_DIR/<step>/ in two formats:
+
+    <time>-<n>.collapsed         folded stacks, for flamegraph.pl / inferno / speedscope
+    <time>-<n>.speedscope.json   speedscope's own format (https://www.speedscope.app)
+
+summary.json in the same directory holds the hottest functions for each step
+over its last reruns.
+"""
+import collections
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("DATAGPT_PROFILE", "").lower() in ("1", "true", "yes", "on")
+PROFILE_DIR = os.environ.get("DATAGPT_PROFILE_DIR", ".profiles")
+# Seconds between samples; finer intervals cost more GIL time on the sampled thread
+INTERVAL = float(os.environ.get("DATAGPT_PROFILE_INTERVAL", "0.005"))
+# Profiles kept per step before the oldest are deleted
+KEEP = 50
+# Reruns per step the hot-function summary covers
+WINDOW = 100
+
+
+def _label(code):
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """Samples one thread's Python stack at a fixed interval from a daemon thread.
+
+    Stacks are recorded root first, starting at ``base`` (a frame of the
+    sampled thread) so the Streamlit script runner's own frames are left out.
+    """
+
+    def __init__(self, thread_id, base=None, interval=INTERVAL):
+        self.thread_id = thread_id
+        self.base = base
+        self.interval = interval
+        # (frame label, ...) root first -> samples
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="rerun-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame.f_code))
+                if frame is self.base:
+                    break
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+
+def collapsed(stacks):
+    """Folded-stack text: one ``root;child;leaf count`` line per distinct stack"""
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+def speedscope(stacks, name, interval=INTERVAL):
+    """A speedscope 'sampled' profile document, weighted in milliseconds"""
+    frames = []
+    index = {}
+    samples = []
+    weights = []
+    for stack, count in sorted(stacks.items()):
+        sample = []
+        for label in stack:
+            if label not in index:
+                index[label] = len(frames)
+                frames.append({"name": label})
+            sample.append(index[label])
+        samples.append(sample)
+        weights.append(count * interval * 1000)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled", "name": name, "unit": "milliseconds",
+            "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+        }],
+        "name": name,
+        "exporter": "datagpt profiler",
+    }
+
+
+class HotSpots:
+    """Self and inclusive sample counts per function over each step's last ``window`` reruns"""
+
+    def __init__(self, window=WINDOW):
+        self._lock = threading.Lock()
+        # step -> deque of (self counts, inclusive counts, samples) per rerun
+        self._reruns = collections.defaultdict(lambda: collections.deque(maxlen=window))
+
+    def add(self, step, stacks):
+        own = collections.Counter()
+        inclusive = collections.Counter()
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+            # A recursive function counts once per sample
+            for label in set(stack):
+                inclusive[label] += count
+        with self._lock:
+            self._reruns[step].append((own, inclusive, sum(stacks.values())))
+
+    def summary(self, top=20):
+        """step -> {"reruns", "samples", "functions": [{"function", "self", "total"}]} hottest first"""
+        with self._lock:
+            reruns = {step: list(entries) for step, entries in self._reruns.items()}
+        found = {}
+        for step, entries in reruns.items():
+            own = collections.Counter()
+            inclusive = collections.Counter()
+            for rerun_own, rerun_inclusive, _ in entries:
+                own.update(rerun_own)
+                inclusive.update(rerun_inclusive)
+            samples = sum(entry[2] for entry in entries)
+            found[step] = {
+                "reruns": len(entries),
+                "samples": samples,
+                "functions": [
+                    {"function": label, "self": count / samples if samples else 0.0,
+                     "total": inclusive[label] / samples if samples else 0.0}
+                    for label, count in own.most_common(top)
+                ],
+            }
+        return found
+
+
+HOTSPOTS = HotSpots()
+_counter = collections.Counter()
+_lock = threading.Lock()
+
+
+def _write(step, stacks, interval, directory):
+    step_dir = os.path.join(directory, step)
+    os.makedirs(step_dir, exist_ok=True)
+    with _lock:
+        _counter[step] += 1
+        name = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{os.getpid()}-{_counter[step]}"
+    with open(os.path.join(step_dir, f"{name}.collapsed"), "w", encoding="utf-8") as f:
+        f.write(collapsed(stacks))
+    with open(os.path.join(step_dir, f"{name}.speedscope.json"), "w", encoding="utf-8") as f:
+        json.dump(speedscope(stacks, f"{step} {name}", interval), f)
+
+    profiles = sorted(entry for entry in os.listdir(step_dir) if entry.endswith(".collapsed"))
+    for old in profiles[:-KEEP]:
+        for suffix in (".collapsed", ".speedscope.json"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(step_dir, old[:-len(".collapsed")] + suffix))
+
+    tmp = os.path.join(directory, f"summary.json.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(HOTSPOTS.summary(), f, indent=1)
+    os.replace(tmp, os.path.join(directory, "summary.json"))
+
+
+@contextlib.contextmanager
+def profile(step, enabled=None, interval=INTERVAL, directory=PROFILE_DIR):
+    """Sample the calling thread for the duration of the block and save the result for ``step``.
+
+    ``enabled`` defaults to DATAGPT_PROFILE. Streamlit's rerun and stop
+    exceptions end the block early, but the samples taken so far are kept.
+    Blocks shorter than one interval usually leave no samples and write nothing.
+    """
+    if not (ENABLED if enabled is None else enabled):
+        yield None
+        return
+    # The frame that entered the with-block; contextmanager adds one frame in between
+    sampler = Sampler(threading.get_ident(), base=sys._getframe(2), interval=interval).start()
+    try:
+        yield sampler
+    finally:
+        stacks = sampler.stop()
+        if stacks:
+            HOTSPOTS.add(step, stacks)
+            try:
+                _write(step, stacks, interval, directory)
+            except OSError as e:
+                logger.warning("Could not save the %s profile: %s", step, e)
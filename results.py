@@ -0,0 +1,257 @@
+"""Server-side projection and paging of the JSON payloads in n8n_processing_results"""
+import codec
+from db import RESULTS_TABLE
+
+
+class Column:
+    """One displayed column, read from the first of ``paths`` that is present.
+
+    ``source`` is ``"item"`` for fields of an element of the payload's ``data``
+    array, or ``"child"`` for fields of an element of the view's nested array.
+    ``categorical`` marks columns with few distinct values, which normalize
+    stores as pandas categoricals.
+    """
+
+    def __init__(self, label, paths, default="", source="item", categorical=False):
+        self.label = label
+        self.paths = [path.split(".") for path in paths]
+        self.default = default
+        self.source = source
+        self.categorical = categorical
+
+
+class View:
+    """Flat projection of a step's ``data`` array into the columns a page displays.
+
+    With ``children`` set, the view has one row per element of that nested
+    array (e.g. one row per column tag) instead of one row per item.
+    """
+
+    def __init__(self, name, step, columns, children=None):
+        self.name = name
+        self.step = step
+        self.columns = list(columns)
+        self.children = children
+
+    @property
+    def labels(self):
+        return [column.label for column in self.columns]
+
+    @property
+    def filterable(self):
+        """Labels of the categorical columns, which pages offer as filters"""
+        return [column.label for column in self.columns if column.categorical]
+
+
+TABLE_NAME_PATHS = ["table_name", "staging_table_name"]
+
+TABLE_TAGS = View("table_tags", "profiling", [
+    Column("table_name", TABLE_NAME_PATHS, "Unknown", categorical=True),
+    Column("classification", ["classification"], "Unknown", categorical=True),
+    Column("summary", ["summary"], "No summary"),
+])
+
+COLUMN_TAGS = View("column_tags", "profiling", [
+    Column("table_name", TABLE_NAME_PATHS, "Unknown", categorical=True),
+    Column("column_name", ["column_name"], "Unknown", source="child"),
+    Column("tag", ["tag"], "", source="child", categorical=True),
+    Column("description", ["description"], "No description", source="child"),
+], children="column_tags")
+
+INTEGRATION_MAPPINGS = View("integration_mappings", "integration_mapping", [
+    Column("Integration Table Name", ["integration_table_name"]),
+    Column("Primary Source Staging Table", ["primary_source_staging_table"], categorical=True),
+    Column("Secondary Source Staging Table", ["secondary_source_staging_table"], categorical=True),
+    Column("Justification", ["justification"]),
+    Column("SQL Query", ["sql_query"]),
+])
+
+VIEWS = {view.name: view for view in (TABLE_TAGS, COLUMN_TAGS, INTEGRATION_MAPPINGS)}
+
+
+class Page:
+    """One page of a view: ``rows`` are dicts keyed by column label"""
+
+    def __init__(self, rows, total, offset, limit):
+        self.rows = rows
+        self.total = total
+        self.offset = offset
+        self.limit = limit
+
+    def __repr__(self):
+        return f"Page(offset={self.offset}, rows={len(self.rows)}, total={self.total})"
+
+
+def _column_sql(column, params):
+    alias = "e.item" if column.source == "item" else "c.child"
+    exprs = []
+    for path in column.paths:
+        exprs.append(f"{alias} #>> %s")
+        params.append(path)
+    params.append(column.default)
+    return f"COALESCE({', '.join(exprs)}, %s)"
+
+
+def _where_sql(view, filters, search, params):
+    clauses = []
+    for label, value in (filters or {}).items():
+        if label not in view.labels:
+            raise ValueError(f"Unknown column for view {view.name}: {label}")
+        clauses.append(f"c{view.labels.index(label)} = %s")
+        params.append(value)
+    if search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        haystack = ", ".join(f"c{i}" for i in range(len(view.columns)))
+        clauses.append(f"concat_ws(' ', {haystack}) ILIKE %s")
+        params.append(f"%{escaped}%")
+    return f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+
+def _items_sql(view, params):
+    # Only the projected text columns leave the database; the blob is unpacked
+    # server-side with jsonb_array_elements
+    children = ""
+    child_ord = "0"
+    if view.children:
+        children = (
+            "CROSS JOIN LATERAL jsonb_array_elements("
+            "CASE WHEN jsonb_typeof(e.item -> %s) = 'array' THEN e.item -> %s ELSE '[]'::jsonb END"
+            ") WITH ORDINALITY AS c(child, ord)"
+        )
+        child_ord = "c.ord"
+    columns = ", ".join(f"{_column_sql(column, params)} AS c{i}" for i, column in enumerate(view.columns))
+    if view.children:
+        params.extend([view.children, view.children])
+    return f"""
+        SELECT {columns}, e.ord AS ord, {child_ord} AS child_ord
+        FROM {RESULTS_TABLE} r
+        CROSS JOIN LATERAL jsonb_array_elements(
+            CASE WHEN jsonb_typeof(r.response_data::jsonb -> 'data') = 'array'
+                 THEN r.response_data::jsonb -> 'data' ELSE '[]'::jsonb END
+        ) WITH ORDINALITY AS e(item, ord)
+        {children}
+        WHERE r.unique_id = %s AND r.step = %s AND r.status = 'COMPLETED'
+    """
+
+
+def fetch_page(conn, view, unique_id, offset=0, limit=50, filters=None, search=None,
+               sort_by=None, descending=False):
+    """One page of ``view`` over the job's completed payload, projected, filtered and sorted in PostgreSQL.
+
+    ``filters`` maps column labels to exact values; ``search`` is a
+    case-insensitive substring matched against every column. Rows keep the
+    payload's order unless ``sort_by`` names a column.
+    """
+    params = []
+    items = _items_sql(view, params)
+    params.extend([unique_id, view.step])
+    where = _where_sql(view, filters, search, params)
+    params.extend([limit, offset])
+    order = "ord, child_ord"
+    if sort_by is not None:
+        if sort_by not in view.labels:
+            raise ValueError(f"Unknown column for view {view.name}: {sort_by}")
+        order = f"c{view.labels.index(sort_by)} {'DESC' if descending else 'ASC'}, {order}"
+    query = f"""
+        WITH rows AS ({items})
+        SELECT *, count(*) OVER () AS total
+        FROM rows {where}
+        ORDER BY {order}
+        LIMIT %s OFFSET %s
+    """
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        fetched = cur.fetchall()
+    if fetched:
+        total = fetched[0][-1]
+    elif offset:
+        # Past the last page the window count is unavailable
+        total = count_rows(conn, view, unique_id, filters, search)
+    else:
+        total = 0
+    rows = [dict(zip(view.labels, row[:len(view.columns)])) for row in fetched]
+    return Page(rows, total, offset, limit)
+
+
+def count_rows(conn, view, unique_id, filters=None, search=None):
+    """Number of rows ``view`` has for the job after filtering"""
+    params = []
+    items = _items_sql(view, params)
+    params.extend([unique_id, view.step])
+    where = _where_sql(view, filters, search, params)
+    with conn.cursor() as cur:
+        cur.execute(f"WITH rows AS ({items}) SELECT count(*) FROM rows {where}", params)
+        return cur.fetchone()[0]
+
+
+def distinct_values(conn, view, unique_id, label, limit=500):
+    """Sorted distinct values of one column of ``view`` for the job, for filter choices"""
+    if label not in view.labels:
+        raise ValueError(f"Unknown column for view {view.name}: {label}")
+    params = []
+    items = _items_sql(view, params)
+    params.extend([unique_id, view.step, limit])
+    with conn.cursor() as cur:
+        cur.execute(
+            f"WITH rows AS ({items}) SELECT DISTINCT c{view.labels.index(label)} FROM rows ORDER BY 1 LIMIT %s",
+            params,
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+def table_items(conn, unique_id, step, table_names=None):
+    """Elements of the completed payload's ``data`` array in order, optionally only those for ``table_names``"""
+    params = [unique_id, step]
+    where = ""
+    if table_names is not None:
+        paths = ", ".join("e.item ->> %s" for _ in TABLE_NAME_PATHS)
+        where = f"AND COALESCE({paths}) = ANY(%s)"
+        params.extend(TABLE_NAME_PATHS)
+        params.append(list(table_names))
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT e.item::text
+            FROM {RESULTS_TABLE} r
+            CROSS JOIN LATERAL jsonb_array_elements(
+                CASE WHEN jsonb_typeof(r.response_data::jsonb -> 'data') = 'array'
+                     THEN r.response_data::jsonb -> 'data' ELSE '[]'::jsonb END
+            ) WITH ORDINALITY AS e(item, ord)
+            WHERE r.unique_id = %s AND r.step = %s AND r.status = 'COMPLETED' {where}
+            ORDER BY e.ord
+            """,
+            params,
+        )
+        return [codec.loads(row[0]) for row in cur.fetchall()]
+
+
+def partial_items(raw_chunks):
+    """Table items from the PARTIAL rows n8n writes as each table finishes profiling.
+
+    A chunk is either a single table item or a ``{"data": [...]}`` fragment;
+    a table profiled twice keeps its latest entry.
+    """
+    items = {}
+    for raw in raw_chunks:
+        chunk = codec.loads(raw) if isinstance(raw, (str, bytes)) else raw
+        for item in chunk.get("data", [chunk]) if isinstance(chunk, dict) else chunk:
+            table_name = next((item[key] for key in TABLE_NAME_PATHS if item.get(key)), "Unknown")
+            items[table_name] = item
+    return list(items.values())
+
+
+def item_count(conn, unique_id, step):
+    """Length of the completed payload's ``data`` array, or None if it has none"""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT jsonb_array_length(r.response_data::jsonb -> 'data')
+            FROM {RESULTS_TABLE} r
+            WHERE r.unique_id = %s AND r.step = %s AND r.status = 'COMPLETED'
+              AND jsonb_typeof(r.response_data::jsonb -> 'data') = 'array'
+            LIMIT 1
+            """,
+            (unique_id, step),
+        )
+        row = cur.fetchone()
+    return row[0] if row else None
@@ -0,0 +1,155 @@
+"""Durable pipeline runs: the wizard's payloads, job ids and results checkpointed under a run id
+
+The run id is put in the page URL (``?run=<id>``). Reloading the page,
+reconnecting or landing on another replica then rehydrates the session from
+the store instead of calling the webhooks again. A step whose job was still
+running resumes polling for its uniqueID.
+
+PostgresRunStore keeps runs in the results database (schema migration 4) so
+every replica sees them. SqliteRunStore is a single-host stand-in for local
+development and benchmarks; pick it with DATAGPT_RUN_STORE=sqlite.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import codec
+from db import RUNS_TABLE
+
+BACKEND = os.environ.get("DATAGPT_RUN_STORE", "postgres")
+
+# Session state worth keeping; job ids on the JobRunner are per process and are left out
+PERSISTED_KEYS = (
+    "current_step", "business_rules", "last_payload", "webhook_response", "step2_messages",
+    "pipeline_run_id", "step3_unique_id", "step6_unique_id", "step3_reused", "step5_reused",
+) + tuple(
+    f"step{n}_{field}" for n in range(3, 7) for field in ("payload", "response", "response_hash", "error", "loading")
+)
+
+
+def _digest(value):
+    return hashlib.blake2b(codec.dumps(value), digest_size=16).hexdigest()
+
+
+def changes(saved, state):
+    """(changed keys, digests) of ``state`` against the digests of the last checkpoint.
+
+    Keys removed since then are reported as None, which a store keeps as a
+    tombstone so that loading the run does not bring them back.
+    """
+    digests = {}
+    changed = {}
+    for key in PERSISTED_KEYS:
+        if key not in state:
+            if saved.get(key) is not None:
+                changed[key] = None
+            continue
+        digests[key] = _digest(state[key])
+        if saved.get(key) != digests[key]:
+            changed[key] = state[key]
+    return changed, digests
+
+
+def digests(state):
+    """Digests of a loaded run, so the next checkpoint only writes what changed"""
+    return {key: _digest(value) for key, value in state.items() if value is not None}
+
+
+class SqliteRunStore:
+    """Runs in a SQLite file, shared by every process on the host"""
+
+    def __init__(self, path, ttl=30 * 24 * 3600):
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id TEXT PRIMARY KEY, state TEXT NOT NULL,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def save(self, run_id, changed):
+        """Merge ``changed`` into the run's state, creating the run if needed"""
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so concurrent merges from other processes queue
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT state FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+                state = codec.loads(row[0]) if row else {}
+                state.update(changed)
+                self._conn.execute(
+                    "INSERT INTO runs VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT (run_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                    (run_id, codec.dumps(state).decode("utf-8"), now, now),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load(self, run_id):
+        """The run's state, or None if it does not exist or has expired"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM runs WHERE run_id = ? AND updated_at >= ?", (run_id, time.time() - self.ttl)
+            ).fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def delete(self, run_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+    def expire(self):
+        with self._lock:
+            return self._conn.execute("DELETE FROM runs WHERE updated_at < ?", (time.time() - self.ttl,)).rowcount
+
+
+class PostgresRunStore:
+    """Runs in PostgreSQL; each checkpoint is one upsert that merges the changed keys server-side"""
+
+    def __init__(self, pool, ttl=30 * 24 * 3600):
+        self.pool = pool
+        self.ttl = ttl
+
+    def save(self, run_id, changed):
+        """Merge ``changed`` into the run's state, creating the run if needed"""
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO {RUNS_TABLE} (run_id, state) VALUES (%s, %s::jsonb)
+                ON CONFLICT (run_id) DO UPDATE
+                SET state = {RUNS_TABLE}.state || EXCLUDED.state, updated_at = now()
+                """,
+                (run_id, codec.dumps(changed).decode("utf-8")),
+            )
+
+    def load(self, run_id):
+        """The run's state, or None if it does not exist or has expired"""
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"SELECT state::text FROM {RUNS_TABLE}"
+                " WHERE run_id = %s AND updated_at >= now() - make_interval(secs => %s)",
+                (run_id, self.ttl),
+            )
+            row = cur.fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def delete(self, run_id):
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(f"DELETE FROM {RUNS_TABLE} WHERE run_id = %s", (run_id,))
+
+
+def open_store(pool, directory, backend=BACKEND):
+    """The configured run store; ``directory`` holds the SQLite file for the stand-in"""
+    if backend == "sqlite":
+        return SqliteRunStore(os.path.join(directory, "runs.sqlite3"))
+    if backend == "postgres":
+        return PostgresRunStore(pool)
+    raise ValueError(f"Unknown run store {backend!r}; expected postgres or sqlite")
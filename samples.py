@@ -0,0 +1,96 @@
+"""Canned step responses used when a webhook call fails"""
+
+
+def generate_sample_step3_data(table_names):
+    """Generate sample data for step 3 when the webhook fails"""
+    sample_data = []
+    
+    for table_name in table_names:
+        sample_item = {
+            "table_name": table_name,
+            "classification": "Sample Classification",
+            "summary": f"This is a sample summary for {table_name}",
+            "column_tags": [
+                {
+                    "column_name": "sample_column_1",
+                    "tag": "PII",
+                    "description": "Sample personal identifier"
+                },
+                {
+                    "column_name": "sample_column_2",
+                    "tag": "METRIC",
+                    "description": "Sample metric data"
+                }
+            ]
+        }
+        sample_data.append(sample_item)
+    
+    return sample_data
+
+def generate_sample_step4_data():
+    """Generate sample data for step 4 when the webhook fails"""
+    return {
+        "summary": "Sample summary of findings for the data fitness check.",
+        "missing_attributes": [
+            {
+                "table_name": "stg_sample_table",
+                "column_name": "sample_column",
+                "importance": "High",
+                "impact": "Cannot calculate key metrics without this data"
+            },
+            {
+                "table_name": "stg_sample_table",
+                "column_name": "another_column",
+                "importance": "Medium",
+                "impact": "Reduces accuracy of segmentation"
+            }
+        ]
+    }
+
+def generate_sample_step5_data():
+    """Generate sample data for step 5 when the webhook fails"""
+    return {
+        "parsed": {
+            "data_quality_rules": [
+                {
+                    "table_name": "stg_iqvia_xpo_rx", 
+                    "column_name": "product_id",
+                    "rule_name": "NOT_NULL",
+                    "configuration_information": "Column must not contain NULL values"
+                },
+                {
+                    "table_name": "stg_semarchy_cm_pub_m_hcp_profile", 
+                    "column_name": "hcp_id",
+                    "rule_name": "UNIQUE",
+                    "configuration_information": "Values must be unique"
+                },
+                {
+                    "table_name": "stg_zip_territory", 
+                    "column_name": "zip_code",
+                    "rule_name": "FORMAT_CHECK",
+                    "configuration_information": "Must match pattern: '\\d{5}'"
+                }
+            ]
+        }
+    }
+
+def generate_sample_step6_data():
+    """Generate sample data for step 6 when the webhook fails"""
+    return [
+        {
+            "integration_table_name": "int_sales_retail",
+            "primary_source_staging_table": "stg_iqvia_xpo_rx",
+            "secondary_source_staging_table": "stg_zip_territory",
+            "mapping": [],
+            "sql_query": "SELECT * FROM stg_iqvia_xpo_rx JOIN stg_zip_territory ON zip_code = territory_code",
+            "justification": "This mapping combines sales data with territory information for retail analysis"
+        },
+        {
+            "integration_table_name": "int_hcp_profile",
+            "primary_source_staging_table": "stg_semarchy_cm_pub_m_hcp_profile",
+            "secondary_source_staging_table": "stg_semarchy_cm_pub_x_hcp_address",
+            "mapping": [],
+            "sql_query": "SELECT * FROM stg_semarchy_cm_pub_m_hcp_profile JOIN stg_semarchy_cm_pub_x_hcp_address ON hcp_id = hcp_id",
+            "justification": "This mapping combines HCP profile data with address information"
+        }
+    ]
@@ -0,0 +1,305 @@
+"""Managed schema for n8n_processing_results: migrations, monthly partitions, retention and a startup check
+
+Run ``python schema.py migrate`` once per database (and on deploy), and
+``python schema.py maintain`` daily, e.g. from cron, to create upcoming
+partitions, archive or drop old ones and delete idle runs and expired shared state.
+"""
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+
+import notifier
+from db import DB_CONFIG, RESULTS_TABLE, RUNS_TABLE, STATE_TABLE
+
+logger = logging.getLogger(__name__)
+
+SCHEMA, TABLE = RESULTS_TABLE.split(".")
+MIGRATIONS_TABLE = f"{SCHEMA}.datagpt_schema_migrations"
+LOOKUP_INDEX = f"{TABLE}_lookup_idx"
+LEGACY_PARTITION = f"{TABLE}_legacy"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+# Any constant works; it only has to be the same for every process running migrations
+MIGRATION_LOCK_ID = 72_614_001
+
+# (version, description, SQL) applied in order, each in its own transaction
+MIGRATIONS = [
+    (1, "results table with a created_at timestamp", f"""
+        CREATE TABLE IF NOT EXISTS {RESULTS_TABLE} (
+            unique_id text NOT NULL,
+            step text NOT NULL,
+            status text NOT NULL,
+            response_data text,
+            created_at timestamptz NOT NULL DEFAULT now()
+        ) PARTITION BY RANGE (created_at);
+
+        -- Existing rows take the time of the migration; now() is stable, so this
+        -- does not rewrite the table
+        ALTER TABLE {RESULTS_TABLE} ADD COLUMN IF NOT EXISTS created_at timestamptz NOT NULL DEFAULT now();
+    """),
+    (2, "partition by month on created_at", f"""
+        DO $$
+        BEGIN
+            -- A plain table written before this migration becomes the partition for
+            -- everything up to the end of the current month
+            IF (SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = '{SCHEMA}' AND c.relname = '{TABLE}') = 'r' THEN
+                ALTER TABLE {RESULTS_TABLE} RENAME TO {LEGACY_PARTITION};
+                -- The notification trigger is re-created on the partitioned parent
+                DROP TRIGGER IF EXISTS {notifier.TRIGGER_NAME} ON {SCHEMA}.{LEGACY_PARTITION};
+                CREATE TABLE {RESULTS_TABLE}
+                    (LIKE {SCHEMA}.{LEGACY_PARTITION} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                    PARTITION BY RANGE (created_at);
+                EXECUTE format(
+                    'ALTER TABLE {RESULTS_TABLE} ATTACH PARTITION {SCHEMA}.{LEGACY_PARTITION} '
+                    'FOR VALUES FROM (MINVALUE) TO (%L)',
+                    date_trunc('month', now()) + interval '1 month'
+                );
+            END IF;
+        END $$;
+
+        -- Catches rows whose month has no partition yet, so n8n's inserts never fail
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.{DEFAULT_PARTITION} PARTITION OF {RESULTS_TABLE} DEFAULT;
+    """),
+    (3, "composite index for the poller's lookups", f"""
+        CREATE INDEX IF NOT EXISTS {LOOKUP_INDEX} ON {RESULTS_TABLE} (unique_id, step, status);
+    """),
+    (4, "checkpointed pipeline runs", f"""
+        CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+            run_id text PRIMARY KEY,
+            state jsonb NOT NULL DEFAULT '{{}}'::jsonb,
+            created_at timestamptz NOT NULL DEFAULT now(),
+            updated_at timestamptz NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS datagpt_runs_updated_at_idx ON {RUNS_TABLE} (updated_at);
+    """),
+    (5, "state shared between replicas", f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            namespace text NOT NULL,
+            key text NOT NULL,
+            value jsonb NOT NULL,
+            expires_at timestamptz,
+            PRIMARY KEY (namespace, key)
+        );
+        CREATE INDEX IF NOT EXISTS datagpt_state_expires_at_idx ON {STATE_TABLE} (expires_at);
+    """),
+]
+
+
+def current_version(conn):
+    """Highest applied migration version, or 0 on a fresh database"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s)", (MIGRATIONS_TABLE,))
+        if cur.fetchone()[0] is None:
+            return 0
+        cur.execute(f"SELECT COALESCE(MAX(version), 0) FROM {MIGRATIONS_TABLE}")
+        return cur.fetchone()[0]
+
+
+def migrate(conn):
+    """Apply every pending migration and return the versions applied.
+
+    Concurrent callers are serialised with an advisory lock, so several app
+    instances deploying at once apply each migration exactly once.
+    """
+    applied = []
+    conn.autocommit = False
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+                " version integer PRIMARY KEY, description text NOT NULL,"
+                " applied_at timestamptz NOT NULL DEFAULT now())"
+            )
+        for version, description, sql in MIGRATIONS:
+            with conn, conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+                cur.execute(f"SELECT 1 FROM {MIGRATIONS_TABLE} WHERE version = %s", (version,))
+                if cur.fetchone() is not None:
+                    continue
+                logger.info("Applying migration %s: %s", version, description)
+                cur.execute(sql)
+                cur.execute(
+                    f"INSERT INTO {MIGRATIONS_TABLE} (version, description) VALUES (%s, %s)",
+                    (version, description),
+                )
+            applied.append(version)
+    finally:
+        conn.autocommit = True
+    return applied
+
+
+def _month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(moment):
+    return _month_start(_month_start(moment) + timedelta(days=32))
+
+
+def partitions(conn):
+    """(name, upper bound) of each range partition, oldest first; the bound is None for the default partition.
+
+    pg_get_expr renders the bound in the session's TimeZone, so it is cast
+    back to timestamptz in SQL rather than parsed here, and returned in UTC.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname,
+                   (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \\(''([^'']+)''\\)'))[1]::timestamptz
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            """,
+            (RESULTS_TABLE,),
+        )
+        found = [(name, upper and upper.astimezone(timezone.utc)) for name, upper in cur.fetchall()]
+    bounded = sorted((entry for entry in found if entry[1] is not None), key=lambda entry: entry[1])
+    return bounded + [entry for entry in found if entry[1] is None]
+
+
+def ensure_partitions(conn, months_ahead=2):
+    """Create monthly partitions up to ``months_ahead`` months from now and return their names"""
+    now = datetime.now(timezone.utc)
+    bounded = [upper for _, upper in partitions(conn) if upper is not None]
+    start = max(bounded) if bounded else _month_start(now)
+    target = _month_start(now)
+    for _ in range(months_ahead + 1):
+        target = _next_month(target)
+
+    created = []
+    with conn.cursor() as cur:
+        while start < target:
+            end = _next_month(start)
+            name = f"{TABLE}_p{start:%Y%m}"
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {SCHEMA}.{name} PARTITION OF {RESULTS_TABLE} "
+                "FOR VALUES FROM (%s) TO (%s)",
+                (start, end),
+            )
+            created.append(name)
+            start = end
+    return created
+
+
+def apply_retention(conn, keep_days=90, archive_schema=None):
+    """Detach partitions whose rows are all older than ``keep_days`` days.
+
+    Detached partitions are moved to ``archive_schema`` when one is given and
+    dropped otherwise. Returns the names of the partitions removed.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=keep_days)
+    removed = []
+    with conn.cursor() as cur:
+        if archive_schema:
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}")
+        for name, upper in partitions(conn):
+            if upper is None or upper > cutoff:
+                continue
+            cur.execute(f"ALTER TABLE {RESULTS_TABLE} DETACH PARTITION {SCHEMA}.{name}")
+            if archive_schema:
+                cur.execute(f"ALTER TABLE {SCHEMA}.{name} SET SCHEMA {archive_schema}")
+            else:
+                cur.execute(f"DROP TABLE {SCHEMA}.{name}")
+            removed.append(name)
+    return removed
+
+
+def expire_runs(conn, keep_days=30):
+    """Delete pipeline runs not updated for ``keep_days`` days and return how many went"""
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {RUNS_TABLE} WHERE updated_at < now() - make_interval(days => %s)", (keep_days,))
+        return cur.rowcount
+
+
+def expire_state(conn):
+    """Delete expired entries of the shared state table and return how many went"""
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {STATE_TABLE} WHERE expires_at < now()")
+        return cur.rowcount
+
+
+def check(conn):
+    """Problems with the results table that would make polling slow, as a list of messages"""
+    problems = []
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s AND c.relname = %s
+            """,
+            (SCHEMA, TABLE),
+        )
+        row = cur.fetchone()
+        if row is None:
+            return [f"{RESULTS_TABLE} does not exist; run `python schema.py migrate`"]
+        if current_version(conn) < MIGRATIONS[-1][0]:
+            problems.append(f"{RESULTS_TABLE} has pending schema migrations; run `python schema.py migrate`")
+        if row[0] != "p":
+            problems.append(f"{RESULTS_TABLE} is not partitioned; run `python schema.py migrate`")
+
+        # Any index leading with the three lookup columns will do, whatever its name
+        cur.execute(
+            """
+            SELECT 1 FROM pg_indexes
+            WHERE schemaname = %s AND tablename = %s
+              AND indexdef LIKE '%%(unique_id, step, status%%'
+            """,
+            (SCHEMA, TABLE),
+        )
+        if cur.fetchone() is None:
+            problems.append(
+                f"{RESULTS_TABLE} has no index on (unique_id, step, status); "
+                "polls will scan the whole table. Run `python schema.py migrate`"
+            )
+
+    if row[0] == "p":
+        next_month = _next_month(datetime.now(timezone.utc))
+        if not any(upper is not None and upper > next_month for _, upper in partitions(conn)):
+            problems.append(
+                f"No partition of {RESULTS_TABLE} covers next month; "
+                "new rows will land in the default partition. Run `python schema.py maintain`"
+            )
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["migrate", "maintain", "check"])
+    parser.add_argument("--months-ahead", type=int, default=2, help="monthly partitions to keep created ahead of time")
+    parser.add_argument("--keep-days", type=int, default=90, help="drop or archive partitions older than this")
+    parser.add_argument("--archive-schema", help="move expired partitions to this schema instead of dropping them")
+    parser.add_argument("--keep-run-days", type=int, default=30, help="delete saved pipeline runs idle for longer")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.autocommit = True
+    try:
+        if args.command == "migrate":
+            applied = migrate(conn)
+            logger.info("Applied migrations: %s", applied or "none pending")
+            # Migration 2 moves the table, so put the notification trigger back on it
+            notifier.install_trigger(conn)
+        if args.command in ("migrate", "maintain"):
+            created = ensure_partitions(conn, args.months_ahead)
+            logger.info("Partitions up to date: %s", ", ".join(created) or "nothing to create")
+        if args.command == "maintain":
+            removed = apply_retention(conn, args.keep_days, args.archive_schema)
+            logger.info("Expired partitions removed: %s", ", ".join(removed) or "none")
+            logger.info("Expired pipeline runs removed: %s", expire_runs(conn, args.keep_run_days))
+            logger.info("Expired shared state entries removed: %s", expire_state(conn))
+        problems = check(conn)
+        for problem in problems:
+            logger.warning(problem)
+        return 1 if problems else 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
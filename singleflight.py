@@ -0,0 +1,172 @@
+"""Coalescing of identical in-flight n8n jobs, within the process and optionally across replicas"""
+import threading
+import time
+
+from cache import payload_hash
+
+
+class _Call:
+    """One in-flight job that any number of identical requests attach to"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.unique_id = None
+        self.error = None
+        self.created_at = time.monotonic()
+        self.joiners = 0
+
+
+class InFlightJobs:
+    """Table of in-flight jobs keyed by (step, payload hash).
+
+    The first request for a payload starts the job; identical requests that
+    arrive while it is still running get the same uniqueID instead of
+    triggering another webhook call, so every waiter reads the same row from
+    the results table. An entry is dropped when the poller reports the job
+    finished (``complete``), when starting it failed, or after ``ttl`` seconds.
+
+    With a shared ``backend`` (see state.py) the process that starts a job
+    also registers it there, so an identical request on another replica
+    joins it too: whoever claims the key first calls the webhook, the others
+    poll the backend until its uniqueID appears.
+
+    ``do_cached`` does the same for the steps answered synchronously, whose
+    response other replicas then read from the shared response cache.
+    """
+
+    NAMESPACE = "inflight"
+
+    def __init__(self, ttl=7200, start_timeout=300, backend=None, poll_interval=0.5):
+        self.ttl = ttl
+        # How long a joiner waits for the leader's webhook call to return a uniqueID
+        self.start_timeout = start_timeout
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls = {}
+        # str(unique_id) -> key in _calls
+        self._by_unique_id = {}
+        self._counters = {"started": 0, "coalesced": 0, "coalesced_shared": 0}
+
+    def do(self, step, payload, start):
+        """Return the uniqueID of the in-flight job for this payload, calling ``start()`` if there is none"""
+        key = (step, payload_hash(payload))
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            call = self._calls.get(key)
+            if call is not None and now - call.created_at < self.ttl:
+                call.joiners += 1
+                self._counters["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._counters["started"] += 1
+                leader = True
+
+        if leader:
+            try:
+                call.unique_id = start() if self.backend is None else self._start_shared(key, start)
+                with self._lock:
+                    self._by_unique_id[str(call.unique_id)] = key
+            except Exception as e:
+                call.error = e
+                # Let the next request try again rather than inherit the failure forever
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+            finally:
+                call.started.set()
+        elif not call.started.wait(self.start_timeout):
+            raise TimeoutError("Timed out waiting for an identical request to start its job")
+
+        if call.error is not None:
+            raise call.error
+        return call.unique_id
+
+    def _start_shared(self, key, start):
+        """Claim ``key`` in the backend and start the job, or wait for the replica that claimed it"""
+        name = ":".join(key)
+        deadline = time.monotonic() + self.start_timeout
+        while True:
+            if self.backend.add(self.NAMESPACE, name, {"unique_id": None}, ttl=self.start_timeout):
+                try:
+                    unique_id = start()
+                except Exception:
+                    self.backend.delete(self.NAMESPACE, name)
+                    raise
+                self.backend.set(self.NAMESPACE, name, {"unique_id": unique_id}, ttl=self.ttl)
+                return unique_id
+            # Another replica holds the key; if it gives up, the entry goes and the loop claims it
+            while True:
+                entry = self.backend.get(self.NAMESPACE, name)
+                if entry is None:
+                    break
+                if entry["unique_id"] is not None:
+                    with self._lock:
+                        self._counters["coalesced_shared"] += 1
+                    return entry["unique_id"]
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Timed out waiting for another replica to start an identical job")
+                time.sleep(self.poll_interval)
+
+    def do_cached(self, step, payload, call, lookup):
+        """Return ``call()`` for a step whose response is cached rather than polled (steps 4 and 5).
+
+        Without a shared backend this just calls it. With one, the replica that
+        claims the key calls the webhook while identical requests elsewhere
+        wait for the claim to go, then take the response from ``lookup()``
+        (the shared response cache). They call the webhook themselves if
+        there is none, e.g. because the leader's call failed.
+        """
+        if self.backend is None:
+            return call()
+        name = ":".join((step, payload_hash(payload)))
+        deadline = time.monotonic() + self.start_timeout
+        while True:
+            # No uniqueID for these steps; the claim only says a call is under way
+            if self.backend.add(self.NAMESPACE, name, {"unique_id": None}, ttl=self.start_timeout):
+                try:
+                    return call()
+                finally:
+                    self.backend.delete(self.NAMESPACE, name)
+            while self.backend.get(self.NAMESPACE, name) is not None:
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Timed out waiting for another replica's identical request")
+                time.sleep(self.poll_interval)
+            found = lookup()
+            if found is not None:
+                with self._lock:
+                    self._counters["coalesced_shared"] += 1
+                return found
+
+    def complete(self, unique_id, *args):
+        """Forget the job once its result has landed; later requests start a new one"""
+        with self._lock:
+            key = self._by_unique_id.pop(str(unique_id), None)
+            call = self._calls.get(key)
+            if call is not None and str(call.unique_id) == str(unique_id):
+                del self._calls[key]
+        if key is not None and self.backend is not None:
+            self.backend.delete(self.NAMESPACE, ":".join(key))
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["in_flight"] = len(self._calls)
+        return snapshot
+
+    def samples(self):
+        """stats() as (name, value, labels) for metrics.register_collector"""
+        stats = self.stats()
+        return [
+            ("datagpt_inflight_requests_total", stats[outcome], {"outcome": outcome})
+            for outcome in ("started", "coalesced", "coalesced_shared")
+        ] + [("datagpt_inflight_jobs", stats["in_flight"], {})]
+
+    def _expire(self, now):
+        for key, call in list(self._calls.items()):
+            if now - call.created_at >= self.ttl:
+                del self._calls[key]
+                self._by_unique_id.pop(str(call.unique_id), None)
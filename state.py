@@ -0,0 +1,191 @@
+"""Pluggable store for state shared between app replicas: the in-flight job registry and cached responses
+
+DATAGPT_STATE_BACKEND picks where it lives:
+
+    memory    this process only (default); replicas need sticky sessions
+    sqlite    a SQLite file shared by every process on the host; the local stand-in
+    postgres  the datagpt_state table (schema migration 5), shared by every replica
+
+Values are JSON documents stored under (namespace, key), each with an optional
+TTL in seconds. ``add`` is an atomic put-if-absent, which is what replicas use
+to elect the one that starts a job. Wizard state itself is checkpointed by
+runs.py.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import codec
+from db import STATE_TABLE
+
+BACKEND = os.environ.get("DATAGPT_STATE_BACKEND", "memory")
+
+
+class MemoryBackend:
+    """Per-process dict; the default when the app runs as a single replica"""
+
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (namespace, key) -> (value, expires_at or None)
+        self._entries = {}
+
+    def _live(self, entry, now):
+        return entry is not None and (entry[1] is None or entry[1] > now)
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            return entry[0] if self._live(entry, time.time()) else None
+
+    def set(self, namespace, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._entries[(namespace, key)] = (value, now + ttl if ttl else None)
+
+    def add(self, namespace, key, value, ttl=None):
+        """Store ``value`` unless the key already holds a live value; True if stored"""
+        now = time.time()
+        with self._lock:
+            if self._live(self._entries.get((namespace, key)), now):
+                return False
+            self._entries[(namespace, key)] = (value, now + ttl if ttl else None)
+            return True
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    def clear(self, namespace, prefix=""):
+        """Delete every key in the namespace that starts with ``prefix``"""
+        with self._lock:
+            for entry in [entry for entry in self._entries if entry[0] == namespace and entry[1].startswith(prefix)]:
+                del self._entries[entry]
+
+
+class SqliteBackend:
+    """SQLite file shared by every process on the host; stands in for PostgresBackend locally"""
+
+    shared = True
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+
+    def get(self, namespace, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            ).fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)",
+                (namespace, key, codec.dumps(value).decode("utf-8"), expires_at),
+            )
+
+    def add(self, namespace, key, value, ttl=None):
+        """Store ``value`` unless the key already holds a live value; True if stored"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO state VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+                " WHERE state.expires_at IS NOT NULL AND state.expires_at <= ?",
+                (namespace, key, codec.dumps(value).decode("utf-8"), now + ttl if ttl else None, now),
+            )
+            return cursor.rowcount == 1
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace, prefix=""):
+        """Delete every key in the namespace that starts with ``prefix``"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM state WHERE namespace = ? AND substr(key, 1, ?) = ?", (namespace, len(prefix), prefix)
+            )
+
+
+class PostgresBackend:
+    """datagpt_state in the results database, shared by every replica"""
+
+    shared = True
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def get(self, namespace, key):
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"SELECT value::text FROM {STATE_TABLE}"
+                " WHERE namespace = %s AND key = %s AND (expires_at IS NULL OR expires_at > now())",
+                (namespace, key),
+            )
+            row = cur.fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value, ttl=None):
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO {STATE_TABLE} (namespace, key, value, expires_at)
+                VALUES (%s, %s, %s::jsonb, now() + make_interval(secs => %s))
+                ON CONFLICT (namespace, key) DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at
+                """,
+                (namespace, key, codec.dumps(value).decode("utf-8"), ttl),
+            )
+
+    def add(self, namespace, key, value, ttl=None):
+        """Store ``value`` unless the key already holds a live value; True if stored"""
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO {STATE_TABLE} AS s (namespace, key, value, expires_at)
+                VALUES (%s, %s, %s::jsonb, now() + make_interval(secs => %s))
+                ON CONFLICT (namespace, key) DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at
+                WHERE s.expires_at IS NOT NULL AND s.expires_at <= now()
+                RETURNING 1
+                """,
+                (namespace, key, codec.dumps(value).decode("utf-8"), ttl),
+            )
+            return cur.fetchone() is not None
+
+    def delete(self, namespace, key):
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(f"DELETE FROM {STATE_TABLE} WHERE namespace = %s AND key = %s", (namespace, key))
+
+    def clear(self, namespace, prefix=""):
+        """Delete every key in the namespace that starts with ``prefix``"""
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"DELETE FROM {STATE_TABLE} WHERE namespace = %s AND left(key, %s) = %s",
+                (namespace, len(prefix), prefix),
+            )
+
+
+def open_backend(pool, directory, name=BACKEND):
+    """The configured backend; ``directory`` holds the SQLite file for the stand-in"""
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sqlite":
+        return SqliteBackend(os.path.join(directory, "state.sqlite3"))
+    if name == "postgres":
+        return PostgresBackend(pool)
+    raise ValueError(f"Unknown state backend {name!r}; expected memory, sqlite or postgres")
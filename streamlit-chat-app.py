@@ -1,106 +1,569 @@
+import logging
+import os
 import time
 import streamlit as st
-import requests
-import json
 import pandas as pd
 
+import admission
+import cache
+import codec
+import db
+import incremental
+import jobs
+import metrics
+import normalize
+import notifier
+import pipeline
+import poller
+import profiler
+import results
+import runs
+import schema
+import singleflight
+import state
+import transport
+import webhooks
+from samples import (
+    generate_sample_step4_data,
+    generate_sample_step5_data,
+    generate_sample_step6_data,
+)
+
+logger = logging.getLogger(__name__)
+
 # Configure the page to use wide layout
 st.set_page_config(layout="wide")
 
 
-def generate_sample_step3_data(table_names):
-    """Generate sample data for step 3 when the webhook fails"""
-    sample_data = []
-    
-    for table_name in table_names:
-        sample_item = {
-            "table_name": table_name,
-            "classification": "Sample Classification",
-            "summary": f"This is a sample summary for {table_name}",
-            "column_tags": [
-                {
-                    "column_name": "sample_column_1",
-                    "tag": "PII",
-                    "description": "Sample personal identifier"
-                },
-                {
-                    "column_name": "sample_column_2",
-                    "tag": "METRIC",
-                    "description": "Sample metric data"
-                }
-            ]
-        }
-        sample_data.append(sample_item)
-    
-    return sample_data
-
-def generate_sample_step4_data():
-    """Generate sample data for step 4 when the webhook fails"""
-    return {
-        "summary": "Sample summary of findings for the data fitness check.",
-        "missing_attributes": [
-            {
-                "table_name": "stg_sample_table",
-                "column_name": "sample_column",
-                "importance": "High",
-                "impact": "Cannot calculate key metrics without this data"
-            },
-            {
-                "table_name": "stg_sample_table",
-                "column_name": "another_column",
-                "importance": "Medium",
-                "impact": "Reduces accuracy of segmentation"
-            }
-        ]
-    }
+@st.cache_resource
+def start_metrics_endpoint():
+    """Serve /metrics and /metrics.json when DATAGPT_METRICS and DATAGPT_METRICS_PORT are set"""
+    if metrics.ENABLED and metrics.PORT:
+        return metrics.serve(metrics.PORT)
+    return None
+
+
+@st.cache_resource
+def get_transport():
+    """Live, recording or replaying access to n8n and the results table (DATAGPT_TRANSPORT)"""
+    return transport.Transport()
+
+
+@st.cache_resource
+def get_db_pool():
+    """Process-wide PostgreSQL connection pool shared across reruns and sessions"""
+    pool = db.ConnectionPool(
+        db.DB_CONFIG,
+        max_size=10,            # hard cap on connections this process opens at the pooler
+        idle_timeout=300,       # close connections unused for 5 minutes
+        wait_timeout=30,        # give up if no connection frees up within 30 seconds
+        health_check_after=30,  # ping connections that sat idle for more than 30 seconds
+        connect=get_transport().connect(),
+    )
+    metrics.register_collector(pool.samples)
+    return pool
+
+
+@st.cache_resource
+def check_results_schema():
+    """Warn once per process when the results table lacks the indexes the poller relies on"""
+    try:
+        with get_db_pool().connection() as conn:
+            problems = schema.check(conn)
+    except Exception as e:
+        problems = [f"Could not check the results table schema: {e}"]
+    for problem in problems:
+        logger.warning("%s", problem)
+    return problems
+
+
+@st.cache_resource
+def get_completion_notifier():
+    """Single background LISTEN thread that wakes sessions when their result row changes"""
+    try:
+        with get_db_pool().connection() as conn:
+            notifier.install_trigger(conn)
+    except Exception as e:
+        # Without the trigger no notifications arrive and sessions keep polling
+        logger.warning("Could not install result notification trigger: %s", e)
+    return notifier.CompletionNotifier(db.DB_LISTEN_CONFIG, connect=get_transport().connect()).start()
+
+
+@st.cache_resource
+def get_result_poller():
+    """Single background thread that fetches every pending job with one batched query"""
+    check_results_schema()
+    completion_notifier = get_completion_notifier()
+    result_poller = poller.ResultPoller(
+        get_db_pool(),
+        interval=5,         # poll every 5 seconds while LISTEN/NOTIFY is unavailable
+        idle_interval=30,   # safety-net poll while notifications are being pushed
+        notifier=completion_notifier,
+        # Step 3 / step 6 payloads are paged from the database instead of shipped whole
+        projected_steps=pipeline.RESULT_STEPS.values(),
+    )
+    # A NOTIFY on any result row triggers an immediate batched poll
+    completion_notifier.add_listener(result_poller.wake)
+    metrics.register_collector(result_poller.samples)
+    return result_poller.start()
+
 
-def generate_sample_step5_data():
-    """Generate sample data for step 5 when the webhook fails"""
-    return {
-        "parsed": {
-            "data_quality_rules": [
-                {
-                    "table_name": "stg_iqvia_xpo_rx", 
-                    "column_name": "product_id",
-                    "rule_name": "NOT_NULL",
-                    "configuration_information": "Column must not contain NULL values"
-                },
-                {
-                    "table_name": "stg_semarchy_cm_pub_m_hcp_profile", 
-                    "column_name": "hcp_id",
-                    "rule_name": "UNIQUE",
-                    "configuration_information": "Values must be unique"
-                },
-                {
-                    "table_name": "stg_zip_territory", 
-                    "column_name": "zip_code",
-                    "rule_name": "FORMAT_CHECK",
-                    "configuration_information": "Must match pattern: '\\d{5}'"
-                }
-            ]
-        }
+@st.cache_resource
+def get_job_runner():
+    """Bounded worker pools that run the step webhooks off the script thread.
+
+    Each step gets a pool with a worker for every request its endpoint admits
+    or queues, plus one so the request beyond a full queue is turned away by
+    admission control rather than held by the pool. Jobs therefore wait in
+    the admission queue, whose position the page shows, and a quick step 3 /
+    step 6 uniqueID request never waits behind step 4 / step 5 calls.
+    """
+    lanes = {
+        spec.name: webhooks.ENDPOINTS[spec.name].max_concurrent + webhooks.ENDPOINTS[spec.name].max_queue + 1
+        for spec in pipeline.PIPELINE
     }
+    runner = jobs.JobRunner(max_workers=8, max_pending=64, lanes=lanes)
+    metrics.register_collector(runner.samples)
+    return runner
+
+
+@st.cache_resource
+def get_webhook_client():
+    """Keep-alive HTTP client with retries shared by every n8n webhook call"""
+    client = webhooks.WebhookClient(pool_maxsize=32, adapter=get_transport().webhook_adapter(pool_maxsize=32))
+    metrics.register_collector(client.samples)
+    return client
+
+
+@st.cache_resource
+def get_state_backend():
+    """Store for in-flight jobs and responses shared with other replicas (DATAGPT_STATE_BACKEND)"""
+    backend = state.open_backend(get_db_pool(), cache.CACHE_DIR, get_transport().store_backend(state.BACKEND))
+    # The in-process default adds nothing on top of the per-process tables and LRU
+    return backend if backend.shared else None
+
+
+@st.cache_resource
+def get_response_cache():
+    """Responses keyed by a hash of each step's payload, in memory, on disk and in the shared store"""
+    response_cache = cache.ResponseCache(
+        os.path.join(cache.CACHE_DIR, "responses.sqlite3"),
+        max_entries=256,              # decoded responses kept in memory per process
+        max_bytes=256 * 1024 * 1024,  # on-disk budget before least recently used entries go
+        default_ttl=24 * 3600,
+        shared=get_state_backend(),
+    )
+    metrics.register_collector(response_cache.samples)
+    return response_cache
+
+
+@st.cache_resource
+def get_run_store():
+    """Checkpointed runs, so a reload or another replica picks up where the session left off"""
+    return runs.open_store(get_db_pool(), cache.CACHE_DIR, get_transport().store_backend(runs.BACKEND))
+
 
-def generate_sample_step6_data():
-    """Generate sample data for step 6 when the webhook fails"""
-    return [
-        {
-            "integration_table_name": "int_sales_retail",
-            "primary_source_staging_table": "stg_iqvia_xpo_rx",
-            "secondary_source_staging_table": "stg_zip_territory",
-            "mapping": [],
-            "sql_query": "SELECT * FROM stg_iqvia_xpo_rx JOIN stg_zip_territory ON zip_code = territory_code",
-            "justification": "This mapping combines sales data with territory information for retail analysis"
-        },
-        {
-            "integration_table_name": "int_hcp_profile",
-            "primary_source_staging_table": "stg_semarchy_cm_pub_m_hcp_profile",
-            "secondary_source_staging_table": "stg_semarchy_cm_pub_x_hcp_address",
-            "mapping": [],
-            "sql_query": "SELECT * FROM stg_semarchy_cm_pub_m_hcp_profile JOIN stg_semarchy_cm_pub_x_hcp_address ON hcp_id = hcp_id",
-            "justification": "This mapping combines HCP profile data with address information"
-        }
-    ]
+@st.cache_resource
+def get_pipeline_services():
+    """Clients shared by the step runners, whether scheduled or started from a page"""
+    result_poller = get_result_poller()
+    inflight = singleflight.InFlightJobs(backend=get_state_backend())
+    # Once a job's result lands, identical requests start a fresh job (or hit the cache)
+    result_poller.add_listener(inflight.complete)
+    metrics.register_collector(inflight.samples)
+    return pipeline.PipelineServices(get_webhook_client(), result_poller, get_response_cache(), inflight)
+
+
+@st.cache_resource
+def get_pipeline_scheduler():
+    """Launches steps 3-6 concurrently as soon as the step 1 form is submitted"""
+    return pipeline.PipelineScheduler(get_job_runner(), get_pipeline_services())
+
+
+def scheduled_job(step_number, payload):
+    """The scheduler's job for this step if it was launched with the same payload"""
+    run_id = st.session_state.get("pipeline_run_id")
+    if run_id is None:
+        return None
+    job_id = get_pipeline_scheduler().job_for(run_id, f"step{step_number}", payload)
+    return get_job_runner().get(job_id) if job_id else None
+
+@st.fragment(run_every=1)
+def rerun_when_job_done(job_id, step_number, message):
+    """Refresh only this status line until the background job finishes, then rerun the page"""
+    job = get_job_runner().get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    position = job.ticket.position() if job.ticket is not None else 0
+    if position:
+        st.info(f"Step {step_number} request is number {position} in the queue for the webhook ({job.elapsed():.0f}s elapsed)")
+    else:
+        st.info(f"{message} ({job.elapsed():.0f}s elapsed)")
+
+def adopt_unique_id(step_number):
+    """Take the uniqueID from the background job that requested it for step 3 / step 6.
+
+    That is the page's own job (``step{n}_job_id``) or else the one the
+    scheduler launched for this payload. Returns True once the uniqueID is in
+    session state, None while the job is still running (a status fragment is
+    rendered), and False if there is no job, the scheduler's job failed or the
+    result turned out to be cached; the page then submits a job of its own.
+    A failure of the page's own job is raised.
+    """
+    job_key = f"step{step_number}_job_id"
+    runner = get_job_runner()
+    job = runner.get(st.session_state.get(job_key))
+    own = job is not None
+    if job is None:
+        job = scheduled_job(step_number, st.session_state.get(f"step{step_number}_payload"))
+    if job is None:
+        return False
+    
+    if not job.done:
+        rerun_when_job_done(job.id, step_number, "Getting unique ID from webhook...")
+        return None
+    
+    # The job is consumed either way; a later Retry or refresh must call the webhook again
+    runner.forget(job.id)
+    st.session_state.pop(job_key, None)
+    if job.state != jobs.DONE:
+        if own:
+            raise job.error
+        return False
+    # No uniqueID means the result was found in the cache
+    if job.result is None:
+        return False
+    st.session_state[f"step{step_number}_unique_id"] = job.result
+    return True
+
+def set_response(step_number, response):
+    """Store a step's response with its content hash, taken once here so normalize.frame need not re-serialize it"""
+    st.session_state[f"step{step_number}_response"] = response
+    st.session_state[f"step{step_number}_response_hash"] = cache.payload_hash(response)
+
+def load_cached_response(step_number):
+    """Serve step 3 / step 6 straight from the response cache, skipping the webhook and polling"""
+    payload = st.session_state.get(f"step{step_number}_payload")
+    cached = get_response_cache().get(f"step{step_number}", payload)
+    if cached is None:
+        return False
+    set_response(step_number, cached)
+    st.session_state[f"step{step_number}_loading"] = False
+    return True
+
+def load_reused_response(step_number):
+    """Serve step 3 from the previous run's results when they cover every table, skipping the webhook"""
+    payload = st.session_state.get(f"step{step_number}_payload")
+    reused = st.session_state.get(f"step{step_number}_reused")
+    if not reused or incremental.pending(payload, reused):
+        return False
+    response = incremental.merge(f"step{step_number}", payload, reused, None)
+    get_response_cache().set(f"step{step_number}", payload, response)
+    set_response(step_number, response)
+    st.session_state[f"step{step_number}_loading"] = False
+    return True
+
+def reusable_tables(form_payload):
+    """step -> {table: items} of the previous run's step 3 / step 5 results that still apply to this form"""
+    step3_payload = pipeline.build_step3_payload(form_payload)
+    payloads = {"step3": step3_payload, "step5": pipeline.build_step5_payload(step3_payload)}
+    reused = {}
+    for step, payload in payloads.items():
+        previous_payload = st.session_state.get(f"{step}_payload")
+        previous_response = st.session_state.get(f"{step}_response")
+        # Sample data served after a failure, or a run still in progress, is not worth keeping
+        if (previous_response is None or st.session_state.get(f"{step}_error")
+                or st.session_state.get(f"{step}_loading")):
+            continue
+        kept = [table for table in incremental.payload_tables(payload)
+                if table in incremental.payload_tables(previous_payload)]
+        if not kept:
+            continue
+        if isinstance(previous_response, dict) and "result_id" in previous_response:
+            # Large step 3 results stay in the database; fetch just the tables being kept
+            try:
+                with metrics.span("db_fetch", query="table_items"), get_db_pool().connection() as conn:
+                    items = results.table_items(conn, previous_response["result_id"],
+                                                pipeline.RESULT_STEPS[step], kept)
+            except Exception as e:
+                logger.warning("Could not load the previous %s result, running every table again: %s", step, e)
+                continue
+        else:
+            items = incremental.response_items(step, previous_response)
+        tables = incremental.reusable(step, payload, previous_payload, items)
+        if tables:
+            reused[step] = tables
+    return reused
+
+def merge_reused_tables(step_number, unique_id, result_step, response):
+    """Step 3 result for the new tables with the previous run's tables merged back in"""
+    payload = st.session_state.get(f"step{step_number}_payload")
+    reused = st.session_state.get(f"step{step_number}_reused")
+    if not reused:
+        return response
+    if isinstance(response, dict) and "result_id" in response:
+        with metrics.span("db_fetch", query="table_items"), get_db_pool().connection() as conn:
+            response = {"data": results.table_items(conn, unique_id, result_step)}
+    return incremental.merge(f"step{step_number}", payload, reused, response)
+
+def refresh_step(step_number):
+    """Drop the step's cached response and run it again"""
+    payload = st.session_state.get(f"step{step_number}_payload")
+    get_response_cache().invalidate(f"step{step_number}", payload)
+    # Neither the scheduler's job nor an in-flight twin may hand the old result back
+    job = scheduled_job(step_number, payload)
+    if job is not None:
+        get_job_runner().forget(job.id)
+    unique_id = st.session_state.get(f"step{step_number}_unique_id")
+    if unique_id is not None:
+        result_step = pipeline.RESULT_STEPS[f"step{step_number}"]
+        get_result_poller().release(unique_id, result_step)
+        get_pipeline_services().inflight.complete(unique_id)
+    for key in (f"step{step_number}_unique_id", f"step{step_number}_job_id", f"step{step_number}_response",
+                f"step{step_number}_response_hash", f"step{step_number}_reused"):
+        st.session_state.pop(key, None)
+    st.session_state[f"step{step_number}_loading"] = True
+    st.rerun()
+
+
+@st.fragment(run_every=1)
+def display_job_status(step_number, job_key, payload, submit_job, generate_sample):
+    """Render the live status of a step's background webhook job.
+
+    Picks up the job the pipeline scheduler already launched for this payload,
+    or submits one on first render, and stores the finished result in
+    ``step{n}_response`` / ``step{n}_error`` once it is done. Runs as a
+    fragment: only this status block refreshes while the job runs, and the
+    whole page reruns once the result is in.
+    """
+    metrics.increment("datagpt_reruns_total", step=f"step{step_number}", scope="fragment")
+    runner = get_job_runner()
+    job = runner.get(st.session_state.get(job_key))
+    
+    if job is None:
+        job = scheduled_job(step_number, payload)
+        if job is not None:
+            st.session_state[job_key] = job.id
+    
+    if job is None:
+        # Hand the webhook call to the worker pool and render right away
+        try:
+            st.session_state[job_key] = submit_job(runner)
+        except jobs.JobQueueFull as e:
+            st.error(f"The server is busy, please retry shortly: {e}")
+            if st.button("Retry"):
+                st.rerun()
+            return
+        job = runner.get(st.session_state[job_key])
+    
+    if not job.done:
+        position = job.ticket.position() if job.ticket is not None else 0
+        if position:
+            st.info(f"Step {step_number} request is number {position} in the queue for the webhook ({job.elapsed():.0f}s elapsed)")
+        else:
+            st.info(f"Processing... Step {step_number} job `{job.id[:8]}` is {job.state.lower()} ({job.elapsed():.0f}s elapsed)")
+        # The fragment timer checks again shortly; nothing sleeps on the script thread
+        return
+    
+    if isinstance(job.error, admission.Rejected):
+        # Turned away by admission control: let the user retry rather than showing sample data
+        st.error(str(job.error))
+        if st.button("Retry"):
+            runner.forget(job.id)
+            del st.session_state[job_key]
+            st.rerun()
+        return
+    
+    # Pick up the finished result
+    if job.state == jobs.DONE:
+        response_data, error = job.result
+    else:
+        metrics.increment("datagpt_sample_fallbacks_total", step=f"step{step_number}")
+        response_data, error = generate_sample(), f"Exception during Step {step_number} webhook call: {job.error}"
+    set_response(step_number, response_data)
+    st.session_state[f"step{step_number}_error"] = error
+    st.session_state[f"step{step_number}_loading"] = False
+    runner.forget(job.id)
+    del st.session_state[job_key]
+    st.rerun()
+
+def partial_table_items(raw_chunks):
+    """Table items from the PARTIAL rows of a step 3 job, see results.partial_items"""
+    with metrics.span("decode", step="step3", source="partial"):
+        return results.partial_items(raw_chunks)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_result_page(view_name, unique_id, offset, limit, filters, search, sort_by, descending):
+    """Page of a completed step's payload, projected, filtered, sorted and paged in PostgreSQL"""
+    with metrics.span("db_fetch", query="page", view=view_name), get_db_pool().connection() as conn:
+        return results.fetch_page(
+            conn, results.VIEWS[view_name], unique_id, offset, limit,
+            filters=dict(filters), search=search, sort_by=sort_by, descending=descending,
+        )
+
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_filter_options(view_name, unique_id, label):
+    """Distinct values of a filterable column of a completed step's payload"""
+    with metrics.span("db_fetch", query="filter_options", view=view_name), get_db_pool().connection() as conn:
+        return results.distinct_values(conn, results.VIEWS[view_name], unique_id, label)
+
+@st.fragment
+def display_result_frame(response_data, view, key, empty_message, digest=None):
+    """Paged, searchable and filterable dataframe of one view of a step result.
+
+    Results held as ``{"result_id": ...}`` are filtered, sorted and paged in
+    the database; in-memory responses (cached, sample or partial data) are
+    normalized into a shared columnar frame once and queried from there, keyed
+    by ``digest`` (the stored response's hash) when given.
+    Either way only the visible page is sent to the browser, and changing the
+    controls reruns just this fragment. Callers check in-memory responses
+    with normalize.frame first, since errors raised inside a fragment do not
+    reach them.
+    """
+    result_id = response_data.get("result_id") if isinstance(response_data, dict) else None
+    df = normalize.frame(response_data, view.name, digest) if result_id is None else None
+    
+    controls = st.columns([3] + [2] * len(view.filterable) + [2, 1, 1])
+    search = controls[0].text_input("Search", key=f"{key}_search", placeholder="Search all columns")
+    filters = {}
+    for control, label in zip(controls[1:], view.filterable):
+        if result_id is None:
+            options = normalize.distinct_values(df, label)
+        else:
+            options = fetch_filter_options(view.name, result_id, label)
+        choice = control.selectbox(label, [None] + options, format_func=lambda value: "All" if value is None else value,
+                                   key=f"{key}_filter_{label}")
+        if choice is not None:
+            filters[label] = choice
+    sort_by = controls[-3].selectbox("Sort by", [None] + view.labels, format_func=lambda value: value or "Default order",
+                                     key=f"{key}_sort")
+    descending = controls[-2].toggle("Descending", key=f"{key}_descending")
+    page_size = controls[-1].selectbox("Rows", [50, 100, 250, 500], index=1, key=f"{key}_page_size")
+    
+    # Any change to the query starts again from the first page
+    page_key = f"{key}_page"
+    query = (search, tuple(sorted(filters.items())), sort_by, descending, page_size)
+    if st.session_state.get(f"{key}_query") != query:
+        st.session_state[f"{key}_query"] = query
+        st.session_state[page_key] = 1
+    
+    def fetch(page_number):
+        offset = (page_number - 1) * page_size
+        if result_id is None:
+            return normalize.page(df, offset, page_size, filters, search, sort_by, descending)
+        page = fetch_result_page(view.name, result_id, offset, page_size, tuple(filters.items()), search,
+                                 sort_by, descending)
+        return pd.DataFrame(page.rows, columns=view.labels), page.total
+    
+    page_number = st.session_state.get(page_key, 1)
+    rows, total = fetch(page_number)
+    pages = max(1, -(-total // page_size))
+    if page_number > pages:
+        # The result shrank under a page the user had open
+        page_number = st.session_state[page_key] = pages
+        rows, total = fetch(page_number)
+    
+    if len(rows):
+        st.dataframe(rows)
+    elif filters or search:
+        st.info("No rows match the search and filters")
+    else:
+        st.info(empty_message)
+    
+    if pages > 1:
+        st.number_input(f"Page (of {pages}, {total} rows)", min_value=1, max_value=pages, step=1, key=page_key)
+    elif total:
+        st.caption(f"{total} rows")
+
+def display_profiling_tables(response_data, digest=None):
+    """Table Tags and Column Tags frames for a step 3 result"""
+    st.markdown("### Table Tags")
+    display_result_frame(response_data, results.TABLE_TAGS, "step3_table_tags", "No table data available", digest)
+
+    st.markdown("### Column Tags")
+    display_result_frame(response_data, results.COLUMN_TAGS, "step3_column_tags", "No column data available", digest)
+
+@st.fragment(run_every=2)
+def display_result_wait(step_number, result_step, back_step, display_partial=None):
+    """Status block shown while the poller waits for a step 3 / step 6 result.
+
+    Only this fragment refreshes on its timer; it reads the poller's mailbox
+    without blocking and reruns the whole page once the result is in. When
+    ``display_partial`` is given, the table items n8n has written so far are
+    rendered with it on every refresh.
+    """
+    metrics.increment("datagpt_reruns_total", step=f"step{step_number}", scope="fragment")
+    unique_id = st.session_state.get(f"step{step_number}_unique_id")
+    if unique_id is None or not st.session_state.get(f"step{step_number}_loading", False):
+        # Page state changed under us (e.g. the user navigated away)
+        st.rerun()
+    
+    try:
+        result_poller = get_result_poller()
+        
+        if result_poller.last_error is not None:
+            st.warning(f"Database error, still retrying: {result_poller.last_error}")
+        
+        # The app-wide poller checks all pending jobs in one query and leaves this
+        # job's result in its mailbox; NOTIFY on the row wakes it early
+        result_poller.register(unique_id, result_step)
+        result = result_poller.result(unique_id, result_step)
+        
+        if result is None:
+            status = result_poller.status(unique_id, result_step) or "waiting"
+            items = partial_table_items(result_poller.partials(unique_id, result_step)) if display_partial else []
+            if items and st.session_state.get(f"step{step_number}_reused"):
+                items = incremental.response_items(
+                    f"step{step_number}", merge_reused_tables(step_number, unique_id, result_step, {"data": items})
+                )
+            if items:
+                st.info(f"Processing data... {len(items)} tables ready so far, the rest are still running")
+                display_partial({"data": items})
+            else:
+                st.info(f"Processing data... Fetching results from database (status: {status})")
+        elif result.status == 'COMPLETED':
+            if result.response_data is not None:
+                # If we have results, parse the JSON and store it
+                with metrics.span("decode", step=f"step{step_number}"):
+                    response = codec.loads(result.response_data)
+            else:
+                # Large payloads stay in the database; keep a reference and page through it
+                with metrics.span("db_fetch", query="item_count"), get_db_pool().connection() as conn:
+                    has_data = results.item_count(conn, unique_id, result_step) is not None
+                response = {"result_id": unique_id} if has_data else {}
+            if isinstance(response, dict) and not ("data" in response or "result_id" in response) and display_partial:
+                # The final row only marks completion; the tables arrived as PARTIAL rows
+                response = {**response, "data": partial_table_items(result_poller.partials(unique_id, result_step))}
+            # The job only covered the tables that were not carried over from the previous run
+            response = merge_reused_tables(step_number, unique_id, result_step, response)
+            set_response(step_number, response)
+            get_response_cache().set(f"step{step_number}", st.session_state[f"step{step_number}_payload"], response)
+            st.session_state[f"step{step_number}_loading"] = False
+            result_poller.release(unique_id, result_step)
+            st.rerun()
+        else:
+            st.error("Processing failed. Please try again.")
+            if st.button("Retry"):
+                # Reset and restart
+                result_poller.release(unique_id, result_step)
+                del st.session_state[f"step{step_number}_unique_id"]
+                st.rerun()
+            if st.button(f"Go back to Step {back_step}"):
+                result_poller.release(unique_id, result_step)
+                st.session_state.current_step = back_step
+                st.session_state[f"step{step_number}_loading"] = False
+                del st.session_state[f"step{step_number}_unique_id"]
+                st.rerun()
+    
+    except Exception as e:
+        st.error(f"Database error: {str(e)}")
+        if st.button("Retry"):
+            st.rerun()
+        if st.button(f"Go back to Step {back_step}"):
+            st.session_state.current_step = back_step
+            st.session_state[f"step{step_number}_loading"] = False
+            st.session_state.pop(f"step{step_number}_unique_id", None)
+            st.rerun()
 
 def display_step1(on_submit_callback):
     # App header
@@ -111,23 +574,8 @@ def display_step1(on_submit_callback):
     st.markdown("## Step 1: Select your data and use case")
     
     # Data sources and use cases
-    data_sources = [
-        "iqvia_xpo_rx", 
-        "semarchy_cm_pub_m_hcp_profile", 
-        "semarchy_cm_pub_x_address", 
-        "zip_territory", 
-        "semarchy_cm_pub_x_hcp_address"
-    ]
-    
-    use_cases = [
-        "Field Reporting",
-        "IC Operations",
-        "Segmentation"
-    ]
-    
-    # Step 2 Webhook configuration
-    webhook_url_step2 = "https://ajayshanks.app.n8n.cloud/webhook-test/0cfd6c96-9c7c-46aa-8a58-30b11b499172"
-    bearer_token_step2 = "datagpt@123"  # Replace with actual token
+    data_sources = pipeline.DATA_SOURCES
+    use_cases = pipeline.USE_CASES
     
     # Form creation
     with st.form(key="data_insights_form"):
@@ -168,15 +616,8 @@ def display_step1(on_submit_callback):
         elif not selected_use_case:
             st.error("Please select a use case.")
         else:
-            # Clean up empty business rules
-            business_rules = [rule for rule in business_rules if rule.strip()]
-            
             # Prepare payload
-            payload = {
-                "data_sources": selected_data_sources,
-                "use_case": selected_use_case,
-                "business_rules": business_rules
-            }
+            payload = pipeline.build_form_payload(selected_data_sources, selected_use_case, business_rules)
             
             # Display the JSON that would be sent
             st.success("Form submitted successfully!")
@@ -187,18 +628,24 @@ def display_step1(on_submit_callback):
             
             # In a real application, send data to webhook
             try:
-                headers = {
-                    "Authorization": f"Bearer {bearer_token_step2}",
-                    "Content-Type": "application/json"
-                }
-                
-                response = requests.post(webhook_url_step2, json=payload, headers=headers)
+                response = get_webhook_client().post("step2", payload)
                 if response.status_code == 200:
-                    st.session_state.webhook_response = response.json()
+                    st.session_state.webhook_response = codec.loads(response.content)
                 else:
                     st.error(f"Error sending data: {response.status_code} - {response.text}")
                     return
                 
+                # Tables already profiled and given rules in the previous run are not sent again
+                reused = reusable_tables(payload)
+                for step in ("step3", "step5"):
+                    st.session_state[f"{step}_reused"] = reused.get(step, {})
+                # The previous run's jobs belong to its payloads
+                for key in ("step3_unique_id", "step6_unique_id"):
+                    st.session_state.pop(key, None)
+                
+                # Start steps 3-6 in the background so their results are ready when the user gets there
+                st.session_state.pipeline_run_id = get_pipeline_scheduler().start(payload, reused)
+                
                 # Move to Step 2 immediately
                 st.session_state.current_step = 2
                 st.rerun()
@@ -219,9 +666,7 @@ def display_step1(on_submit_callback):
     st.markdown("Fill out the form above and click 'Submit' to continue to the next step.")
 
 def proceed_to_step3():
-    data_sources = st.session_state.get("last_payload", {}).get("data_sources", [])
-    table_names = [f"stg_{source}" for source in data_sources]
-    payload = {"table_name": table_names}
+    payload = pipeline.build_step3_payload(st.session_state.get("last_payload", {}))
 
     st.session_state.step3_payload = payload
     st.session_state.current_step = 3
@@ -229,86 +674,54 @@ def proceed_to_step3():
     st.rerun()
 
 def proceed_to_step4():
-    webhook_url_step4 = "https://ajayshanks.app.n8n.cloud/webhook-test/4d5e6f7g-8h9i-10j11-12k13-14l15m16n17o"
-    bearer_token_step4 = "datagpt@123"
-
-    # Get data from session state
-    data_sources = st.session_state.get("last_payload", {}).get("data_sources", [])
-    table_names = [f"stg_{source}" for source in data_sources]
-    use_case = st.session_state.get("last_payload", {}).get("use_case", "")
-    business_rules = st.session_state.get("last_payload", {}).get("business_rules", [])
-
     # Prepare payload for step 4 as per the specified schema
-    payload = [{
-        "table_name": table_names,
-        "usecase_name": use_case,
-        "business_rules": business_rules
-    }]
+    payload = pipeline.build_step4_payload(st.session_state.get("last_payload", {}))
 
     st.session_state.step4_payload = payload
 
     try:
-        headers = {
-            "Authorization": f"Bearer {bearer_token_step4}",
-            "Content-Type": "application/json"
-        }
-        
         st.info(f"Sending request to Step 4 webhook with payload: {payload}")
         
         # Set current step to 4 immediately to show the loading state
         st.session_state.current_step = 4
         st.session_state.step4_loading = True
+        st.session_state.pop("step4_job_id", None)
         st.rerun()
     except Exception as e:
         st.error(f"Exception preparing Step 4 webhook call: {str(e)}")
         # For demonstration, use sample data when there's an error
-        st.session_state.step4_response = generate_sample_step4_data()
+        set_response(4, generate_sample_step4_data())
         st.session_state.current_step = 4
         st.rerun()
 
 def proceed_to_step5():
-    webhook_url_step5 = "https://ajayshanks.app.n8n.cloud/webhook-test/12f6bf3b-f2dd-4ef3-bbe4-1746a1290e36"
-    bearer_token_step5 = "datagpt@123"
-
     # Use the same payload as Step 3
-    payload = st.session_state.get("step3_payload", {})
+    payload = pipeline.build_step5_payload(st.session_state.get("step3_payload", {}))
 
     st.session_state.step5_payload = payload
 
     try:
-        headers = {
-            "Authorization": f"Bearer {bearer_token_step5}",
-            "Content-Type": "application/json"
-        }
-        
         st.info(f"Sending request to Step 5 webhook with payload: {payload}")
         
         # Set current step to 5 immediately to show the loading state
         st.session_state.current_step = 5
         st.session_state.step5_loading = True
+        st.session_state.pop("step5_job_id", None)
         st.rerun()
     except Exception as e:
         st.error(f"Exception preparing Step 5 webhook call: {str(e)}")
         # For demonstration, use sample data when there's an error
-        st.session_state.step5_response = generate_sample_step5_data()
+        set_response(5, generate_sample_step5_data())
         st.session_state.current_step = 5
         st.rerun()
 
 def proceed_to_step6():
-    webhook_url_step6 = "https://ajayshanks.app.n8n.cloud/webhook-test/c50d562c-05e5-4dc8-97bc-b9cd286e3d67"
-    bearer_token_step6 = "datagpt@123"
-
     # Use the same payload as Step 5
-    payload = st.session_state.get("step5_payload", {})
+    payload = pipeline.build_step6_payload(st.session_state.get("step5_payload", {}))
 
     st.session_state.step6_payload = payload
 
     try:
-        headers = {
-            "Authorization": f"Bearer {bearer_token_step6}",
-            "Content-Type": "application/json"
-        }
-        
         st.info(f"Sending request to Step 6 webhook with payload: {payload}")
         
         # Set current step to 6 immediately to show the loading state
@@ -318,7 +731,7 @@ def proceed_to_step6():
     except Exception as e:
         st.error(f"Exception preparing Step 6 webhook call: {str(e)}")
         # For demonstration, use sample data when there's an error
-        st.session_state.step6_response = generate_sample_step6_data()
+        set_response(6, generate_sample_step6_data())
         st.session_state.current_step = 6
         st.rerun()
 
@@ -387,148 +800,53 @@ def display_step3():
 
     # Initial loading state - calling webhook to get uniqueID
     if st.session_state.get("step3_loading", False) and "step3_unique_id" not in st.session_state:
+        # Repeat payloads are served from the cache; otherwise the pipeline scheduler
+        # usually started this step when the form was submitted
+        if load_cached_response(3) or load_reused_response(3):
+            st.rerun()
         with st.spinner("Getting unique ID from webhook..."):
-            webhook_url_step3 = "https://ajayshanks.app.n8n.cloud/webhook-test/2a51622b-8576-44e0-911d-c428c6533bc8"
-            bearer_token_step3 = "datagpt@123"
             payload = st.session_state.get("step3_payload", {})
 
             try:
-                headers = {
-                    "Authorization": f"Bearer {bearer_token_step3}",
-                    "Content-Type": "application/json"
-                }
-                response = requests.post(webhook_url_step3, json=payload, headers=headers, timeout=180)
-                
-                if response.status_code == 200 and response.text.strip():
-                    try:
-                        # Assuming webhook returns {"uniqueID": "some-unique-id"}
-                        unique_id_response = response.json()
-                        if "uniqueID" in unique_id_response:
-                            st.session_state.step3_unique_id = unique_id_response["uniqueID"]
-                            st.rerun()
-                        else:
-                            st.error("Webhook response doesn't contain uniqueID")
-                            if st.button("Retry"):
-                                st.rerun()
-                            if st.button("Go back to Step 2"):
-                                st.session_state.current_step = 2
-                                st.session_state.step3_loading = False
-                                st.rerun()
-                    except json.JSONDecodeError:
-                        st.error(f"Invalid JSON response from webhook: {response.text}")
-                        if st.button("Retry"):
-                            st.rerun()
-                        if st.button("Go back to Step 2"):
-                            st.session_state.current_step = 2
-                            st.session_state.step3_loading = False
-                            st.rerun()
-                else:
-                    st.error(f"Webhook returned an error status: {response.status_code} - {response.text}")
-                    if st.button("Retry"):
-                        st.rerun()
-                    if st.button("Go back to Step 2"):
-                        st.session_state.current_step = 2
-                        st.session_state.step3_loading = False
-                        st.rerun()
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
+                adopted = adopt_unique_id(3)
+                if adopted:
+                    st.rerun()
+                if adopted is None:
+                    # Still running; a fragment refreshes its status and queue position
+                    return
+                # Requested on the worker pool like steps 4 and 5, so the page never blocks
+                # on the webhook's admission queue. Identical payloads already in flight (e.g.
+                # other users in a demo) are joined instead of starting another n8n execution
+                services = get_pipeline_services()
+                st.session_state.step3_job_id = get_job_runner().submit("step3", pipeline.run_step3, services, payload, reused=st.session_state.get("step3_reused"))
+                st.rerun()
+            except jobs.JobQueueFull as e:
+                st.error(f"The server is busy, please retry shortly: {e}")
+                if st.button("Retry"):
+                    st.rerun()
+            except (pipeline.WebhookError, admission.Rejected) as e:
+                st.error(str(e))
                 if st.button("Retry"):
                     st.rerun()
                 if st.button("Go back to Step 2"):
                     st.session_state.current_step = 2
                     st.session_state.step3_loading = False
                     st.rerun()
-        return
-
-    # Secondary loading state - polling database for results
-    if "step3_unique_id" in st.session_state and st.session_state.get("step3_loading", False):
-        with st.spinner("Processing data... Fetching results from database"):
-            try:
-                # Define your PostgreSQL connection parameters
-                # These should be stored securely in a production environment
-                # Consider using st.secrets for secure storage
-                db_host = "aws-0-ap-south-1.pooler.supabase.com"
-                db_name = "postgres"
-                db_user = "postgres.pguxhjesyiffkujrrqyq"
-                db_password = "MfmoYcfS2n6CXkyw"
-                db_port = "6543"  # Default PostgreSQL port
-                
-                # Create a connection to the PostgreSQL database
-                conn = None
-                unique_id = st.session_state.step3_unique_id
-                
-                # Import necessary library
-                import psycopg2
-                
-                try:
-                    conn = psycopg2.connect(
-                        host=db_host,
-                        database=db_name,
-                        user=db_user,
-                        password=db_password,
-                        port=db_port
-                    )
-                    
-                    # Create a cursor
-                    cur = conn.cursor()
-                    
-                    # Execute SQL query to fetch results based on uniqueID
-                    cur.execute(
-                        "SELECT response_data FROM demo_datawarehouse.n8n_processing_results WHERE unique_id = %s AND status = 'COMPLETED' AND step = 'profiling'",
-                        (unique_id,)
-                    )
-                    
-                    # Fetch result
-                    result = cur.fetchone()
-                    
-                    if result:
-                        # If we have results, parse the JSON and store it
-                        st.session_state.step3_response = json.loads(result[0])
-                        st.session_state.step3_loading = False
-                        st.rerun()
-                    else:
-                        # Check if we need to continue polling or if there's an error
-                        cur.execute(
-                            "SELECT status FROM demo_datawarehouse.n8n_processing_results WHERE unique_id = %s AND step = 'profiling'",
-                            (unique_id,)
-                        )
-                        status_result = cur.fetchone()
-                        
-                        if status_result and status_result[0] == 'ERROR':
-                            st.error("Processing failed. Please try again.")
-                            if st.button("Retry"):
-                                # Reset and restart
-                                del st.session_state.step3_unique_id
-                                st.rerun()
-                            if st.button("Go back to Step 2"):
-                                st.session_state.current_step = 2
-                                st.session_state.step3_loading = False
-                                del st.session_state.step3_unique_id
-                                st.rerun()
-                        else:
-                            # Still processing, wait and then rerun to check again
-                            time.sleep(5)  # Wait 5 seconds before polling again
-                            st.rerun()
-                
-                finally:
-                    # Close cursor and connection
-                    if conn is not None:
-                        if cur is not None:
-                            cur.close()
-                        conn.close()
-            
             except Exception as e:
-                st.error(f"Database error: {str(e)}")
+                st.error(f"An error occurred: {str(e)}")
                 if st.button("Retry"):
                     st.rerun()
                 if st.button("Go back to Step 2"):
                     st.session_state.current_step = 2
                     st.session_state.step3_loading = False
-                    if "step3_unique_id" in st.session_state:
-                        del st.session_state.step3_unique_id
                     st.rerun()
         return
 
+    # Secondary loading state - waiting for the poller to deliver results from the database
+    if "step3_unique_id" in st.session_state and st.session_state.get("step3_loading", False):
+        display_result_wait(3, "profiling", 2, display_partial=display_profiling_tables)
+        return
+
     # If we get here, we are not in loading state
     
     # Check if we have the response data
@@ -547,50 +865,14 @@ def display_step3():
     # Process the response data
     response_data = st.session_state.get("step3_response", None)
 
-    if not response_data or not isinstance(response_data, dict) or "data" not in response_data:
+    if not isinstance(response_data, dict) or not ("data" in response_data or "result_id" in response_data):
         st.warning("No valid step3_response found.")
         return
 
-    # Extract the actual list of table items
-    table_items = response_data.get("data", [])
-    
-    # Create empty lists for table and column data
-    table_data = []
-    column_data = []
-
-    for item in table_items:
-        # Extract table name safely
-        table_name = item.get("table_name") or item.get("staging_table_name", "Unknown")
-
-        # Handle table data
-        table_data.append({
-            "table_name": table_name,
-            "classification": item.get("classification", "Unknown"),
-            "summary": item.get("summary", "No summary")
-        })
-
-        # Handle column data
-        for tag in item.get("column_tags", []):
-            column_data.append({
-                "table_name": table_name,
-                "column_name": tag.get("column_name", "Unknown"),
-                "tag": tag.get("tag", ""),
-                "description": tag.get("description", "No description")
-            })
-
-    # Display table data
-    st.markdown("### Table Tags")
-    if table_data:
-        st.dataframe(pd.DataFrame(table_data))
-    else:
-        st.info("No table data available")
-
-    # Display column data
-    st.markdown("### Column Tags")
-    if column_data:
-        st.dataframe(pd.DataFrame(column_data))
-    else:
-        st.info("No column data available")
+    display_profiling_tables(response_data, st.session_state.get("step3_response_hash"))
+    
+    if st.button("Refresh results", help="Ignore the cached response and run this step again"):
+        refresh_step(3)
     
     # Navigation buttons
     st.markdown("---")
@@ -610,43 +892,13 @@ def display_step4():
     
     # Check if we're still loading (first time on this page)
     if st.session_state.get("step4_loading", False):
-        with st.spinner("Processing..."):
-            webhook_url_step4 = "https://ajayshanks.app.n8n.cloud/webhook-test/8173dcf8-6fc4-4507-9def-9ad61422001d"
-            bearer_token_step4 = "datagpt@123"
-            
-            try:
-                headers = {
-                    "Authorization": f"Bearer {bearer_token_step4}",
-                    "Content-Type": "application/json"
-                }
-                
-                # Try to get actual response from webhook
-                response = requests.post(
-                    webhook_url_step4, 
-                    json=st.session_state.step4_payload, 
-                    headers=headers, timeout = 300
-                )
-                
-                if response.status_code == 200:
-                    if response.text.strip():
-                        try:
-                            st.session_state.step4_response = response.json()
-                        except json.JSONDecodeError:
-                            st.error(f"Invalid JSON response from webhook: {response.text}")
-                            st.session_state.step4_response = generate_sample_step4_data()
-                    else:
-                        st.error("Webhook returned an empty response")
-                        st.session_state.step4_response = generate_sample_step4_data()
-                else:
-                    st.error(f"Step 4 webhook failed: {response.status_code} - {response.text}")
-                    st.session_state.step4_response = generate_sample_step4_data()
-            except Exception as e:
-                st.error(f"Exception during Step 4 webhook call: {str(e)}")
-                st.session_state.step4_response = generate_sample_step4_data()
-                
-            # Mark loading as complete
-            st.session_state.step4_loading = False
-            st.rerun()
+        services = get_pipeline_services()
+        payload = st.session_state.step4_payload
+        display_job_status(
+            4, "step4_job_id", payload,
+            lambda runner: runner.submit("step4", pipeline.run_step4, services, payload),
+            generate_sample_step4_data
+        )
         return
 
     # Display the response data
@@ -654,6 +906,9 @@ def display_step4():
         st.warning("No response data available")
         return
     
+    if st.session_state.get("step4_error"):
+        st.error(f"{st.session_state.step4_error} Showing sample data instead.")
+    
     # Display Summary of Findings
     st.markdown("### Summary of Findings")
 
@@ -666,14 +921,20 @@ def display_step4():
     
     # Display Missing Attributes as a table
     st.markdown("### Missing Attributes")
-    missing_attributes = response_data.get("missing_attributes", [])
+    try:
+        missing_attributes = normalize.frame(response_data, "missing_attributes",
+                                             st.session_state.get("step4_response_hash"))
+    except normalize.SchemaError:
+        missing_attributes = None
     
-    if missing_attributes:
-        df = pd.DataFrame(missing_attributes)
-        st.dataframe(df)
+    if missing_attributes is not None and len(missing_attributes):
+        st.dataframe(missing_attributes)
     else:
         st.success("No missing attributes found!")
     
+    if st.button("Refresh results", help="Ignore the cached response and run this step again"):
+        refresh_step(4)
+    
     # Navigation buttons
     st.markdown("---")
     col1, col2 = st.columns(2)
@@ -692,44 +953,14 @@ def display_step5():
     
     # Check if we're still loading (first time on this page)
     if st.session_state.get("step5_loading", False):
-        with st.spinner("Processing..."):
-            webhook_url_step5 = "https://ajayshanks.app.n8n.cloud/webhook-test/12f6bf3b-f2dd-4ef3-bbe4-1746a1290e36"
-            bearer_token_step5 = "datagpt@123"
-            
-            try:
-                headers = {
-                    "Authorization": f"Bearer {bearer_token_step5}",
-                    "Content-Type": "application/json"
-                }
-                
-                # Try to get actual response from webhook
-                response = requests.post(
-                    webhook_url_step5, 
-                    json=st.session_state.step5_payload, 
-                    headers=headers, 
-                    timeout=300
-                )
-                
-                if response.status_code == 200:
-                    if response.text.strip():
-                        try:
-                            st.session_state.step5_response = response.json()
-                        except json.JSONDecodeError:
-                            st.error(f"Invalid JSON response from webhook: {response.text}")
-                            st.session_state.step5_response = generate_sample_step5_data()
-                    else:
-                        st.error("Webhook returned an empty response")
-                        st.session_state.step5_response = generate_sample_step5_data()
-                else:
-                    st.error(f"Step 5 webhook failed: {response.status_code} - {response.text}")
-                    st.session_state.step5_response = generate_sample_step5_data()
-            except Exception as e:
-                st.error(f"Exception during Step 5 webhook call: {str(e)}")
-                st.session_state.step5_response = generate_sample_step5_data()
-                
-            # Mark loading as complete
-            st.session_state.step5_loading = False
-            st.rerun()
+        services = get_pipeline_services()
+        payload = st.session_state.step5_payload
+        reused = st.session_state.get("step5_reused")
+        display_job_status(
+            5, "step5_job_id", payload,
+            lambda runner: runner.submit("step5", pipeline.run_step5, services, payload, reused=reused),
+            generate_sample_step5_data
+        )
         return
 
     # Display the response data
@@ -737,40 +968,27 @@ def display_step5():
         st.warning("No response data available")
         return
     
+    if st.session_state.get("step5_error"):
+        st.error(f"{st.session_state.step5_error} Showing sample data instead.")
+    
     # Parse and display data quality rules
     response_data = st.session_state.step5_response
     
-    # Handle the actual response format (array with parsed.data_quality_rules)
-    data_quality_rules = None
-    
-    # First check if response is a list (as in your paste.txt)
-    if isinstance(response_data, list) and len(response_data) > 0:
-        if "parsed" in response_data[0] and "data_quality_rules" in response_data[0]["parsed"]:
-            data_quality_rules = response_data[0]["parsed"]["data_quality_rules"]
-    # Then try the format you're handling in your existing code
-    elif "parsed" in response_data and "data_quality_rules" in response_data["parsed"]:
-        data_quality_rules = response_data["parsed"]["data_quality_rules"]
-    
     st.markdown("### Recommended Data Quality Rules")
     
-    if data_quality_rules:
-        # Create a DataFrame and ensure columns are in the specified order
-        df = pd.DataFrame(data_quality_rules)
-        
-        # Reorder columns as requested
-        column_order = ["table_name", "column_name", "rule_name", "configuration_information"]
-        df = df[column_order]
-        
-        # Sort by table_name then column_name
-        df = df.sort_values(by=["table_name", "column_name"])
-        
-        # Reset index
-        df = df.reset_index(drop=True)
-        
-        st.dataframe(df)
-    else:
+    try:
+        # Accepts both [{"parsed": {"data_quality_rules": [...]}}] and {"parsed": {...}}
+        normalize.frame(response_data, normalize.DATA_QUALITY_RULES.name, st.session_state.get("step5_response_hash"))
+    except normalize.SchemaError:
         st.error("Response does not contain expected data quality rules format.")
         st.json(response_data)  # Show raw response for debugging
+    else:
+        # The default order is by table_name then column_name
+        display_result_frame(response_data, normalize.DATA_QUALITY_RULES, "step5_rules",
+                             "No data quality rules were recommended.", st.session_state.get("step5_response_hash"))
+    
+    if st.button("Refresh results", help="Ignore the cached response and run this step again"):
+        refresh_step(5)
     
     # Navigation buttons
     st.markdown("---")
@@ -790,148 +1008,53 @@ def display_step6():
     
     # Initial loading state - calling webhook to get uniqueID
     if st.session_state.get("step6_loading", False) and "step6_unique_id" not in st.session_state:
+        # Repeat payloads are served from the cache; otherwise the pipeline scheduler
+        # usually started this step when the form was submitted
+        if load_cached_response(6):
+            st.rerun()
         with st.spinner("Getting unique ID from webhook..."):
-            webhook_url_step6 = "https://ajayshanks.app.n8n.cloud/webhook-test/c50d562c-05e5-4dc8-97bc-b9cd286e3d67"
-            bearer_token_step6 = "datagpt@123"
             payload = st.session_state.get("step6_payload", {})
 
             try:
-                headers = {
-                    "Authorization": f"Bearer {bearer_token_step6}",
-                    "Content-Type": "application/json"
-                }
-                response = requests.post(webhook_url_step6, json=payload, headers=headers, timeout=60)
-                
-                if response.status_code == 200 and response.text.strip():
-                    try:
-                        # Assuming webhook returns {"uniqueID": "some-unique-id"}
-                        unique_id_response = response.json()
-                        if "uniqueID" in unique_id_response:
-                            st.session_state.step6_unique_id = unique_id_response["uniqueID"]
-                            st.rerun()
-                        else:
-                            st.error("Webhook response doesn't contain uniqueID")
-                            if st.button("Retry"):
-                                st.rerun()
-                            if st.button("Go back to Step 5"):
-                                st.session_state.current_step = 5
-                                st.session_state.step6_loading = False
-                                st.rerun()
-                    except json.JSONDecodeError:
-                        st.error(f"Invalid JSON response from webhook: {response.text}")
-                        if st.button("Retry"):
-                            st.rerun()
-                        if st.button("Go back to Step 5"):
-                            st.session_state.current_step = 5
-                            st.session_state.step6_loading = False
-                            st.rerun()
-                else:
-                    st.error(f"Webhook returned an error status: {response.status_code} - {response.text}")
-                    if st.button("Retry"):
-                        st.rerun()
-                    if st.button("Go back to Step 5"):
-                        st.session_state.current_step = 5
-                        st.session_state.step6_loading = False
-                        st.rerun()
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
+                adopted = adopt_unique_id(6)
+                if adopted:
+                    st.rerun()
+                if adopted is None:
+                    # Still running; a fragment refreshes its status and queue position
+                    return
+                # Requested on the worker pool like steps 4 and 5, so the page never blocks
+                # on the webhook's admission queue. Identical payloads already in flight (e.g.
+                # other users in a demo) are joined instead of starting another n8n execution
+                services = get_pipeline_services()
+                st.session_state.step6_job_id = get_job_runner().submit("step6", pipeline.run_step6, services, payload)
+                st.rerun()
+            except jobs.JobQueueFull as e:
+                st.error(f"The server is busy, please retry shortly: {e}")
+                if st.button("Retry"):
+                    st.rerun()
+            except (pipeline.WebhookError, admission.Rejected) as e:
+                st.error(str(e))
                 if st.button("Retry"):
                     st.rerun()
                 if st.button("Go back to Step 5"):
                     st.session_state.current_step = 5
                     st.session_state.step6_loading = False
                     st.rerun()
-        return
-
-    # Secondary loading state - polling database for results
-    if "step6_unique_id" in st.session_state and st.session_state.get("step6_loading", False):
-        with st.spinner("Processing data... Fetching results from database"):
-            try:
-                # Define your PostgreSQL connection parameters
-                # These should be stored securely in a production environment
-                # Consider using st.secrets for secure storage
-                db_host = "aws-0-ap-south-1.pooler.supabase.com"
-                db_name = "postgres"
-                db_user = "postgres.pguxhjesyiffkujrrqyq"
-                db_password = "MfmoYcfS2n6CXkyw"
-                db_port = "6543"  # Default PostgreSQL port
-                
-                # Create a connection to the PostgreSQL database
-                conn = None
-                unique_id = st.session_state.step6_unique_id
-                
-                # Import necessary library
-                import psycopg2
-                
-                try:
-                    conn = psycopg2.connect(
-                        host=db_host,
-                        database=db_name,
-                        user=db_user,
-                        password=db_password,
-                        port=db_port
-                    )
-                    
-                    # Create a cursor
-                    cur = conn.cursor()
-                    
-                    # Execute SQL query to fetch results based on uniqueID
-                    cur.execute(
-                        "SELECT response_data FROM demo_datawarehouse.n8n_processing_results WHERE unique_id = %s AND status = 'COMPLETED' AND step = 'integration_mapping'",
-                        (unique_id,)
-                    )
-                    
-                    # Fetch result
-                    result = cur.fetchone()
-                    
-                    if result:
-                        # If we have results, parse the JSON and store it
-                        st.session_state.step6_response = json.loads(result[0])
-                        st.session_state.step6_loading = False
-                        st.rerun()
-                    else:
-                        # Check if we need to continue polling or if there's an error
-                        cur.execute(
-                            "SELECT status FROM demo_datawarehouse.n8n_processing_results WHERE unique_id = %s AND step = 'integration_mapping'",
-                            (unique_id,)
-                        )
-                        status_result = cur.fetchone()
-                        
-                        if status_result and status_result[0] == 'ERROR':
-                            st.error("Processing failed. Please try again.")
-                            if st.button("Retry"):
-                                # Reset and restart
-                                del st.session_state.step6_unique_id
-                                st.rerun()
-                            if st.button("Go back to Step 5"):
-                                st.session_state.current_step = 5
-                                st.session_state.step6_loading = False
-                                del st.session_state.step6_unique_id
-                                st.rerun()
-                        else:
-                            # Still processing, wait and then rerun to check again
-                            time.sleep(5)  # Wait 5 seconds before polling again
-                            st.rerun()
-                
-                finally:
-                    # Close cursor and connection
-                    if conn is not None:
-                        if cur is not None:
-                            cur.close()
-                        conn.close()
-            
             except Exception as e:
-                st.error(f"Database error: {str(e)}")
+                st.error(f"An error occurred: {str(e)}")
                 if st.button("Retry"):
                     st.rerun()
                 if st.button("Go back to Step 5"):
                     st.session_state.current_step = 5
                     st.session_state.step6_loading = False
-                    if "step6_unique_id" in st.session_state:
-                        del st.session_state.step6_unique_id
                     st.rerun()
         return
 
+    # Secondary loading state - waiting for the poller to deliver results from the database
+    if "step6_unique_id" in st.session_state and st.session_state.get("step6_loading", False):
+        display_result_wait(6, "integration_mapping", 5)
+        return
+
     # If we get here, we are not in loading state
     
     # Check if we have the response data
@@ -949,32 +1072,17 @@ def display_step6():
     # Process the response data
     response_data = st.session_state.get("step6_response", None)
 
-    if not response_data or not isinstance(response_data, dict) or "data" not in response_data:
+    if not isinstance(response_data, dict) or not ("data" in response_data or "result_id" in response_data):
         st.warning("No valid step6_response found.")
         return
     
     st.markdown("### Integration Table Mappings")
     
-    if response_data:
-        # Create a DataFrame with the required columns
-        mapping_data = []
-        for item in response_data["data"]:
-            mapping_data.append({
-                "Integration Table Name": item.get("integration_table_name", ""),
-                "Primary Source Staging Table": item.get("primary_source_staging_table", ""),
-                "Secondary Source Staging Table": item.get("secondary_source_staging_table", ""),
-                "Justification": item.get("justification", ""),
-                "SQL Query": item.get("sql_query", "")
-            })
-        
-        if mapping_data:
-            df = pd.DataFrame(mapping_data)
-            st.dataframe(df)
-        else:
-            st.info("No mapping data was provided.")
-    else:
-        st.error("Response does not contain expected mapping data format.")
-        st.json(response_data)  # Show raw response for debugging
+    display_result_frame(response_data, results.INTEGRATION_MAPPINGS, "step6_mappings", "No mapping data was provided.",
+                         st.session_state.get("step6_response_hash"))
+    
+    if st.button("Refresh results", help="Ignore the cached response and run this step again"):
+        refresh_step(6)
     
     # Navigation button to go back
     st.markdown("---")
@@ -982,7 +1090,65 @@ def display_step6():
         st.session_state.current_step = 5
         st.rerun()
 
+def display_profiler_summary(step):
+    """Hottest functions of this step's recent profiled reruns, in the sidebar"""
+    summary = profiler.HOTSPOTS.summary().get(step)
+    with st.sidebar.expander("Profiler", expanded=False):
+        if not summary:
+            st.caption(f"Profiles are written to {profiler.PROFILE_DIR}/{step}/ after each rerun.")
+            return
+        st.caption(f"{summary['reruns']} reruns, {summary['samples']} samples; "
+                   f"flamegraphs in {profiler.PROFILE_DIR}/{step}/")
+        st.dataframe(pd.DataFrame(summary["functions"]), hide_index=True,
+                     column_config={"self": st.column_config.NumberColumn(format="%.1%%"),
+                                    "total": st.column_config.NumberColumn(format="%.1%%")})
+
+def restore_run():
+    """Rehydrate the session from the run named in the URL, once per session"""
+    run_id = st.query_params.get("run")
+    # A live session is ahead of the URL, e.g. right after a resubmit started a new run
+    if not run_id or "run_id" in st.session_state:
+        return
+    try:
+        saved = get_run_store().load(run_id)
+    except Exception as e:
+        st.warning(f"Could not load run {run_id}: {e}")
+        return
+    if saved is None:
+        st.warning(f"Run {run_id} was not found or has expired; starting over.")
+        del st.query_params["run"]
+        return
+    for key, value in saved.items():
+        if value is not None:
+            st.session_state[key] = value
+    st.session_state.run_id = run_id
+    st.session_state.run_saved = runs.digests(saved)
+
+def checkpoint_run():
+    """Save whatever run state changed during this rerun and keep the run id in the URL"""
+    run_id = st.session_state.get("pipeline_run_id")
+    if run_id is None:
+        return
+    if st.session_state.get("run_id") != run_id:
+        # A new step 1 submission starts a new run
+        st.session_state.run_id = run_id
+        st.session_state.run_saved = {}
+    if st.query_params.get("run") != run_id:
+        st.query_params["run"] = run_id
+    changed, saved = runs.changes(st.session_state.run_saved, st.session_state)
+    if not changed:
+        return
+    try:
+        get_run_store().save(run_id, changed)
+    except Exception as e:
+        # The session carries on; the next rerun tries again with everything still unsaved
+        logger.warning("Could not checkpoint run %s: %s", run_id, e)
+        return
+    st.session_state.run_saved = saved
+
 def main():
+    restore_run()
+    
     # Initialize session state for navigation
     if 'current_step' not in st.session_state:
         st.session_state.current_step = 1
@@ -995,23 +1161,36 @@ def main():
         # Initialize as None instead of using sample data
         st.session_state.webhook_response = None
     
+    start_metrics_endpoint()
+    
     # Function to handle step transition
     def go_to_step_2():
         st.session_state.current_step = 2
     
     # Display the appropriate step
-    if st.session_state.current_step == 1:
-        display_step1(go_to_step_2)
-    elif st.session_state.current_step == 2:
-        display_step2()
-    elif st.session_state.current_step == 3:
-        display_step3()
-    elif st.session_state.current_step == 4:
-        display_step4()
-    elif st.session_state.current_step == 5:
-        display_step5()
-    elif st.session_state.current_step == 6:
-        display_step6()
+    step = f"step{st.session_state.current_step}"
+    metrics.increment("datagpt_reruns_total", step=step, scope="app")
+    # DATAGPT_PROFILE=1 profiles every session; ?profile=1 just this one
+    profiling = profiler.ENABLED or st.query_params.get("profile") == "1"
+    if profiling:
+        display_profiler_summary(step)
+    try:
+        with metrics.span("render", step=step), profiler.profile(step, enabled=profiling):
+            if st.session_state.current_step == 1:
+                display_step1(go_to_step_2)
+            elif st.session_state.current_step == 2:
+                display_step2()
+            elif st.session_state.current_step == 3:
+                display_step3()
+            elif st.session_state.current_step == 4:
+                display_step4()
+            elif st.session_state.current_step == 5:
+                display_step5()
+            elif st.session_state.current_step == 6:
+                display_step6()
+    finally:
+        # Also runs when a step calls st.rerun(), which is when most state changes land
+        checkpoint_run()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,282 @@
+"""Record and replay of the app's traffic with n8n: webhook exchanges and results-table rows
+
+With DATAGPT_TRANSPORT=record every webhook response and every result row a
+job writes is captured, with its timing, under DATAGPT_FIXTURES_DIR. With
+DATAGPT_TRANSPORT=replay the app talks to neither n8n nor PostgreSQL: webhook
+calls are answered from the fixtures and each job's rows reappear in an
+in-memory results table (benchmarks.fakes.ResultsStandIn) at their recorded
+offsets divided by DATAGPT_REPLAY_SPEED (0 replays without delays). In both
+modes a run store or state backend configured as postgres uses its SQLite
+stand-in instead: replay has no PostgreSQL to hold it, and a recording
+session's checkpoints do not belong in the real tables.
+
+    fixtures/webhooks/<step>/<payload hash>.json   one response per distinct request payload
+    fixtures/results/<unique id>.json              the rows a job wrote, with offsets in seconds
+"""
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from http import HTTPStatus
+
+import psycopg2
+import psycopg2.extensions
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+import codec
+import poller
+import webhooks
+from cache import payload_hash
+from db import RESULTS_TABLE
+
+MODES = ("live", "record", "replay")
+MODE = os.environ.get("DATAGPT_TRANSPORT", "live")
+FIXTURES_DIR = os.environ.get("DATAGPT_FIXTURES_DIR", "fixtures")
+# Replay at this multiple of the recorded speed; 0 serves everything without delay
+REPLAY_SPEED = float(os.environ.get("DATAGPT_REPLAY_SPEED", "1"))
+
+
+def _write_json(path, document):
+    # Readers never see a half-written fixture
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _text(value):
+    return bytes(value).decode("utf-8") if isinstance(value, (bytes, memoryview)) else value
+
+
+class Fixtures:
+    """Recorded webhook exchanges and job timelines in a directory"""
+
+    def __init__(self, directory=FIXTURES_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # unique_id -> monotonic time its webhook answered, the zero point of its timeline
+        self._started = {}
+        # unique_id -> rows recorded so far
+        self._rows = {}
+        self._seen = set()
+
+    def _exchange_path(self, step, payload):
+        return os.path.join(self.directory, "webhooks", step, f"{payload_hash(payload)}.json")
+
+    def _rows_path(self, unique_id):
+        return os.path.join(self.directory, "results", f"{unique_id}.json")
+
+    def save_exchange(self, step, payload, status, content, elapsed):
+        """Record one webhook response; a later call with the same payload replaces it"""
+        _write_json(self._exchange_path(step, payload), {
+            "step": step,
+            "payload": payload,
+            "status": status,
+            "body": content.decode("utf-8", errors="replace"),
+            "elapsed": elapsed,
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+        })
+
+    def load_exchange(self, step, payload):
+        """The recorded response for this step and payload, or None"""
+        return _read_json(self._exchange_path(step, payload))
+
+    def job_started(self, unique_id):
+        with self._lock:
+            self._started[str(unique_id)] = time.monotonic()
+
+    def claim_row(self, unique_id, step, status, response_data=None):
+        """True the first time a row is seen; PARTIAL rows are told apart by their payload"""
+        key = (str(unique_id), step, status, response_data if status == poller.PARTIAL else None)
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            return True
+
+    def save_row(self, unique_id, step, status, response_data):
+        """Append a result row to the job's timeline"""
+        unique_id = str(unique_id)
+        now = time.monotonic()
+        with self._lock:
+            started = self._started.setdefault(unique_id, now)
+            rows = self._rows.setdefault(unique_id, [])
+            rows.append({"at": round(now - started, 3), "step": step, "status": status,
+                         "response_data": response_data})
+            _write_json(self._rows_path(unique_id), {"unique_id": unique_id, "rows": rows})
+
+    def load_rows(self, unique_id):
+        """[(offset seconds, step, status, response_data)] recorded for a job"""
+        document = _read_json(self._rows_path(unique_id)) or {"rows": []}
+        return [(row["at"], row["step"], row["status"], row["response_data"]) for row in document["rows"]]
+
+
+def _request_payload(request):
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if request.headers.get("Content-Encoding") == "gzip":
+        body = gzip.decompress(body)
+    return codec.loads(body) if body else None
+
+
+def _unique_id(content):
+    try:
+        body = codec.loads(content)
+    except codec.JSONDecodeError:
+        return None
+    return body.get("uniqueID") if isinstance(body, dict) else None
+
+
+class RecordingAdapter(HTTPAdapter):
+    """HTTPAdapter that saves every webhook response it receives to the fixtures"""
+
+    def __init__(self, fixtures, endpoints=None, **kwargs):
+        super().__init__(**kwargs)
+        self.fixtures = fixtures
+        self._steps = {endpoint.webhook_id: step for step, endpoint in (endpoints or webhooks.ENDPOINTS).items()}
+
+    def send(self, request, **kwargs):
+        started = time.monotonic()
+        response = super().send(request, **kwargs)
+        step = self._steps.get(request.url.rsplit("/", 1)[-1])
+        if step is not None:
+            # Reading the body here is fine: webhook responses are never streamed
+            content = response.content
+            unique_id = _unique_id(content) if response.status_code == 200 else None
+            if unique_id is not None:
+                self.fixtures.job_started(unique_id)
+            self.fixtures.save_exchange(step, _request_payload(request), response.status_code, content,
+                                        time.monotonic() - started)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter answering webhook calls from the fixtures instead of the network.
+
+    Requests with no recorded response get a 404. When a response carries a
+    uniqueID the job's recorded rows are played into ``results_db``.
+    """
+
+    def __init__(self, fixtures, results_db=None, speed=REPLAY_SPEED, endpoints=None):
+        super().__init__()
+        self.fixtures = fixtures
+        self.results_db = results_db
+        self.speed = speed
+        self._steps = {endpoint.webhook_id: step for step, endpoint in (endpoints or webhooks.ENDPOINTS).items()}
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        step = self._steps.get(request.url.rsplit("/", 1)[-1])
+        exchange = self.fixtures.load_exchange(step, _request_payload(request)) if step else None
+        if exchange is None:
+            return self._response(request, 404, codec.dumps({"message": f"No recorded response for {step} with this payload"}))
+        if self.speed:
+            time.sleep(exchange["elapsed"] / self.speed)
+        content = exchange["body"].encode("utf-8")
+        unique_id = _unique_id(content) if exchange["status"] == 200 else None
+        if unique_id is not None and self.results_db is not None:
+            self.results_db.play(unique_id, self.fixtures.load_rows(unique_id), self.speed)
+        return self._response(request, exchange["status"], content)
+
+    def close(self):
+        pass
+
+    def _response(self, request, status, content):
+        response = requests.Response()
+        response.status_code = status
+        response._content = content
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+        response.encoding = "utf-8"
+        response.reason = HTTPStatus(status).phrase if status in HTTPStatus._value2member_map_ else ""
+        response.url = request.url
+        response.request = request
+        return response
+
+
+class RecordingCursor(psycopg2.extensions.cursor):
+    """Cursor that saves each new result row the poller's batched query returns.
+
+    Completed step 3 / step 6 rows come back without their payload (see
+    poller.BATCH_QUERY), so it is read separately the first time such a row is seen.
+    """
+
+    fixtures = None
+
+    def execute(self, query, vars=None):
+        self._batch = query == poller.BATCH_QUERY
+        return super().execute(query, vars)
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if getattr(self, "_batch", False):
+            self._save(rows)
+        return rows
+
+    def _save(self, rows):
+        for unique_id, step, status, response_data, _ in rows:
+            response_data = _text(response_data)
+            if not self.fixtures.claim_row(unique_id, step, status, response_data):
+                continue
+            if status == "COMPLETED" and response_data is None:
+                with self.connection.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+                    cur.execute(
+                        f"SELECT response_data::text FROM {RESULTS_TABLE} "
+                        "WHERE unique_id = %s AND step = %s AND status = 'COMPLETED' LIMIT 1",
+                        (unique_id, step),
+                    )
+                    row = cur.fetchone()
+                response_data = _text(row[0]) if row else None
+            self.fixtures.save_row(unique_id, step, status, response_data)
+
+
+class Transport:
+    """Webhook adapter and database connect function for one of MODES"""
+
+    def __init__(self, mode=MODE, fixtures_dir=FIXTURES_DIR, speed=REPLAY_SPEED):
+        if mode not in MODES:
+            raise ValueError(f"Unknown transport mode {mode!r}; expected one of {', '.join(MODES)}")
+        self.mode = mode
+        self.speed = speed
+        self.fixtures = Fixtures(fixtures_dir) if mode != "live" else None
+        self.results_db = None
+        if mode == "replay":
+            # The stand-in is a development tool, so it stays out of the live import path
+            from benchmarks.fakes import ResultsStandIn
+
+            self.results_db = ResultsStandIn(query_latency=0)
+
+    def store_backend(self, configured):
+        """Backend for the run store or state backend configured as ``configured`` (see the module docstring)"""
+        if self.mode != "live" and configured == "postgres":
+            return "sqlite"
+        return configured
+
+    def webhook_adapter(self, pool_maxsize=32):
+        """Adapter for webhooks.WebhookClient, or None for its default live one"""
+        if self.mode == "record":
+            return RecordingAdapter(self.fixtures, pool_connections=4, pool_maxsize=pool_maxsize)
+        if self.mode == "replay":
+            return ReplayAdapter(self.fixtures, self.results_db, self.speed)
+        return None
+
+    def connect(self):
+        """``connect`` for db.ConnectionPool and notifier.CompletionNotifier, or None for psycopg2.connect"""
+        if self.mode == "record":
+            cursor_factory = type("FixtureRecordingCursor", (RecordingCursor,), {"fixtures": self.fixtures})
+            return lambda **kwargs: psycopg2.connect(cursor_factory=cursor_factory, **kwargs)
+        if self.mode == "replay":
+            return self.results_db.connect
+        return None
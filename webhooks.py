@@ -0,0 +1,238 @@
+"""Shared HTTP client for the n8n webhooks behind each pipeline step"""
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import codec
+import metrics
+from admission import EndpointLimiter, Rejected
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+WEBHOOK_BASE_URL = os.environ.get("DATAGPT_WEBHOOK_BASE_URL", "https://ajayshanks.app.n8n.cloud/webhook-test")
+BEARER_TOKEN = os.environ.get("DATAGPT_WEBHOOK_TOKEN", "datagpt@123")  # Replace with actual token
+
+
+class Endpoint:
+    """Webhook address and call policy for one pipeline step.
+
+    ``max_concurrent``, ``rate`` (requests per second), ``burst``,
+    ``max_queue`` and ``max_wait`` configure the endpoint's admission control;
+    ``failure_threshold`` and ``reset_timeout`` configure its circuit breaker.
+    """
+
+    def __init__(self, name, webhook_id, timeout, max_retries=2, max_concurrent=4,
+                 rate=None, burst=1, max_queue=50, max_wait=60,
+                 failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.webhook_id = webhook_id
+        # Seconds to wait for the response; connecting is capped separately
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    @property
+    def url(self):
+        return f"{WEBHOOK_BASE_URL}/{self.webhook_id}"
+
+
+# The step 1 form submits to the step 2 (crawling and ingestion) webhook
+# Steps 3 and 6 only hand back a uniqueID quickly, so they get a higher request
+# rate; steps 4 and 5 hold an LLM execution for the whole call
+ENDPOINTS = {
+    "step2": Endpoint("step2", "0cfd6c96-9c7c-46aa-8a58-30b11b499172", timeout=120,
+                      max_concurrent=8, rate=2, burst=5),
+    "step3": Endpoint("step3", "2a51622b-8576-44e0-911d-c428c6533bc8", timeout=180,
+                      max_concurrent=8, rate=2, burst=5),
+    "step4": Endpoint("step4", "8173dcf8-6fc4-4507-9def-9ad61422001d", timeout=300,
+                      max_concurrent=4, rate=0.5, burst=4, max_queue=20, max_wait=600,
+                      failure_threshold=3, reset_timeout=60),
+    "step5": Endpoint("step5", "12f6bf3b-f2dd-4ef3-bbe4-1746a1290e36", timeout=300,
+                      max_concurrent=4, rate=0.5, burst=4, max_queue=20, max_wait=600,
+                      failure_threshold=3, reset_timeout=60),
+    "step6": Endpoint("step6", "c50d562c-05e5-4dc8-97bc-b9cd286e3d67", timeout=60,
+                      max_concurrent=8, rate=2, burst=5),
+}
+
+# datagpt_webhook_circuit_state value of each breaker state
+CIRCUIT_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Gateway-style failures that are worth retrying; other statuses are returned as-is
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class WebhookClient:
+    """Keep-alive ``requests.Session`` shared by every step and session.
+
+    Every call first checks the endpoint's circuit breaker, failing within
+    milliseconds with breaker.CircuitOpen while the workflow is down, and then
+    passes its admission control (see admission.EndpointLimiter), which may
+    raise admission.Rejected. Connection and
+    5xx failures are retried with exponential backoff and full jitter while
+    holding the same slot. Read timeouts are not retried, since the workflow
+    may still be running on the n8n side. Per-endpoint latency, retries and
+    errors are recorded and available through ``stats()``. Bodies are
+    encoded with codec and gzipped once they reach ``gzip_min_bytes``
+    (None disables compression); responses are requested gzip-encoded.
+    ``adapter`` replaces the pooled HTTPAdapter, e.g. with one of
+    transport's record / replay adapters.
+    """
+
+    def __init__(self, endpoints=None, bearer_token=BEARER_TOKEN, pool_maxsize=32,
+                 connect_timeout=10, backoff_base=0.5, backoff_cap=8, session=None,
+                 gzip_min_bytes=codec.GZIP_MIN_BYTES, adapter=None):
+        self.endpoints = dict(endpoints or ENDPOINTS)
+        self.connect_timeout = connect_timeout
+        self.gzip_min_bytes = gzip_min_bytes
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self.session = session or requests.Session()
+        adapter = adapter or HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {bearer_token}",
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        })
+
+        self.limiters = {
+            step: EndpointLimiter(
+                step, max_concurrent=endpoint.max_concurrent, rate=endpoint.rate, burst=endpoint.burst,
+                max_queue=endpoint.max_queue, max_wait=endpoint.max_wait,
+            )
+            for step, endpoint in self.endpoints.items()
+        }
+        self.breakers = {
+            step: CircuitBreaker(
+                step, failure_threshold=endpoint.failure_threshold, reset_timeout=endpoint.reset_timeout,
+            )
+            for step, endpoint in self.endpoints.items()
+        }
+
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def post(self, step, payload, timeout=None):
+        """POST ``payload`` as JSON to the step's webhook and return the Response.
+
+        Raises the last requests exception if every attempt failed to connect.
+        """
+        endpoint = self.endpoints[step]
+        timeout = (self.connect_timeout, timeout or endpoint.timeout)
+        # Encode once; retries resend the same bytes
+        if self.gzip_min_bytes is None:
+            body, headers = codec.dumps(payload), {}
+        else:
+            body, headers = codec.encode_body(payload, self.gzip_min_bytes)
+        breaker = self.breakers[step]
+        breaker.before_call()
+        settled = False
+        try:
+            with self.limiters[step].slot(), metrics.span("webhook_send", step=step):
+                response = self._post(step, endpoint, body, headers, timeout)
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            settled = True
+        except Rejected:
+            raise
+        except Exception:
+            # Includes read timeouts: a workflow that never answers is as good as down
+            breaker.record_failure()
+            settled = True
+            raise
+        finally:
+            if not settled:
+                # Turned away by admission, or interrupted (KeyboardInterrupt, SystemExit):
+                # say nothing about the endpoint, but free a half-open probe slot
+                breaker.abandon()
+        return response
+
+    def _post(self, step, endpoint, body, headers, timeout):
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = self.session.post(endpoint.url, data=body, headers=headers, timeout=timeout)
+            except requests.ConnectionError:
+                # Includes connect timeouts and keep-alive connections dropped by the server
+                self._record(step, time.monotonic() - started, error=True)
+                if attempt >= endpoint.max_retries:
+                    raise
+            except requests.RequestException:
+                self._record(step, time.monotonic() - started, error=True)
+                raise
+            else:
+                elapsed = time.monotonic() - started
+                if response.status_code not in RETRY_STATUSES or attempt >= endpoint.max_retries:
+                    self._record(step, elapsed, error=response.status_code >= 400)
+                    return response
+                self._record(step, elapsed, error=True)
+                response.close()
+
+            attempt += 1
+            self._record_retry(step)
+            time.sleep(self._backoff(attempt))
+
+    def stats(self):
+        """Per-endpoint call counts, retries, errors, latency, admission queue and circuit state"""
+        with self._lock:
+            snapshot = {step: dict(values) for step, values in self._stats.items()}
+        for step, limiter in self.limiters.items():
+            snapshot.setdefault(step, {})["admission"] = limiter.stats()
+        for step, breaker in self.breakers.items():
+            snapshot[step]["circuit"] = breaker.stats()
+        return snapshot
+
+    def samples(self):
+        """Circuit state, short circuits and admission queue per endpoint, for metrics.register_collector"""
+        found = []
+        for step, limiter in self.limiters.items():
+            admission = limiter.stats()
+            circuit = self.breakers[step].stats()
+            found += [
+                ("datagpt_webhook_circuit_state", CIRCUIT_STATES[circuit["state"]], {"step": step}),
+                ("datagpt_webhook_short_circuits_total", circuit["short_circuited"], {"step": step}),
+                ("datagpt_webhook_queue_depth", admission["queued"], {"step": step}),
+                ("datagpt_webhook_in_flight", admission["in_flight"], {"step": step}),
+                ("datagpt_webhook_rejected_total", admission["rejected"], {"step": step}),
+            ]
+        return found
+
+    def close(self):
+        self.session.close()
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retries from many sessions from arriving in lockstep
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _entry(self, step):
+        return self._stats.setdefault(step, {
+            "calls": 0, "errors": 0, "retries": 0,
+            "latency_seconds_total": 0.0, "latency_seconds_max": 0.0,
+        })
+
+    def _record(self, step, elapsed, error=False):
+        with self._lock:
+            entry = self._entry(step)
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["latency_seconds_total"] += elapsed
+            entry["latency_seconds_max"] = max(entry["latency_seconds_max"], elapsed)
+
+    def _record_retry(self, step):
+        with self._lock:
+            self._entry(step)["retries"] += 1
+        metrics.increment("datagpt_webhook_retries_total", step=step)